@@ -0,0 +1,83 @@
+"""Compare the AsyncThingy backends under a high concurrency
+
+python benchmarks/async_clients.py --uri mongodb://localhost --concurrency 500
+"""
+
+import argparse
+import asyncio
+import time
+
+from mongo_thingy import AsyncThingy
+
+try:
+    from pymongo import AsyncMongoClient
+except ImportError:
+    AsyncMongoClient = None
+
+try:
+    from motor.motor_asyncio import AsyncIOMotorClient
+except ImportError:
+    AsyncIOMotorClient = None
+
+
+class Benchmark(AsyncThingy):
+    _database_name = "mongo_thingy_benchmarks"
+
+
+async def worker(operations, latencies):
+    for _ in range(operations):
+        start = time.perf_counter()
+        await Benchmark.find_one({"index": 42})
+        latencies.append(time.perf_counter() - start)
+
+
+async def run(client_cls, uri, concurrency, operations):
+    Benchmark.connect(uri, client_cls=client_cls)
+    await Benchmark.collection.delete_many({})
+    await Benchmark.collection.insert_many([{"index": i} for i in range(100)])
+    await Benchmark.find_one()
+
+    latencies = []
+    start = time.perf_counter()
+    workers = [worker(operations, latencies) for _ in range(concurrency)]
+    await asyncio.gather(*workers)
+    duration = time.perf_counter() - start
+
+    await Benchmark.collection.drop()
+    closing = Benchmark.disconnect()
+    if closing is not None:
+        await closing
+
+    latencies.sort()
+    return {
+        "throughput": len(latencies) / duration,
+        "p50": latencies[len(latencies) * 50 // 100] * 1000,
+        "p99": latencies[len(latencies) * 99 // 100] * 1000,
+        "max": latencies[-1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--uri", default="mongodb://localhost")
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--operations", type=int, default=20)
+    args = parser.parse_args()
+
+    clients = {"pymongo": AsyncMongoClient, "motor_asyncio": AsyncIOMotorClient}
+    print(f"{'backend':<16}{'ops/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, client_cls in clients.items():
+        if client_cls is None:
+            print(f"{name:<16}{'not installed':>40}")
+            continue
+        result = asyncio.run(
+            run(client_cls, args.uri, args.concurrency, args.operations)
+        )
+        print(
+            f"{name:<16}{result['throughput']:>10.0f}{result['p50']:>10.2f}"
+            f"{result['p99']:>10.2f}{result['max']:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Compare the attribute access overhead of CamelCase and plain thingies
+
+python benchmarks/camelcase.py --accesses 100000
+"""
+
+import argparse
+import time
+
+from mongo_thingy import Thingy
+from mongo_thingy.camelcase import CamelCase
+
+
+class Plain(Thingy):
+    pass
+
+
+class Camel(CamelCase, Thingy):
+    pass
+
+
+def run(thingy_cls, accesses):
+    thingy = thingy_cls(first_name="Ada", last_name="Lovelace", age=36)
+    durations = {}
+
+    start = time.perf_counter()
+    for _ in range(accesses):
+        thingy.first_name
+        thingy.age
+    durations["get"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(accesses):
+        thingy.view
+        thingy.__dict__
+    durations["method"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(accesses):
+        thingy.last_name = i
+    durations["set"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(accesses // 10):
+        thingy.view()
+    durations["view"] = (time.perf_counter() - start) * 10
+
+    return {name: d / accesses * 1e9 for name, d in durations.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--accesses", type=int, default=100000)
+    args = parser.parse_args()
+
+    names = ["get", "method", "set", "view"]
+    print(f"{'class':<8}" + "".join(f"{name + ' ns':>12}" for name in names))
+    for thingy_cls in (Plain, Camel):
+        result = run(thingy_cls, args.accesses)
+        print(
+            f"{thingy_cls.__name__:<8}"
+            + "".join(f"{result[name]:>12.0f}" for name in names)
+        )
+
+
+if __name__ == "__main__":
+    main()
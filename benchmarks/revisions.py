@@ -0,0 +1,81 @@
+"""Compare the storage size and read cost of full and delta revisions
+
+python benchmarks/revisions.py --uri mongodb://localhost --saves 200
+"""
+
+import argparse
+import time
+
+import bson
+
+from mongo_thingy import Thingy
+from mongo_thingy.versioned import Revision, Versioned
+
+
+class BenchmarkRevision(Revision):
+    _database_name = "mongo_thingy_benchmarks"
+
+
+class Benchmark(Versioned, Thingy):
+    _database_name = "mongo_thingy_benchmarks"
+    _revision_cls = BenchmarkRevision
+
+
+def run(uri, delta, snapshot_interval, saves, fields):
+    Benchmark.connect(uri)
+    Benchmark._delta_revisions = delta
+    Benchmark._snapshot_interval = snapshot_interval
+    Benchmark.collection.drop()
+    BenchmarkRevision.collection.drop()
+
+    thingy = Benchmark({f"field_{i}": "x" * 100 for i in range(fields)})
+    thingy.save()
+    start = time.perf_counter()
+    for i in range(saves):
+        setattr(thingy, f"field_{i % fields}", f"{i}" * 100)
+        thingy.save()
+    write_duration = time.perf_counter() - start
+
+    documents = BenchmarkRevision.collection.find()
+    size = sum(len(bson.encode(document)) for document in documents)
+
+    start = time.perf_counter()
+    list(thingy.get_revisions())
+    scan_duration = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(0, saves, max(saves // 20, 1)):
+        thingy.get_revisions()[i]
+    seek_duration = (time.perf_counter() - start) / min(saves, 20)
+
+    Benchmark.collection.drop()
+    BenchmarkRevision.collection.drop()
+    Benchmark.disconnect()
+    return {
+        "size": size / 1024,
+        "write": write_duration / saves * 1000,
+        "scan": scan_duration * 1000,
+        "seek": seek_duration * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--uri", default="mongodb://localhost")
+    parser.add_argument("--saves", type=int, default=200)
+    parser.add_argument("--fields", type=int, default=50)
+    parser.add_argument("--snapshot-interval", type=int, default=10)
+    args = parser.parse_args()
+
+    modes = {"full": False, "delta": True}
+    print(f"{'mode':<8}{'size KiB':>10}{'save ms':>10}{'scan ms':>10}{'seek ms':>10}")
+    for name, delta in modes.items():
+        result = run(args.uri, delta, args.snapshot_interval, args.saves, args.fields)
+        print(
+            f"{name:<8}{result['size']:>10.0f}{result['write']:>10.2f}"
+            f"{result['scan']:>10.2f}{result['seek']:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,73 @@
 import asyncio
+import inspect
 import warnings
 from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from functools import lru_cache
+from importlib.util import find_spec
 
 from pymongo import MongoClient, ReturnDocument
-from pymongo.errors import ConfigurationError
 from thingy import DatabaseThingy, classproperty, registry
 
+from mongo_thingy import counts, routing
+from mongo_thingy.budget import query_budget
+from mongo_thingy.connection import Connection, gather
 from mongo_thingy.cursor import AsyncCursor, Cursor
-
-try:
-    from motor.motor_tornado import MotorClient
-except ImportError:  # pragma: no cover
-    MotorClient = None
-
-try:
-    from motor.motor_asyncio import AsyncIOMotorClient
-except ImportError:  # pragma: no cover
-    AsyncIOMotorClient = None
+from mongo_thingy.indexes import (
+    async_list_indexes,
+    get_cache_key,
+    get_missing_indexes,
+    get_spec_hash,
+    list_indexes,
+)
+from mongo_thingy.monitoring import instrument
+from mongo_thingy.routing import (
+    get_client,
+    get_handles,
+    get_read_preference,
+    get_route,
+    read_your_writes,
+    tenant,
+    with_read_preference,
+)
+
+
+@lru_cache(maxsize=None)
+def get_motor_client_cls():
+    """Return the client class of Motor, importing it on first use"""
+    try:
+        from motor.motor_tornado import MotorClient
+    except ImportError:  # pragma: no cover
+        MotorClient = None
+
+    try:
+        from motor.motor_asyncio import AsyncIOMotorClient
+    except ImportError:  # pragma: no cover
+        AsyncIOMotorClient = None
+
+    return MotorClient or AsyncIOMotorClient
+
+
+@lru_cache(maxsize=None)
+def get_async_client_cls():
+    """Return the native async client of PyMongo if available, or Motor's"""
+    try:
+        from pymongo import AsyncMongoClient
+    except ImportError:
+        AsyncMongoClient = None
+
+    return AsyncMongoClient or get_motor_client_cls()
+
+
+def has_motor():
+    """Tell whether Motor is installed, without importing it"""
+    return find_spec("motor") is not None
+
+
+def has_async_client():
+    """Tell whether an async client is installed, without importing it"""
+    return find_spec("pymongo.asynchronous") is not None or has_motor()
 
 
 class ThingyList(list):
@@ -57,8 +108,11 @@ class BaseThingy(DatabaseThingy):
     _client_cls = None
     _collection = None
     _collection_name = None
+    _connection = None
     _cursor_cls = None
+    _read_preference = None
     _result_cls = ThingyList
+    _tenanted = True
 
     @classproperty
     def _table(cls):
@@ -108,16 +162,65 @@ class BaseThingy(DatabaseThingy):
     def _get_table_name(cls, table):
         return table.name
 
+    @classmethod
+    def _open_connection(cls):
+        connection = cls._connection
+        if connection is not None and not connection.is_open:
+            connection.open()
+
     @classmethod
     def get_client(cls):
+        cls._open_connection()
         if cls._client:
             return cls._client
         return cls._get_client(cls.database)
 
+    @classmethod
+    def _get_tenant_database(cls, database_name, uri=None):
+        cls._open_connection()
+        if uri is not None:
+            client = get_client(cls._client_cls, uri)
+        else:
+            client = cls._client or cls._get_client(super().get_database())
+        return client[database_name]
+
+    @classmethod
+    def get_database(cls):
+        cls._open_connection()
+        route = get_route(cls)
+        if route is not None:
+            return get_handles(cls, route)[0]
+        return super().get_database()
+
     @classmethod
     def get_collection(cls):
+        route = get_route(cls)
+        if route is not None:
+            return get_handles(cls, route)[1]
         return cls.get_table()
 
+    @classmethod
+    def get_read_collection(cls, read_preference=None):
+        """Return the collection to read from, with the read preference of reads
+
+        ``read_preference`` defaults to the ``_read_preference`` of the class.
+        Writes and ``find_one_and_*`` always use :attr:`collection`.
+        """
+        collection = cls.collection
+        read_preference = get_read_preference(cls, read_preference)
+        if read_preference is None:
+            return collection
+        return with_read_preference(collection, read_preference)
+
+    @classmethod
+    def _from_document(cls, document):
+        """Return the thingy of a document read from the database"""
+        return cls(document)
+
+    def _to_document(self):
+        """Return the document written to the database"""
+        return self.__dict__
+
     @classmethod
     def add_index(cls, keys, **kwargs):
         kwargs.setdefault("background", True)
@@ -126,10 +229,12 @@ class BaseThingy(DatabaseThingy):
         cls._indexes.append((keys, kwargs))
 
     @classmethod
-    def count_documents(cls, filter=None, *args, **kwargs):
+    @instrument
+    def count_documents(cls, filter=None, *args, read_preference=None, **kwargs):
         if filter is None:
             filter = {}
-        return cls.collection.count_documents(filter, *args, **kwargs)
+        collection = cls.get_read_collection(read_preference)
+        return collection.count_documents(filter, *args, **kwargs)
 
     @classmethod
     def count(cls, filter=None, *args, **kwargs):
@@ -139,33 +244,56 @@ class BaseThingy(DatabaseThingy):
         return cls.count_documents(filter=filter, *args, **kwargs)
 
     @classmethod
-    def connect(cls, *args, client_cls=None, database_name=None, **kwargs):
-        if not client_cls:
-            client_cls = cls._client_cls
-
-        cls._client = client_cls(*args, **kwargs)
-        try:
-            cls._database = cls._client.get_database(database_name)
-        except (ConfigurationError, TypeError):
-            cls._database = cls._client["test"]
+    def connect(
+        cls,
+        *args,
+        client_cls=None,
+        database_name=None,
+        lazy=False,
+        prewarm=0,
+        **kwargs,
+    ):
+        """Connect the class, and its subclasses, to a database
+
+        With ``lazy``, the client is only created on first use. Either way, it
+        is created again on first use after a fork. With ``prewarm``, as many
+        connections are opened as soon as the client is created.
+        """
+        cls._client = None
+        cls._database = None
+        cls._connection = Connection(cls, client_cls, args, kwargs, database_name)
+        cls._connection.prewarm = prewarm
+        if not lazy:
+            cls._connection.open()
+        routing.clear()
 
     @classmethod
     def disconnect(cls, *args, **kwargs):
+        """Disconnect the class, returning an awaitable if closing the client is"""
+        closing = None
         if cls._client:
-            cls._client.close()
+            closing = cls._client.close()
         cls._client = None
         cls._database = None
+        cls._connection = None
+        routing.clear()
+        return closing
 
     @classmethod
-    def distinct(cls, *args, **kwargs):
-        return cls.collection.distinct(*args, **kwargs)
+    @instrument
+    def distinct(cls, *args, read_preference=None, **kwargs):
+        collection = cls.get_read_collection(read_preference)
+        return collection.distinct(*args, **kwargs)
 
     @classmethod
-    def find(cls, *args, view=None, **kwargs):
-        delegate = cls.collection.find(*args, **kwargs)
+    @instrument
+    def find(cls, *args, view=None, read_preference=None, **kwargs):
+        collection = cls.get_read_collection(read_preference)
+        delegate = collection.find(*args, **kwargs)
         return cls._cursor_cls(delegate, thingy_cls=cls, view=view)
 
     @classmethod
+    @instrument
     def find_one(cls, filter=None, *args, **kwargs):
         if filter is not None and not isinstance(filter, Mapping):
             filter = {"_id": filter}
@@ -174,10 +302,12 @@ class BaseThingy(DatabaseThingy):
         return cursor.first()
 
     @classmethod
+    @instrument
     def delete_many(cls, filter=None, *args, **kwargs):
         return cls.collection.delete_many(filter, *args, **kwargs)
 
     @classmethod
+    @instrument
     def delete_one(cls, filter=None, *args, **kwargs):
         if filter is not None and not isinstance(filter, Mapping):
             filter = {"_id": filter}
@@ -185,10 +315,12 @@ class BaseThingy(DatabaseThingy):
         return cls.collection.delete_one(filter, *args, **kwargs)
 
     @classmethod
+    @instrument
     def update_many(cls, filter, update, *args, **kwargs):
         return cls.collection.update_many(filter, update, *args, **kwargs)
 
     @classmethod
+    @instrument
     def update_one(cls, filter, update, *args, **kwargs):
         if filter is not None and not isinstance(filter, Mapping):
             filter = {"_id": filter}
@@ -206,6 +338,7 @@ class BaseThingy(DatabaseThingy):
         else:
             self._id = value
 
+    @instrument
     def delete(self):
         return self.get_collection().delete_one({"_id": self.id})
 
@@ -215,16 +348,61 @@ class Thingy(BaseThingy):
     _cursor_cls = Cursor
 
     @classmethod
+    def prewarm(cls, connections=1):
+        """Open ``connections`` pooled connections, with concurrent pings"""
+        client = cls.client
+        with ThreadPoolExecutor(connections) as executor:
+            for _ in range(connections):
+                executor.submit(client.admin.command, "ping")
+
+    @classmethod
+    @instrument
+    def count_many(
+        cls, filters, estimated=False, cache_ttl=None, read_preference=None, **kwargs
+    ):
+        """Count the documents matching each of ``filters``, in one round trip
+
+        ``filters`` maps names to filters, and the counts are returned by name.
+        With ``estimated``, empty filters are counted from the collection
+        metadata. With ``cache_ttl``, counts are cached for as many seconds.
+        """
+        collection = cls.get_read_collection(read_preference)
+        if cache_ttl:
+            key = counts.get_cache_key(collection, filters, estimated)
+            cached = counts.get_cached(key)
+            if cached is not None:
+                return cached
+
+        total, documents = None, []
+        names = counts.get_facet_names(filters, estimated)
+        if len(names) < len(filters):
+            total = collection.estimated_document_count()
+        if names:
+            pipeline = counts.get_pipeline(filters, names)
+            documents = list(collection.aggregate(pipeline, **kwargs))
+
+        result = counts.get_counts(filters, names, documents, total)
+        if cache_ttl:
+            counts.set_cached(key, result, cache_ttl)
+        return result
+
+    @classmethod
+    @instrument
     def create_index(cls, keys, **kwargs):
         cls.collection.create_index(keys, **kwargs)
 
     @classmethod
-    def create_indexes(cls):
-        if hasattr(cls, "_indexes"):
-            for keys, kwargs in cls._indexes:
-                cls.create_index(keys, **kwargs)
+    @instrument
+    def create_indexes(cls, dry_run=False):
+        if not hasattr(cls, "_indexes"):
+            return []
+        indexes = get_missing_indexes(cls, list_indexes(cls))
+        if indexes and not dry_run:
+            cls.collection.create_indexes(indexes)
+        return indexes
 
     @classmethod
+    @instrument
     def find_one_and_replace(cls, filter, replacement, *args, **kwargs):
         if filter is not None and not isinstance(filter, Mapping):
             filter = {"_id": filter}
@@ -234,9 +412,10 @@ class Thingy(BaseThingy):
             filter, replacement, *args, **kwargs
         )
         if result is not None:
-            return cls(result)
+            return cls._from_document(result)
 
     @classmethod
+    @instrument
     def find_one_and_update(cls, filter, update, *args, **kwargs):
         if filter is not None and not isinstance(filter, Mapping):
             filter = {"_id": filter}
@@ -244,38 +423,94 @@ class Thingy(BaseThingy):
         kwargs.setdefault("return_document", ReturnDocument.AFTER)
         result = cls.collection.find_one_and_update(filter, update, *args, **kwargs)
         if result is not None:
-            return cls(result)
+            return cls._from_document(result)
 
-    def save(self, force_insert=False, refresh=False):
-        data = self.__dict__
+    def _save(self, force_insert=False):
+        data = self._to_document()
         collection = self.get_collection()
 
         if self.id is not None and not force_insert:
             filter = {"_id": self.id}
-            collection.replace_one(filter, data, upsert=True)
-        else:
-            collection.insert_one(data)
+            return collection.replace_one(filter, data, upsert=True)
+        result = collection.insert_one(data)
+        self.__dict__.setdefault("_id", result.inserted_id)
+        return result
+
+    def _refresh(self):
+        document = self.get_collection().find_one(self.id)
+        self.__dict__ = self._from_document(document).__dict__
 
+    @instrument
+    def save(self, force_insert=False, refresh=False):
+        self._save(force_insert)
         if refresh:
-            self.__dict__ = collection.find_one(self.id)
+            self._refresh()
         return self
 
 
 class AsyncThingy(BaseThingy):
-    _client_cls = MotorClient or AsyncIOMotorClient
     _cursor_cls = AsyncCursor
 
+    @classproperty
+    def _client_cls(cls):
+        return get_async_client_cls()
+
     @classmethod
+    async def prewarm(cls, connections=1):
+        """Open ``connections`` pooled connections, with concurrent pings"""
+        client = cls.client
+        pings = [client.admin.command("ping") for _ in range(connections)]
+        await asyncio.gather(*pings)
+
+    @classmethod
+    @instrument
+    async def count_many(
+        cls, filters, estimated=False, cache_ttl=None, read_preference=None, **kwargs
+    ):
+        """Count the documents matching each of ``filters``, in one round trip
+
+        See :meth:`Thingy.count_many`.
+        """
+        collection = cls.get_read_collection(read_preference)
+        if cache_ttl:
+            key = counts.get_cache_key(collection, filters, estimated)
+            cached = counts.get_cached(key)
+            if cached is not None:
+                return cached
+
+        total, documents = None, []
+        names = counts.get_facet_names(filters, estimated)
+        if len(names) < len(filters):
+            total = await collection.estimated_document_count()
+        if names:
+            pipeline = counts.get_pipeline(filters, names)
+            cursor = collection.aggregate(pipeline, **kwargs)
+            if inspect.isawaitable(cursor):
+                cursor = await cursor
+            documents = await cursor.to_list(None)
+
+        result = counts.get_counts(filters, names, documents, total)
+        if cache_ttl:
+            counts.set_cached(key, result, cache_ttl)
+        return result
+
+    @classmethod
+    @instrument
     async def create_index(cls, keys, **kwargs):
         await cls.collection.create_index(keys, **kwargs)
 
     @classmethod
-    async def create_indexes(cls):
-        if hasattr(cls, "_indexes"):
-            for keys, kwargs in cls._indexes:
-                await cls.create_index(keys, **kwargs)
+    @instrument
+    async def create_indexes(cls, dry_run=False):
+        if not hasattr(cls, "_indexes"):
+            return []
+        indexes = get_missing_indexes(cls, await async_list_indexes(cls))
+        if indexes and not dry_run:
+            await cls.collection.create_indexes(indexes)
+        return indexes
 
     @classmethod
+    @instrument
     async def find_one_and_replace(cls, filter, replacement, *args, **kwargs):
         if filter is not None and not isinstance(filter, Mapping):
             filter = {"_id": filter}
@@ -285,9 +520,10 @@ class AsyncThingy(BaseThingy):
             filter, replacement, *args, **kwargs
         )
         if result is not None:
-            return cls(result)
+            return cls._from_document(result)
 
     @classmethod
+    @instrument
     async def find_one_and_update(cls, filter, update, *args, **kwargs):
         if filter is not None and not isinstance(filter, Mapping):
             filter = {"_id": filter}
@@ -297,48 +533,106 @@ class AsyncThingy(BaseThingy):
             filter, update, *args, **kwargs
         )
         if result is not None:
-            return cls(result)
+            return cls._from_document(result)
 
-    async def save(self, force_insert=False, refresh=False):
-        data = self.__dict__
+    async def _save(self, force_insert=False):
+        data = self._to_document()
         collection = self.get_collection()
 
         if self.id is not None and not force_insert:
             filter = {"_id": self.id}
-            await collection.replace_one(filter, data, upsert=True)
-        else:
-            await collection.insert_one(data)
+            return await collection.replace_one(filter, data, upsert=True)
+        result = await collection.insert_one(data)
+        self.__dict__.setdefault("_id", result.inserted_id)
+        return result
+
+    async def _refresh(self):
+        document = await self.get_collection().find_one(self.id)
+        self.__dict__ = self._from_document(document).__dict__
 
+    @instrument
+    async def save(self, force_insert=False, refresh=False):
+        await self._save(force_insert)
         if refresh:
-            self.__dict__ = await collection.find_one(self.id)
+            await self._refresh()
         return self
 
 
 def connect(*args, **kwargs):
-    if AsyncThingy._client_cls is not None:
-        AsyncThingy.connect(*args, **kwargs)
+    if has_async_client():
+        # The async client is only imported once an AsyncThingy is used
+        AsyncThingy.connect(*args, **dict(kwargs, lazy=True))
     Thingy.connect(*args, **kwargs)
 
 
 def disconnect(*args, **kwargs):
-    Thingy.disconnect(*args, **kwargs)
-    AsyncThingy.disconnect(*args, **kwargs)
-
-
-def create_indexes():
-    """Create indexes registered on all :class:`Thingy`"""
-    tasks = []
-
+    return gather(
+        Thingy.disconnect(*args, **kwargs),
+        AsyncThingy.disconnect(*args, **kwargs),
+        routing.close_clients(),
+    )
+
+
+def create_indexes(dry_run=False, cache=None, max_workers=None):
+    """Create the missing indexes registered on all :class:`Thingy`
+
+    Only the indexes missing from a collection are created, with a single
+    command, and collections are processed concurrently. With a ``cache`` (any
+    mutable mapping, e.g. a :mod:`shelve`), the classes whose indexes didn't
+    change since the last call are skipped without a round trip. With
+    ``dry_run``, the missing indexes are only returned.
+
+    Return the missing indexes of each class, or an awaitable of them when
+    there are :class:`AsyncThingy`.
+    """
+    classes, async_classes, is_async = [], [], False
     for cls in registry:
+        if not hasattr(cls, "_indexes"):
+            continue
+        is_async = is_async or issubclass(cls, AsyncThingy)
+        if cache is not None and cache.get(get_cache_key(cls)) == get_spec_hash(cls):
+            continue
         if issubclass(cls, Thingy):
-            cls.create_indexes()
+            classes.append(cls)
         if issubclass(cls, AsyncThingy):
-            coroutine = cls.create_indexes()
-            task = asyncio.create_task(coroutine)
-            tasks.append(task)
-
-    if tasks:
-        return asyncio.wait(tasks)
-
-
-__all__ = ["AsyncThingy", "Thingy", "connect", "create_indexes"]
+            async_classes.append(cls)
+
+    def create(cls):
+        return cls.create_indexes(dry_run=dry_run)
+
+    indexes = {}
+    if classes:
+        with ThreadPoolExecutor(max_workers) as executor:
+            # Threads don't inherit the context (e.g. the tenant of the scope)
+            futures = [executor.submit(copy_context().run, create, c) for c in classes]
+            indexes.update(zip(classes, [future.result() for future in futures]))
+        _update_cache(cache, classes, dry_run)
+
+    if is_async:
+        tasks = [asyncio.ensure_future(create(cls)) for cls in async_classes]
+        return _create_async_indexes(indexes, async_classes, tasks, cache, dry_run)
+    return indexes
+
+
+async def _create_async_indexes(indexes, classes, tasks, cache, dry_run):
+    indexes.update(zip(classes, await asyncio.gather(*tasks)))
+    _update_cache(cache, classes, dry_run)
+    return indexes
+
+
+def _update_cache(cache, classes, dry_run):
+    if cache is None or dry_run:
+        return
+    for cls in classes:
+        cache[get_cache_key(cls)] = get_spec_hash(cls)
+
+
+__all__ = [
+    "AsyncThingy",
+    "Thingy",
+    "connect",
+    "create_indexes",
+    "query_budget",
+    "read_your_writes",
+    "tenant",
+]
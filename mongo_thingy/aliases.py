@@ -0,0 +1,216 @@
+from collections.abc import Mapping
+
+from mongo_thingy.cursor import AsyncCursor, Cursor, _ChainingProxy
+
+LOGICAL_OPERATORS = ("$and", "$or", "$nor")
+
+_names = {}
+
+
+def get_names(aliases):
+    """Return the field names of stored aliases"""
+    key = id(aliases)
+    cached = _names.get(key)
+    if cached is not None and cached[0] is aliases:
+        return cached[1]
+    names = {alias: name for name, alias in aliases.items()}
+    if len(names) != len(aliases):
+        raise ValueError(f"Aliases must be unique: {aliases!r}")
+    _names[key] = (aliases, names)
+    return names
+
+
+def get_alias(path, aliases):
+    """Return the stored path of a field name, or of a dotted path"""
+    head, dot, tail = path.partition(".")
+    alias = aliases.get(head)
+    if alias is None:
+        return path
+    return alias + dot + tail
+
+
+def rename(document, names):
+    """Return a copy of ``document`` with its top-level keys renamed"""
+    return {names.get(k, k): v for k, v in document.items()}
+
+
+def alias_filter(filter, aliases):
+    if not isinstance(filter, Mapping):
+        return filter
+    aliased = {}
+    for key, value in filter.items():
+        if key in LOGICAL_OPERATORS:
+            aliased[key] = [alias_filter(f, aliases) for f in value]
+        elif key.startswith("$"):
+            aliased[key] = value
+        else:
+            aliased[get_alias(key, aliases)] = value
+    return aliased
+
+
+def alias_update(update, aliases):
+    """Return an update with its fields aliased, or a replacement document"""
+    if not isinstance(update, Mapping):
+        return update  # Aggregation pipeline
+    if not any(key.startswith("$") for key in update):
+        return rename(update, aliases)
+    aliased = {}
+    for operator, fields in update.items():
+        if operator == "$rename":
+            fields = {k: get_alias(v, aliases) for k, v in fields.items()}
+        aliased[operator] = {get_alias(k, aliases): v for k, v in fields.items()}
+    return aliased
+
+
+def alias_keys(keys, aliases):
+    """Return the sort, projection or index ``keys`` with their fields aliased"""
+    if keys is None:
+        return keys
+    if isinstance(keys, str):
+        return get_alias(keys, aliases)
+    if isinstance(keys, Mapping):
+        return {get_alias(k, aliases): v for k, v in keys.items()}
+    return [
+        (
+            get_alias(k, aliases)
+            if isinstance(k, str)
+            else (get_alias(k[0], aliases),) + tuple(k[1:])
+        )
+        for k in keys
+    ]
+
+
+class BaseAliasedCursor:
+    def sort(self, key_or_list, direction=None):
+        args = (alias_keys(key_or_list, self.thingy_cls._aliases),)
+        if direction is not None:
+            args += (direction,)
+        return _ChainingProxy("sort")(self)(*args)
+
+    def distinct(self, key):
+        return self.delegate.distinct(get_alias(key, self.thingy_cls._aliases))
+
+
+class AliasedCursor(BaseAliasedCursor, Cursor):
+    pass
+
+
+class AsyncAliasedCursor(BaseAliasedCursor, AsyncCursor):
+    pass
+
+
+class BaseAliased:
+    """Mixin storing fields under the shorter aliases of ``_aliases``
+
+    ``_aliases`` maps field names to their stored alias, e.g.
+    ``{"last_login_timestamp": "llt"}``. Documents are renamed when bound and
+    written, and the filters, updates, sorts, projections and index keys of the
+    class are rewritten, so that queries keep using the field names. Only the
+    top-level fields, and the first part of dotted paths, are aliased.
+    """
+
+    _aliases = {}
+
+    @classmethod
+    def _from_document(cls, document):
+        document = rename(document, get_names(cls._aliases))
+        return super(BaseAliased, cls)._from_document(document)
+
+    def _to_document(self):
+        document = super(BaseAliased, self)._to_document()
+        return rename(document, self._aliases)
+
+    @classmethod
+    def _alias_kwargs(cls, kwargs):
+        for name in ("projection", "sort"):
+            if name in kwargs:
+                kwargs[name] = alias_keys(kwargs[name], cls._aliases)
+        if "filter" in kwargs:
+            kwargs["filter"] = alias_filter(kwargs["filter"], cls._aliases)
+        return kwargs
+
+    @classmethod
+    def add_index(cls, keys, **kwargs):
+        keys = alias_keys(keys, cls._aliases)
+        return super(BaseAliased, cls).add_index(keys, **kwargs)
+
+    @classmethod
+    def create_index(cls, keys, **kwargs):
+        keys = alias_keys(keys, cls._aliases)
+        return super(BaseAliased, cls).create_index(keys, **kwargs)
+
+    @classmethod
+    def count_documents(cls, filter=None, *args, **kwargs):
+        filter = alias_filter(filter, cls._aliases)
+        return super(BaseAliased, cls).count_documents(filter, *args, **kwargs)
+
+    @classmethod
+    def count_many(cls, filters, *args, **kwargs):
+        filters = {k: alias_filter(f, cls._aliases) for k, f in filters.items()}
+        return super(BaseAliased, cls).count_many(filters, *args, **kwargs)
+
+    @classmethod
+    def distinct(cls, key, filter=None, *args, **kwargs):
+        key = get_alias(key, cls._aliases)
+        filter = alias_filter(filter, cls._aliases)
+        return super(BaseAliased, cls).distinct(key, filter, *args, **kwargs)
+
+    @classmethod
+    def find(cls, *args, **kwargs):
+        if args:
+            args = (alias_filter(args[0], cls._aliases),) + args[1:]
+        if len(args) > 1:
+            args = args[:1] + (alias_keys(args[1], cls._aliases),) + args[2:]
+        kwargs = cls._alias_kwargs(kwargs)
+        return super(BaseAliased, cls).find(*args, **kwargs)
+
+    @classmethod
+    def delete_many(cls, filter=None, *args, **kwargs):
+        filter = alias_filter(filter, cls._aliases)
+        return super(BaseAliased, cls).delete_many(filter, *args, **kwargs)
+
+    @classmethod
+    def delete_one(cls, filter=None, *args, **kwargs):
+        filter = alias_filter(filter, cls._aliases)
+        return super(BaseAliased, cls).delete_one(filter, *args, **kwargs)
+
+    @classmethod
+    def update_many(cls, filter, update, *args, **kwargs):
+        filter = alias_filter(filter, cls._aliases)
+        update = alias_update(update, cls._aliases)
+        return super(BaseAliased, cls).update_many(filter, update, *args, **kwargs)
+
+    @classmethod
+    def update_one(cls, filter, update, *args, **kwargs):
+        filter = alias_filter(filter, cls._aliases)
+        update = alias_update(update, cls._aliases)
+        return super(BaseAliased, cls).update_one(filter, update, *args, **kwargs)
+
+    @classmethod
+    def find_one_and_replace(cls, filter, replacement, *args, **kwargs):
+        filter = alias_filter(filter, cls._aliases)
+        replacement = rename(replacement, cls._aliases)
+        kwargs = cls._alias_kwargs(kwargs)
+        return super(BaseAliased, cls).find_one_and_replace(
+            filter, replacement, *args, **kwargs
+        )
+
+    @classmethod
+    def find_one_and_update(cls, filter, update, *args, **kwargs):
+        filter = alias_filter(filter, cls._aliases)
+        update = alias_update(update, cls._aliases)
+        kwargs = cls._alias_kwargs(kwargs)
+        return super(BaseAliased, cls).find_one_and_update(
+            filter, update, *args, **kwargs
+        )
+
+
+class Aliased(BaseAliased):
+    _cursor_cls = AliasedCursor
+
+
+class AsyncAliased(BaseAliased):
+    _cursor_cls = AsyncAliasedCursor
+
+
+__all__ = ["Aliased", "AliasedCursor", "AsyncAliased", "AsyncAliasedCursor"]
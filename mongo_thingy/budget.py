@@ -0,0 +1,170 @@
+import warnings
+from contextvars import ContextVar
+
+from mongo_thingy import monitoring
+from mongo_thingy.queries import get_fingerprint
+
+READ_OPERATIONS = (
+    "count_documents",
+    "count_many",
+    "cursor.__anext__",
+    "cursor.__getitem__",
+    "cursor.__iter__",
+    "cursor.__next__",
+    "cursor.first",
+    "cursor.to_list",
+    "distinct",
+    "find_one",
+)
+
+WRITE_OPERATIONS = (
+    "counter.flush",
+    "create_index",
+    "create_indexes",
+    "delete",
+    "delete_many",
+    "delete_one",
+    "find_one_and_replace",
+    "find_one_and_update",
+    "save",
+    "update_many",
+    "update_one",
+    "write_behind.flush",
+)
+
+ROUND_TRIP_OPERATIONS = READ_OPERATIONS + WRITE_OPERATIONS
+
+# Only the first fetch of a cursor issues a query, the next ones reuse its batch
+CURSOR_OPERATIONS = ("cursor.__anext__", "cursor.__next__")
+
+_budgets = ContextVar("mongo_thingy_budgets", default=())
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class RepeatedQueryWarning(UserWarning):
+    pass
+
+
+def is_round_trip(event):
+    """Tell whether an operation issues a command of its own
+
+    Creating a cursor issues nothing: its first fetch does. Reads run by
+    another operation (e.g. the cursor of :meth:`~mongo_thingy.Thingy.find_one`)
+    belong to its round trip, while writes (e.g. a flush of queued revisions)
+    always are commands of their own.
+    """
+    if event.operation not in ROUND_TRIP_OPERATIONS:
+        return False
+    if event.operation in WRITE_OPERATIONS:
+        return True
+    parent = event.parent
+    while parent is not None:
+        if parent.operation in ROUND_TRIP_OPERATIONS:
+            return False
+        parent = parent.parent
+    return True
+
+
+class QueryBudget(monitoring.OperationListener):
+    """Count the round trips issued within a scope, and fail past a budget
+
+    Operations are only counted in the context (thread, or asyncio task and
+    the tasks it spawns) that entered the scope. When the same query shape is
+    repeated ``repeat_threshold`` times, a :class:`RepeatedQueryWarning` is
+    emitted: it usually is a query issued in a loop.
+    """
+
+    def __init__(self, max_round_trips=None, repeat_threshold=None):
+        self.max_round_trips = max_round_trips
+        self.repeat_threshold = repeat_threshold
+        self.round_trips = 0
+        self.events = []
+        self.repeats = {}
+        self.cursors = set()
+        self.filters = {}
+        self._token = None
+
+    def __enter__(self):
+        self._token = _budgets.set(_budgets.get() + (self,))
+        monitoring.register(self)
+        return self
+
+    def __exit__(self, type, error, traceback):
+        _budgets.reset(self._token)
+        monitoring.unregister(self)
+        if error is None and self.is_exceeded():
+            raise QueryBudgetExceeded(self.get_message())
+
+    def is_exceeded(self):
+        if self.max_round_trips is None:
+            return False
+        return self.round_trips > self.max_round_trips
+
+    def get_message(self):
+        lines = [
+            f"{self.round_trips} round trips issued, "
+            f"for a budget of {self.max_round_trips}:"
+        ]
+        for event in self.events:
+            name = getattr(event.thingy_cls, "__name__", None)
+            fingerprint = get_fingerprint(self.get_filter(event))
+            lines.append(f"  - {name}.{event.operation} {fingerprint}")
+        return "\n".join(lines)
+
+    def started(self, event):
+        if self not in _budgets.get() or not is_round_trip(event):
+            return
+        if event.operation in CURSOR_OPERATIONS:
+            if event.cursor in self.cursors:
+                return
+            self.cursors.add(event.cursor)
+
+        self.round_trips += 1
+        self.events.append(event)
+        if self.repeat_threshold is not None:
+            self.check_repeats(event)
+        if self.is_exceeded():
+            raise QueryBudgetExceeded(self.get_message())
+
+    def succeeded(self, event):
+        # Cursors are counted when fetched, with the filter they were created with
+        if event.operation == "find" and self in _budgets.get():
+            self.filters[event.result] = event.filter
+
+    def get_filter(self, event):
+        if event.cursor is not None:
+            return self.filters.get(event.cursor)
+        return event.filter
+
+    def check_repeats(self, event):
+        fingerprint = get_fingerprint(self.get_filter(event))
+        key = (event.thingy_cls, event.operation, fingerprint)
+        repeats = self.repeats[key] = self.repeats.get(key, 0) + 1
+        if repeats == self.repeat_threshold:
+            name = getattr(event.thingy_cls, "__name__", None)
+            message = (
+                f"{name}.{event.operation} {fingerprint} repeated {repeats} times: "
+                "is it called in a loop?"
+            )
+            warnings.warn(message, RepeatedQueryWarning, stacklevel=2)
+
+
+def query_budget(max_round_trips=None, repeat_threshold=10):
+    """Fail when more than ``max_round_trips`` round trips are issued
+
+    >>> with query_budget(max_round_trips=3):
+    ...     user = User.find_one({"name": "Mr. Foo"})
+    ...     user.save()
+    """
+    return QueryBudget(max_round_trips, repeat_threshold)
+
+
+__all__ = [
+    "QueryBudget",
+    "QueryBudgetExceeded",
+    "RepeatedQueryWarning",
+    "query_budget",
+]
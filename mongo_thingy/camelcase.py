@@ -1,29 +1,93 @@
 import re
+from functools import lru_cache
+from weakref import WeakKeyDictionary
 
 from mongo_thingy import BaseThingy
 
 CAMELIZE_RE = re.compile(r"(?!^)_([a-zA-Z])")
 UNCAMELIZE_RE = re.compile(r"(?<!^)(?<![A-Z])[A-Z]")
+MAX_CACHE_SIZE = 4096
 
+_class_attributes = WeakKeyDictionary()
 
+
+@lru_cache(maxsize=MAX_CACHE_SIZE)
 def camelize(string):
     if string.startswith("__") or "_" not in string:
         return string
     return re.sub(CAMELIZE_RE, lambda m: m.group(1).upper(), string)
 
 
+@lru_cache(maxsize=MAX_CACHE_SIZE)
 def uncamelize(string):
     if string.startswith("__") or "_" in string:
         return string
     return re.sub(UNCAMELIZE_RE, r"_\g<0>", string).lower()
 
 
+def translate(value, function):
+    """Return ``value`` with the keys of its documents translated by ``function``
+
+    Nested documents and lists are translated too, and values are not copied.
+    """
+    if isinstance(value, dict):
+        return {
+            function(k) if isinstance(k, str) else k: translate(v, function)
+            for k, v in value.items()
+        }
+    if isinstance(value, list):
+        return [translate(v, function) for v in value]
+    return value
+
+
+def get_class_attributes(cls):
+    try:
+        return _class_attributes[cls]
+    except KeyError:
+        return _class_attributes.setdefault(cls, frozenset(dir(cls)))
+
+
 class CamelCase:
+    """Mixin translating snake_case attributes from and to camelCase keys
+
+    Translations are cached. Attributes are looked up in the document first,
+    and the names of dunders and of other class attributes (methods,
+    properties...) are not translated.
+    """
+
     def __setattr__(self, attr, value):
         return BaseThingy.__setattr__(self, camelize(attr), value)
 
     def __getattribute__(self, attr):
+        if attr.startswith("__"):
+            return BaseThingy.__getattribute__(self, attr)
+        document = object.__getattribute__(self, "__dict__")
+        key = camelize(attr)
+        if key in document:
+            return document[key]
+        # Class attributes added later are still found below, only slower
+        if attr in get_class_attributes(type(self)):
+            return BaseThingy.__getattribute__(self, attr)
         try:
-            return object.__getattribute__(self, camelize(attr))
+            return object.__getattribute__(self, key)
         except AttributeError:
             return BaseThingy.__getattribute__(self, uncamelize(attr))
+
+
+class CamelCaseStorage:
+    """Mixin storing snake_case attributes as camelCase keys
+
+    Keys are translated once, when documents are bound and when they are saved,
+    in nested documents and lists too, so attributes are plain ``__dict__``
+    lookups. Filters, updates and projections keep using the stored keys, and
+    keys must survive the round trip (``userId``, not ``userID``).
+    """
+
+    @classmethod
+    def _from_document(cls, document):
+        thingy = cls()
+        thingy.__dict__ = translate(document, uncamelize)
+        return thingy
+
+    def _to_document(self):
+        return translate(self.__dict__, camelize)
@@ -0,0 +1,92 @@
+import asyncio
+import inspect
+import os
+import threading
+
+from pymongo.errors import ConfigurationError
+
+_generation = 0
+_after_fork_callbacks = []
+_lock = threading.Lock()
+
+
+def _after_fork():
+    global _generation, _lock
+    _generation += 1
+    _lock = threading.Lock()
+    for callback in _after_fork_callbacks:
+        callback()
+
+
+if hasattr(os, "register_at_fork"):  # pragma: no branch
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def register_after_fork(callback):
+    """Call ``callback`` in the child process after a fork"""
+    _after_fork_callbacks.append(callback)
+    return callback
+
+
+class Connection:
+    """The arguments of the client of a class, created on demand
+
+    The client is created again in the child process after a fork, since the
+    one of the parent can't be shared.
+    """
+
+    def __init__(self, owner, client_cls, args=(), kwargs=None, database_name=None):
+        self.owner = owner
+        self.client_cls = client_cls
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.database_name = database_name
+        self.prewarm = 0
+        self.generation = None
+
+    @property
+    def is_open(self):
+        return self.generation == _generation
+
+    def open(self):
+        with _lock:
+            if self.is_open:
+                return
+            client_cls = self.client_cls or self.owner._client_cls
+            client = client_cls(*self.args, **self.kwargs)
+            try:
+                database = client.get_database(self.database_name)
+            except (ConfigurationError, TypeError):
+                database = client["test"]
+            self.owner._client = client
+            self.owner._database = database
+            self.generation = _generation
+
+        if self.prewarm:
+            warmup = self.owner.prewarm(self.prewarm)
+            if inspect.isawaitable(warmup):
+                _schedule(warmup)
+
+
+def gather(*results):
+    """Return an awaitable of the awaitable results, if any"""
+    awaitables = [result for result in results if inspect.isawaitable(result)]
+    if awaitables:
+        return _gather(awaitables)
+
+
+async def _gather(awaitables):
+    for awaitable in awaitables:
+        await awaitable
+
+
+def _schedule(awaitable):
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        # Without a running loop, the caller has to await prewarm() itself
+        return awaitable.close()
+    asyncio.ensure_future(awaitable)
+
+
+__all__ = ["Connection", "gather", "register_after_fork"]
@@ -0,0 +1,208 @@
+import asyncio
+import atexit
+import logging
+import threading
+
+from pymongo import UpdateOne
+
+from mongo_thingy import monitoring
+from mongo_thingy.connection import register_after_fork
+
+logger = logging.getLogger(__name__)
+
+_counters = set()
+_lock = threading.Lock()
+
+
+class BaseCounter:
+    """Increments of a thingy class, summed in memory by document and field
+
+    The sums are written with upserted ``$inc`` updates, by one unordered bulk
+    write, every ``flush_interval`` seconds or once ``batch_size`` documents
+    have pending increments. Closed counters refuse increments.
+    """
+
+    def __init__(self, thingy_cls, batch_size=1000, flush_interval=1.0):
+        self.thingy_cls = thingy_cls
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending = {}
+        self.size = 0
+        self.closed = False
+        self.lock = threading.Lock()
+
+    def increment(self, key, field, value=1):
+        """Add ``value`` to the ``field`` of the document whose ``_id`` is ``key``"""
+        collection = self.thingy_cls.get_collection()
+        with self.lock:
+            if self.closed:
+                raise ValueError(f"{self!r} is closed")
+            name = collection.full_name
+            documents = self.pending.setdefault(name, (collection, {}))[1]
+            if key not in documents:
+                documents[key] = {}
+                self.size += 1
+            increments = documents[key]
+            increments[field] = increments.get(field, 0) + value
+            is_ready = self.size >= self.batch_size
+        self.start()
+        if is_ready:
+            self.wake()
+
+    def set_closed(self):
+        # Increments are either pending for the final flush, or refused
+        with self.lock:
+            self.closed = True
+
+    def take(self):
+        with self.lock:
+            pending = list(self.pending.values())
+            self.pending.clear()
+            self.size = 0
+        return pending
+
+    def get_requests(self, documents):
+        return [
+            UpdateOne({"_id": key}, {"$inc": increments}, upsert=True)
+            for key, increments in documents.items()
+        ]
+
+    def failed(self, documents, error):
+        name = self.thingy_cls.__name__
+        logger.error("Increments of %d %s failed: %s", len(documents), name, error)
+
+
+class Counter(BaseCounter):
+    """Counter written by a background thread"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.event = threading.Event()
+        self.flushing = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        if self.thread is not None:
+            return
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+        with _lock:
+            _counters.add(self)
+
+    def wake(self):
+        self.event.set()
+
+    def run(self):
+        while not self.closed:
+            self.event.wait(self.flush_interval)
+            self.event.clear()
+            try:
+                self.flush()
+            except Exception:
+                continue  # Logged by failed()
+
+    def flush(self):
+        """Write the pending increments"""
+        with self.flushing:
+            for collection, documents in self.take():
+                try:
+                    requests = self.get_requests(documents)
+                    with monitoring.operation(self.thingy_cls, "counter.flush"):
+                        collection.bulk_write(requests, ordered=False)
+                except Exception as error:
+                    self.failed(documents, error)
+                    raise
+
+    def close(self):
+        """Stop the background thread, and write the pending increments"""
+        self.set_closed()
+        self.wake()
+        if self.thread is not None:
+            self.thread.join()
+        with _lock:
+            _counters.discard(self)
+        self.flush()
+
+
+class AsyncCounter(BaseCounter):
+    """Counter written by a background task"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.event = None
+        self.flushing = None
+        self.task = None
+
+    def start(self):
+        if self.task is None:
+            self.event = asyncio.Event()
+            self.flushing = asyncio.Lock()
+            self.task = asyncio.ensure_future(self.run())
+
+    def wake(self):
+        self.event.set()
+
+    async def run(self):
+        while not self.closed:
+            try:
+                await asyncio.wait_for(self.event.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.event.clear()
+            try:
+                await self.flush()
+            except Exception:
+                continue  # Logged by failed()
+
+    async def flush(self):
+        """Write the pending increments"""
+        if self.task is None:
+            return
+        async with self.flushing:
+            for collection, documents in self.take():
+                try:
+                    requests = self.get_requests(documents)
+                    with monitoring.operation(self.thingy_cls, "counter.flush"):
+                        await collection.bulk_write(requests, ordered=False)
+                except Exception as error:
+                    self.failed(documents, error)
+                    raise
+
+    async def close(self):
+        """Stop the background task, and write the pending increments"""
+        self.set_closed()
+        if self.task is not None:
+            self.wake()
+            await self.task
+        await self.flush()
+
+
+@atexit.register
+def _close_at_exit():
+    with _lock:
+        counters = list(_counters)
+    for counter in counters:
+        try:
+            counter.close()
+        except Exception:
+            pass
+
+
+@register_after_fork
+def _forget_counters():
+    global _lock
+    _lock = threading.Lock()
+    # The increments summed by the parent process are written by the parent
+    for counter in list(_counters):
+        counter.lock = threading.Lock()
+        counter.flushing = threading.Lock()
+        counter.event = threading.Event()
+        counter.pending.clear()
+        counter.size = 0
+        counter.thread = None
+    _counters.clear()
+
+
+__all__ = ["AsyncCounter", "Counter"]
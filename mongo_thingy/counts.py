@@ -0,0 +1,65 @@
+import json
+import threading
+import time
+
+MAX_CACHE_SIZE = 1024
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def get_facet_names(filters, estimated=False):
+    """Return the names of the filters to count with the ``$facet`` stage"""
+    if not estimated:
+        return list(filters)
+    return [name for name, filter in filters.items() if filter]
+
+
+def get_pipeline(filters, names):
+    """Return a pipeline counting the documents of each filter, in one pass"""
+    facets = {
+        f"_{i}": [{"$match": filters[name] or {}}, {"$count": "count"}]
+        for i, name in enumerate(names)
+    }
+    return [{"$facet": facets}]
+
+
+def get_counts(filters, names, documents, total=None):
+    """Return the counts of each filter, from the ``$facet`` results"""
+    facets = documents[0] if documents else {}
+    counts = {}
+    for i, name in enumerate(names):
+        results = facets.get(f"_{i}")
+        counts[name] = results[0]["count"] if results else 0
+    return {name: counts.get(name, total) for name in filters}
+
+
+def get_cache_key(collection, filters, estimated=False):
+    filters = json.dumps(filters, sort_keys=True, default=repr)
+    return (collection.full_name, filters, estimated)
+
+
+def get_cached(key):
+    with _lock:
+        entry = _cache.get(key)
+    if entry is not None and entry[0] > time.monotonic():
+        return dict(entry[1])
+
+
+def set_cached(key, counts, ttl):
+    now = time.monotonic()
+    with _lock:
+        if len(_cache) >= MAX_CACHE_SIZE:
+            for k in [k for k, (expiry, _) in _cache.items() if expiry <= now]:
+                del _cache[k]
+        if len(_cache) < MAX_CACHE_SIZE:
+            _cache[key] = (now + ttl, dict(counts))
+
+
+def clear_cache():
+    """Forget the counts cached by ``count_many``"""
+    with _lock:
+        _cache.clear()
+
+
+__all__ = ["clear_cache"]
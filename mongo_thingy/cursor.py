@@ -1,4 +1,7 @@
 import functools
+import time
+
+from mongo_thingy import monitoring
 
 
 class _Proxy:
@@ -16,6 +19,9 @@ class _ChainingProxy(_Proxy):
         @functools.wraps(method)
         def wrapper(*args, **kwargs):
             method(*args, **kwargs)
+            if monitoring.listeners:
+                event = monitoring.ChainEvent(cursor, self.name, args, kwargs)
+                monitoring.publish_chained(event)
             return cursor
 
         return wrapper
@@ -27,7 +33,8 @@ class _BindingProxy(_Proxy):
 
         @functools.wraps(method)
         def wrapper(*args, **kwargs):
-            result = method(*args, **kwargs)
+            with cursor.monitor(self.name):
+                result = method(*args, **kwargs)
             return cursor.bind(result)
 
         return wrapper
@@ -39,7 +46,8 @@ class _AsyncBindingProxy(_Proxy):
 
         @functools.wraps(method)
         async def wrapper(*args, **kwargs):
-            result = await method(*args, **kwargs)
+            with cursor.monitor(self.name):
+                result = await method(*args, **kwargs)
             if isinstance(result, list):
                 return cursor.result_cls(cursor.bind(r) for r in result)
             return cursor.bind(result)
@@ -73,17 +81,35 @@ class BaseCursor:
     def bind(self, document):
         if not self.thingy_cls:
             return document
-        thingy = self.thingy_cls(document)
+        if monitoring.listeners:
+            return self._bind_monitored(document)
+        thingy = self.thingy_cls._from_document(document)
         if self.thingy_view is not None:
             return self.thingy_view(thingy)
         return thingy
 
+    def _bind_monitored(self, document):
+        event = monitoring.BindEvent(self, document)
+        start = time.perf_counter()
+        thingy = self.thingy_cls._from_document(document)
+        event.bind_duration = time.perf_counter() - start
+        if self.thingy_view is not None:
+            start = time.perf_counter()
+            thingy = self.thingy_view(thingy)
+            event.view_duration = time.perf_counter() - start
+        monitoring.publish_bound(event)
+        return thingy
+
     def clone(self):
         delegate = self.delegate.clone()
         return self.__class__(
             delegate, thingy_cls=self.thingy_cls, view=self.thingy_view
         )
 
+    def monitor(self, operation):
+        operation = f"cursor.{operation}"
+        return monitoring.operation(self.thingy_cls, operation, cursor=self)
+
     def get_view(self, name):
         return self.thingy_cls._views[name]
 
@@ -96,9 +122,18 @@ class Cursor(BaseCursor):
     next = __next__ = _BindingProxy("__next__")
 
     def __getitem__(self, index):
-        document = self.delegate.__getitem__(index)
+        with self.monitor("__getitem__"):
+            document = self.delegate.__getitem__(index)
         return self.bind(document)
 
+    def __iter__(self):
+        # Each iteration starts over, like the indexed iteration it replaces
+        delegate = monitoring.iterate(
+            self.delegate.clone(), self.thingy_cls, "cursor.__iter__", cursor=self
+        )
+        for document in delegate:
+            yield self.bind(document)
+
     def to_list(self, length):
         if length is not None:
             self.limit(length)
@@ -110,7 +145,8 @@ class Cursor(BaseCursor):
 
     def first(self):
         try:
-            document = self.delegate.clone().limit(-1).__next__()
+            with self.monitor("first"):
+                document = self.delegate.clone().limit(-1).__next__()
         except StopIteration:
             return None
         return self.bind(document)
@@ -121,7 +157,10 @@ class AsyncCursor(BaseCursor):
     next = __anext__ = _AsyncBindingProxy("__anext__")
 
     async def __aiter__(self):
-        async for document in self.delegate:
+        delegate = monitoring.aiterate(
+            self.delegate, self.thingy_cls, "cursor.__iter__", cursor=self
+        )
+        async for document in delegate:
             yield self.bind(document)
 
     async def delete(self):
@@ -130,7 +169,8 @@ class AsyncCursor(BaseCursor):
 
     async def first(self):
         try:
-            document = await self.delegate.clone().limit(-1).__anext__()
+            with self.monitor("first"):
+                document = await self.delegate.clone().limit(-1).__anext__()
         except StopAsyncIteration:
             return None
         return self.bind(document)
@@ -0,0 +1,220 @@
+import asyncio
+import functools
+import inspect
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+CHAINING_METHODS = (
+    "add_option",
+    "allow_disk_use",
+    "collation",
+    "comment",
+    "hint",
+    "max",
+    "max_await_time_ms",
+    "max_scan",
+    "max_time_ms",
+    "min",
+    "remove_option",
+    "rewind",
+    "skip",
+    "sort",
+    "where",
+)
+
+
+class _ExecutorProxy:
+    def __init__(self, client, delegate):
+        self.client = client
+        self.delegate = delegate
+
+    def __getattr__(self, name):
+        return self.client.wrap(getattr(self.delegate, name), method=True)
+
+    def __getitem__(self, name):
+        return self.client.wrap(self.delegate[name])
+
+    def __eq__(self, other):
+        if isinstance(other, _ExecutorProxy):
+            return self.delegate == other.delegate
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.delegate)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.delegate!r})"
+
+
+class ExecutorClient(_ExecutorProxy):
+    """An asynchronous client running a synchronous one in a thread pool
+
+    Use :func:`executor_client_cls` to get the client class of an
+    :class:`~mongo_thingy.AsyncThingy` running on a synchronous backend.
+    """
+
+    client_cls = None
+    max_workers = None
+    batch_size = 100
+
+    def __init__(self, *args, **kwargs):
+        delegate = self.client_cls(*args, **kwargs)
+        executor = ThreadPoolExecutor(self.max_workers, "mongo_thingy")
+        super().__init__(self, delegate)
+        self.executor = executor
+
+    async def run(self, function, *args, **kwargs):
+        """Run ``function`` in the thread pool, and return its result"""
+        loop = asyncio.get_running_loop()
+        call = functools.partial(function, *args, **kwargs)
+        return self.wrap(await loop.run_in_executor(self.executor, call))
+
+    def wrap(self, value, method=False):
+        if method and inspect.ismethod(value):
+            return self._wrap_method(value)
+        # Databases and collections build others on attribute access
+        cls = type(value)
+        if hasattr(cls, "insert_one"):
+            return ExecutorCollection(self, value)
+        if hasattr(cls, "get_collection") and not hasattr(cls, "get_database"):
+            return ExecutorDatabase(self, value)
+        return value
+
+    def _wrap_method(self, method):
+        @functools.wraps(method)
+        async def wrapper(*args, **kwargs):
+            return await self.run(method, *args, **kwargs)
+
+        return wrapper
+
+    def get_database(self, *args, **kwargs):
+        return self.wrap(self.delegate.get_database(*args, **kwargs))
+
+    def close(self):
+        self.delegate.close()
+        self.executor.shutdown(wait=False)
+
+
+class ExecutorDatabase(_ExecutorProxy):
+    def get_collection(self, *args, **kwargs):
+        return self.client.wrap(self.delegate.get_collection(*args, **kwargs))
+
+    def with_options(self, *args, **kwargs):
+        return self.client.wrap(self.delegate.with_options(*args, **kwargs))
+
+
+class ExecutorCollection(_ExecutorProxy):
+    @property
+    def database(self):
+        return self.client.wrap(self.delegate.database)
+
+    def with_options(self, *args, **kwargs):
+        return self.client.wrap(self.delegate.with_options(*args, **kwargs))
+
+    def find(self, *args, **kwargs):
+        return ExecutorCursor(self.client, self.delegate.find(*args, **kwargs))
+
+    def aggregate(self, *args, **kwargs):
+        factory = functools.partial(self.delegate.aggregate, *args, **kwargs)
+        return ExecutorCursor(self.client, factory=factory)
+
+    def list_indexes(self, *args, **kwargs):
+        factory = functools.partial(self.delegate.list_indexes, *args, **kwargs)
+        return ExecutorCursor(self.client, factory=factory)
+
+
+class ExecutorCursor(_ExecutorProxy):
+    """A cursor fetching its documents by batches, in the thread pool"""
+
+    def __init__(self, client, delegate=None, factory=None):
+        super().__init__(client, delegate)
+        self.factory = factory
+        self.buffer = deque()
+        self._batch_size = client.batch_size
+
+    def __getattr__(self, name):
+        if name in CHAINING_METHODS:
+            return self._wrap_chaining(getattr(self.delegate, name))
+        return super().__getattr__(name)
+
+    def _wrap_chaining(self, method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            method(*args, **kwargs)
+            return self
+
+        return wrapper
+
+    @property
+    def collection(self):
+        return self.client.wrap(self.delegate.collection)
+
+    def batch_size(self, batch_size):
+        self._batch_size = batch_size
+        self.delegate.batch_size(batch_size)
+        return self
+
+    def limit(self, limit):
+        self.delegate.limit(limit)
+        return self
+
+    def clone(self):
+        return ExecutorCursor(self.client, self.delegate.clone())
+
+    def _fetch(self, length):
+        if self.delegate is None:
+            self.delegate = self.factory()
+        return list(islice(self.delegate, length))
+
+    async def fetch(self):
+        batch = await self.client.run(self._fetch, self._batch_size)
+        self.buffer.extend(batch)
+        return bool(batch)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.buffer and not await self.fetch():
+            raise StopAsyncIteration
+        return self.buffer.popleft()
+
+    next = __anext__
+
+    async def to_list(self, length=None):
+        documents = list(self.buffer)
+        self.buffer.clear()
+        if length is None or len(documents) < length:
+            remaining = None if length is None else length - len(documents)
+            documents += await self.client.run(self._fetch, remaining)
+        elif len(documents) > length:
+            self.buffer.extend(documents[length:])
+            del documents[length:]
+        return documents
+
+
+def executor_client_cls(client_cls, max_workers=None, batch_size=100):
+    """Return an asynchronous client class running ``client_cls`` in threads
+
+    Collection and cursor operations run on a pool of ``max_workers`` threads,
+    and cursors fetch ``batch_size`` documents per hop:
+
+    >>> AsyncThingy.connect(":memory:", client_cls=executor_client_cls(MontyClient))
+    """
+    name = f"Executor{client_cls.__name__}"
+    attributes = {
+        "client_cls": client_cls,
+        "max_workers": max_workers,
+        "batch_size": batch_size,
+    }
+    return type(name, (ExecutorClient,), attributes)
+
+
+__all__ = [
+    "ExecutorClient",
+    "ExecutorCollection",
+    "ExecutorCursor",
+    "ExecutorDatabase",
+    "executor_client_cls",
+]
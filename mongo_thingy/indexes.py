@@ -0,0 +1,356 @@
+import hashlib
+import inspect
+import json
+import threading
+import weakref
+from collections.abc import Mapping
+
+from pymongo import ASCENDING, IndexModel
+
+from mongo_thingy import monitoring
+
+EQUALITY_OPERATORS = ("$eq", "$in")
+FILTER_OPERATIONS = (
+    "count_documents",
+    "delete_many",
+    "delete_one",
+    "distinct",
+    "find_one_and_replace",
+    "find_one_and_update",
+    "update_many",
+    "update_one",
+)
+
+advisor = None
+
+
+def get_index_keys(keys):
+    """Normalize an index specification into a tuple of (key, direction)"""
+    if isinstance(keys, str):
+        return ((keys, ASCENDING),)
+    if isinstance(keys, Mapping):
+        return tuple(keys.items())
+    return tuple(
+        (key, ASCENDING) if isinstance(key, str) else tuple(key) for key in keys
+    )
+
+
+def get_sort_keys(key_or_list, direction=None):
+    """Normalize the arguments of a sort, as PyMongo does"""
+    if key_or_list is None:
+        return ()
+    if isinstance(key_or_list, str):
+        return ((key_or_list, direction or ASCENDING),)
+    return get_index_keys(key_or_list)
+
+
+def list_indexes(thingy_cls):
+    """Return the index documents of the collection of a thingy"""
+    return list(thingy_cls.collection.list_indexes())
+
+
+async def async_list_indexes(thingy_cls):
+    """Return the index documents of the collection of an async thingy"""
+    indexes = thingy_cls.collection.list_indexes()
+    if inspect.isawaitable(indexes):
+        indexes = await indexes
+    if hasattr(indexes, "to_list"):
+        return await indexes.to_list(None)
+    return list(indexes)
+
+
+def get_index_models(thingy_cls):
+    """Return the indexes declared on a thingy, as :class:`~pymongo.IndexModel`"""
+    indexes = getattr(thingy_cls, "_indexes", [])
+    return [IndexModel(keys, **kwargs) for keys, kwargs in indexes]
+
+
+def get_missing_indexes(thingy_cls, indexes):
+    """Return the indexes declared on a thingy, but missing from ``indexes``
+
+    Indexes are compared by name: an existing index whose options changed is
+    not considered missing.
+    """
+    names = {index["name"] for index in indexes}
+    models = get_index_models(thingy_cls)
+    return [model for model in models if model.document["name"] not in names]
+
+
+def get_cache_key(thingy_cls):
+    return f"{thingy_cls.__module__}.{thingy_cls.__qualname__}"
+
+
+def get_spec_hash(thingy_cls):
+    """Return a hash of the collection and the indexes declared on a thingy"""
+    documents = [model.document for model in get_index_models(thingy_cls)]
+    spec = [thingy_cls.collection.full_name, documents]
+    spec = json.dumps(spec, sort_keys=True, default=str)
+    return hashlib.sha1(spec.encode()).hexdigest()
+
+
+class QueryShape:
+    """The fields of a query, classified by their role in an index"""
+
+    def __init__(self, thingy_cls, equality=(), sort=(), range=()):
+        self.thingy_cls = thingy_cls
+        self.equality = frozenset(equality)
+        self.sort = tuple(sort)
+        self.range = frozenset(range) - self.equality
+
+    @classmethod
+    def from_filter(cls, thingy_cls, filter, sort=()):
+        """Return the shapes of a filter, one per clause of its ``$or``"""
+        equality, range, alternatives = set(), set(), []
+        _classify(filter or {}, equality, range, alternatives)
+        shapes = [cls(thingy_cls, equality, sort, range)]
+        for clauses in alternatives:
+            shapes = [
+                cls(
+                    thingy_cls,
+                    shape.equality | clause.equality,
+                    sort,
+                    shape.range | clause.range,
+                )
+                for shape in shapes
+                for clause in cls.from_filters(thingy_cls, clauses)
+            ]
+        return shapes
+
+    @classmethod
+    def from_filters(cls, thingy_cls, filters):
+        return [shape for f in filters for shape in cls.from_filter(thingy_cls, f)]
+
+    @property
+    def key(self):
+        return (
+            self.thingy_cls,
+            tuple(sorted(self.equality)),
+            self.sort,
+            tuple(sorted(self.range)),
+        )
+
+    @property
+    def fields(self):
+        return self.equality | self.range | {key for key, _ in self.sort}
+
+    def is_usable(self, index_keys):
+        """Tell whether an index can be used at all by this query"""
+        return bool(index_keys) and index_keys[0][0] in self.fields
+
+    def is_supported(self, index_keys):
+        """Tell whether an index follows the equality-sort-range rule"""
+        index_keys = tuple(index_keys)
+        if index_keys == (("_id", ASCENDING),) and "_id" in self.equality:
+            return True
+
+        position = len(self.equality)
+        fields = [key for key, _ in index_keys]
+        if set(fields[:position]) != self.equality:
+            return False
+
+        sort = [(key, d) for key, d in self.sort if key not in self.equality]
+        if sort:
+            end = position + len(sort)
+            keys = list(index_keys[position:end])
+            if keys != sort and keys != [(key, -d) for key, d in sort]:
+                return False
+            position += len(sort)
+
+        if self.range:
+            return position < len(fields) and fields[position] in self.range
+        return True
+
+    def suggest(self):
+        """Return the keys of an index following the equality-sort-range rule"""
+        keys = [(key, ASCENDING) for key in sorted(self.equality)]
+        keys += [(key, d) for key, d in self.sort if key not in self.equality]
+        keys += [(key, ASCENDING) for key in sorted(self.range)]
+        return tuple(keys)
+
+    def to_dict(self):
+        return {
+            "thingy": self.thingy_cls.__name__,
+            "equality": sorted(self.equality),
+            "sort": [list(key) for key in self.sort],
+            "range": sorted(self.range),
+        }
+
+
+def _classify(filter, equality, range, alternatives):
+    for key, value in filter.items():
+        if key == "$and":
+            for clause in value:
+                _classify(clause, equality, range, alternatives)
+        elif key == "$or":
+            alternatives.append(value)
+        elif key.startswith("$"):
+            continue
+        elif (
+            isinstance(value, Mapping)
+            and value
+            and all(str(operator).startswith("$") for operator in value)
+        ):
+            if all(operator in EQUALITY_OPERATORS for operator in value):
+                equality.add(key)
+            else:
+                range.add(key)
+        else:
+            equality.add(key)
+
+
+class IndexReport:
+    def __init__(self, unindexed, suggestions, unused):
+        self.unindexed = unindexed
+        self.suggestions = suggestions
+        self.unused = unused
+
+    def to_dict(self):
+        return {
+            "unindexed": [
+                dict(shape.to_dict(), calls=calls) for shape, calls in self.unindexed
+            ],
+            "suggestions": [
+                {"thingy": thingy_cls.__name__, "keys": [list(k) for k in keys]}
+                for thingy_cls, keys in self.suggestions
+            ],
+            "unused": [
+                {"thingy": thingy_cls.__name__, "keys": [list(k) for k in keys]}
+                for thingy_cls, keys in self.unused
+            ],
+        }
+
+
+class IndexAdvisor(monitoring.OperationListener):
+    """Record the shapes of queries, and check them against indexes
+
+    Meant for tests and staging: the report lists the queries no index can
+    serve, suggests compound indexes following the equality-sort-range rule,
+    and lists the declared indexes (see
+    :meth:`~mongo_thingy.BaseThingy.add_index`) no query ever uses.
+    """
+
+    def __init__(self):
+        self.shapes = {}
+        self.calls = {}
+        self._cursors = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def record(self, thingy_cls, filter, sort=()):
+        with self._lock:
+            for shape in QueryShape.from_filter(thingy_cls, filter, sort):
+                if not shape.fields:
+                    continue
+                self.shapes.setdefault(shape.key, shape)
+                self.calls[shape.key] = self.calls.get(shape.key, 0) + 1
+
+    def succeeded(self, event):
+        if event.cursor is not None:
+            with self._lock:
+                pending = self._cursors.pop(event.cursor, None)
+            if pending is not None:
+                self.record(*pending)
+        elif event.operation == "find":
+            sort = get_sort_keys(event.kwargs.get("sort"))
+            with self._lock:
+                self._cursors[event.result] = [event.thingy_cls, event.filter, sort]
+        elif event.operation in FILTER_OPERATIONS:
+            sort = get_sort_keys(event.kwargs.get("sort"))
+            self.record(event.thingy_cls, event.filter, sort)
+
+    def chained(self, event):
+        if event.name != "sort":
+            return
+        with self._lock:
+            pending = self._cursors.get(event.cursor)
+            if pending is not None:
+                pending[2] = get_sort_keys(*event.args, **event.kwargs)
+
+    def get_declared_indexes(self, thingy_cls):
+        return [get_index_keys(keys) for keys, _ in getattr(thingy_cls, "_indexes", [])]
+
+    def report(self, live=True):
+        """Return an :class:`IndexReport` of the recorded queries
+
+        With ``live``, the indexes of the collections are checked as well:
+        use :meth:`async_report` for asynchronous thingies.
+        """
+        indexes = {}
+        for thingy_cls in self.get_classes():
+            indexes[thingy_cls] = self.get_declared_indexes(thingy_cls)
+            if live:
+                for index in list_indexes(thingy_cls):
+                    indexes[thingy_cls].append(get_index_keys(index["key"]))
+        return self.get_report(indexes)
+
+    async def async_report(self, live=True):
+        indexes = {}
+        for thingy_cls in self.get_classes():
+            indexes[thingy_cls] = self.get_declared_indexes(thingy_cls)
+            if live:
+                for index in await async_list_indexes(thingy_cls):
+                    indexes[thingy_cls].append(get_index_keys(index["key"]))
+        return self.get_report(indexes)
+
+    def get_classes(self):
+        with self._lock:
+            classes = [shape.thingy_cls for shape in self.shapes.values()]
+        return list(dict.fromkeys(classes))
+
+    def get_report(self, indexes):
+        with self._lock:
+            shapes = [(shape, self.calls[key]) for key, shape in self.shapes.items()]
+
+        unindexed, suggestions, used = [], {}, set()
+        for shape, calls in shapes:
+            candidates = [(("_id", ASCENDING),)] + indexes[shape.thingy_cls]
+            usable = [keys for keys in candidates if shape.is_usable(keys)]
+            used.update((shape.thingy_cls, keys) for keys in usable)
+            if not usable:
+                unindexed.append((shape, calls))
+            if not any(shape.is_supported(keys) for keys in usable):
+                suggestions.setdefault(shape.thingy_cls, set()).add(shape.suggest())
+
+        suggested = []
+        for thingy_cls, keys in suggestions.items():
+            for k in sorted(keys):
+                if not any(o != k and o[: len(k)] == k for o in keys):
+                    suggested.append((thingy_cls, k))
+
+        unused = []
+        for thingy_cls in indexes:
+            for keys in self.get_declared_indexes(thingy_cls):
+                if (thingy_cls, keys) not in used:
+                    unused.append((thingy_cls, keys))
+
+        return IndexReport(unindexed, suggested, unused)
+
+
+def enable(index_advisor=None):
+    """Start recording query shapes, and return the advisor"""
+    global advisor
+    disable()
+    advisor = monitoring.register(index_advisor or IndexAdvisor())
+    return advisor
+
+
+def disable():
+    """Stop recording query shapes"""
+    global advisor
+    if advisor is not None:
+        monitoring.unregister(advisor)
+    advisor = None
+
+
+__all__ = [
+    "IndexAdvisor",
+    "IndexReport",
+    "QueryShape",
+    "disable",
+    "enable",
+    "async_list_indexes",
+    "get_index_keys",
+    "get_index_models",
+    "get_missing_indexes",
+    "get_spec_hash",
+    "list_indexes",
+]
@@ -0,0 +1,243 @@
+import threading
+from bisect import bisect_left
+
+from mongo_thingy import monitoring
+
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+collector = None
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            yield bound, total
+
+    def to_dict(self):
+        return {
+            "buckets": dict(self.cumulative()),
+            "count": self.count,
+            "sum": self.sum,
+        }
+
+
+class OperationMetrics:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.calls = 0
+        self.errors = 0
+        self.documents = 0
+        self.bytes = 0
+        self.bind_time = 0.0
+        self.view_time = 0.0
+        self.latency = Histogram(buckets)
+
+    def to_dict(self):
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "documents": self.documents,
+            "bytes": self.bytes,
+            "bind_time": self.bind_time,
+            "view_time": self.view_time,
+            "latency": self.latency.to_dict(),
+        }
+
+
+class Metrics(monitoring.OperationListener):
+    """Collect per-class operation metrics, in process
+
+    Metrics are labeled by thingy class and operation, and can be dumped with
+    :meth:`snapshot` or scraped in the Prometheus text format with
+    :meth:`export`.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, prefix="mongo_thingy"):
+        self.buckets = buckets
+        self.prefix = prefix
+        self.operations = {}
+        self.counters = {}
+        self.gauges = {}
+        self._lock = threading.Lock()
+
+    def _get(self, thingy_cls, operation):
+        key = (_get_label(thingy_cls), operation)
+        try:
+            return self.operations[key]
+        except KeyError:
+            metrics = OperationMetrics(self.buckets)
+            return self.operations.setdefault(key, metrics)
+
+    def succeeded(self, event):
+        with self._lock:
+            metrics = self._get(event.thingy_cls, event.operation)
+            metrics.calls += 1
+            metrics.latency.observe(event.duration)
+            metrics.documents += event.documents
+            metrics.bytes += event.size
+
+    def failed(self, event):
+        with self._lock:
+            metrics = self._get(event.thingy_cls, event.operation)
+            metrics.calls += 1
+            metrics.errors += 1
+            metrics.latency.observe(event.duration)
+
+    def bound(self, event):
+        size = event.size
+        with self._lock:
+            metrics = self._get(event.thingy_cls, "bind")
+            metrics.calls += 1
+            metrics.latency.observe(event.bind_duration + event.view_duration)
+            metrics.documents += 1
+            metrics.bytes += size
+            metrics.bind_time += event.bind_duration
+            metrics.view_time += event.view_duration
+
+    def increment(self, thingy_cls, name, value=1):
+        key = (_get_label(thingy_cls), name)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, thingy_cls, name, value):
+        key = (_get_label(thingy_cls), name)
+        with self._lock:
+            self.gauges[key] = value
+
+    def reset(self):
+        with self._lock:
+            self.operations.clear()
+            self.counters.clear()
+            self.gauges.clear()
+
+    def snapshot(self):
+        """Return the collected metrics as a dict, grouped by class"""
+        snapshot = {}
+        with self._lock:
+            for (label, operation), metrics in self.operations.items():
+                operations = snapshot.setdefault(label, {}).setdefault("operations", {})
+                operations[operation] = metrics.to_dict()
+            for (label, name), value in self.counters.items():
+                snapshot.setdefault(label, {}).setdefault("counters", {})[name] = value
+            for (label, name), value in self.gauges.items():
+                snapshot.setdefault(label, {}).setdefault("gauges", {})[name] = value
+        return snapshot
+
+    def export(self):
+        """Return the collected metrics in the Prometheus text format"""
+        lines = []
+        prefix = self.prefix
+
+        def add(name, type, samples):
+            if not samples:
+                return
+            lines.append(f"# TYPE {prefix}_{name} {type}")
+            for suffix, labels, value in samples:
+                labels = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+                lines.append(f"{prefix}_{name}{suffix}{{{labels}}} {value}")
+
+        with self._lock:
+            operations = sorted(self.operations.items())
+            totals = {
+                "operations_total": "calls",
+                "operation_errors_total": "errors",
+                "documents_total": "documents",
+                "bytes_total": "bytes",
+                "bind_seconds_total": "bind_time",
+                "view_seconds_total": "view_time",
+            }
+            for name, attr in totals.items():
+                samples = []
+                for (label, operation), metrics in operations:
+                    labels = (("thingy", label), ("operation", operation))
+                    samples.append(("", labels, getattr(metrics, attr)))
+                add(name, "counter", samples)
+
+            samples = []
+            for (label, operation), metrics in operations:
+                labels = (("thingy", label), ("operation", operation))
+                for bound, count in metrics.latency.cumulative():
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    samples.append(("_bucket", labels + (("le", le),), count))
+                samples.append(("_sum", labels, metrics.latency.sum))
+                samples.append(("_count", labels, metrics.latency.count))
+            add("operation_duration_seconds", "histogram", samples)
+
+            for values, type, suffix in (
+                (self.counters, "counter", "_total"),
+                (self.gauges, "gauge", ""),
+            ):
+                names = {}
+                for (label, name), value in sorted(values.items()):
+                    sample = ("", (("thingy", label),), value)
+                    names.setdefault(name + suffix, []).append(sample)
+                for name, samples in names.items():
+                    add(name, type, samples)
+
+        return "\n".join(lines) + "\n"
+
+
+def _get_label(thingy_cls):
+    if thingy_cls is None:
+        return ""
+    return thingy_cls.__name__
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def enable(metrics=None):
+    """Start collecting metrics, and return the collector"""
+    global collector
+    disable()
+    collector = monitoring.register(metrics or Metrics())
+    return collector
+
+
+def disable():
+    """Stop collecting metrics"""
+    global collector
+    if collector is not None:
+        monitoring.unregister(collector)
+    collector = None
+
+
+def increment(thingy_cls, name, value=1):
+    if collector is not None:
+        collector.increment(thingy_cls, name, value)
+
+
+def set_gauge(thingy_cls, name, value):
+    if collector is not None:
+        collector.set_gauge(thingy_cls, name, value)
+
+
+__all__ = ["Histogram", "Metrics", "disable", "enable"]
@@ -0,0 +1,313 @@
+import functools
+import inspect
+import time
+from collections.abc import Mapping
+from contextlib import nullcontext
+from contextvars import ContextVar
+
+from bson import encode
+from bson.errors import InvalidDocument
+
+listeners = []
+
+_current = ContextVar("mongo_thingy_operation", default=None)
+_disabled = nullcontext()
+
+
+def register(listener):
+    """Register a listener notified of every thingy operation"""
+    if listener not in listeners:
+        listeners.append(listener)
+    return listener
+
+
+def unregister(listener):
+    try:
+        listeners.remove(listener)
+    except ValueError:
+        pass
+
+
+def get_size(document):
+    """Return the approximate BSON size of a document, in bytes"""
+    try:
+        return len(encode(document))
+    except (InvalidDocument, TypeError):
+        return 0
+
+
+class OperationListener:
+    """Base class for the listeners of thingies operations"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+    def bound(self, event):
+        pass
+
+    def chained(self, event):
+        pass
+
+
+class OperationEvent:
+    def __init__(
+        self, thingy_cls, operation, args=(), kwargs=None, thingy=None, cursor=None
+    ):
+        self.thingy_cls = thingy_cls
+        self.operation = operation
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.thingy = thingy
+        self.cursor = cursor
+        self.parent = _current.get()
+        self.duration = None
+        self.result = None
+        self.error = None
+
+    @property
+    def depth(self):
+        if self.parent is None:
+            return 0
+        return self.parent.depth + 1
+
+    @property
+    def filter(self):
+        if self.thingy is not None:
+            return {"_id": self.thingy.id}
+        args = self.args
+        if self.operation == "distinct":
+            args = args[1:]
+        if args:
+            filter = args[0]
+        else:
+            filter = self.kwargs.get("filter")
+        if filter is not None and not isinstance(filter, Mapping):
+            filter = {"_id": filter}
+        return filter
+
+    @property
+    def documents(self):
+        if self.operation.startswith("find_one_and_") and self.result is not None:
+            return 1
+        return 0
+
+    @property
+    def size(self):
+        if self.operation == "save":
+            return get_size(self.thingy.__dict__)
+        if self.documents:
+            return get_size(self.result.__dict__)
+        return 0
+
+
+class BindEvent:
+    def __init__(self, cursor, document):
+        self.cursor = cursor
+        self.thingy_cls = cursor.thingy_cls
+        self.document = document
+        self.bind_duration = 0
+        self.view_duration = 0
+
+    @property
+    def size(self):
+        return get_size(self.document)
+
+
+class ChainEvent:
+    def __init__(self, cursor, name, args=(), kwargs=None):
+        self.cursor = cursor
+        self.thingy_cls = cursor.thingy_cls
+        self.name = name
+        self.args = args
+        self.kwargs = kwargs or {}
+
+
+class Operation:
+    """Publish the events of an operation to the registered listeners"""
+
+    def __init__(self, *args, **kwargs):
+        self.event = OperationEvent(*args, **kwargs)
+        self.start = None
+
+    def __enter__(self):
+        self.started()
+        _current.set(self.event)
+        return self.event
+
+    def __exit__(self, type, error, traceback):
+        _current.set(self.event.parent)
+        if isinstance(error, (StopIteration, StopAsyncIteration)):
+            error = None
+        self.finish(error)
+
+    def started(self):
+        for listener in list(listeners):
+            listener.started(self.event)
+        self.start = time.perf_counter()
+
+    def finish(self, error=None, duration=None):
+        if duration is None:
+            duration = time.perf_counter() - self.start
+        self.event.duration = duration
+        if error is not None:
+            self.event.error = error
+            for listener in list(listeners):
+                listener.failed(self.event)
+        else:
+            for listener in list(listeners):
+                listener.succeeded(self.event)
+
+    async def wait(self, awaitable):
+        _current.set(self.event)
+        try:
+            self.event.result = await awaitable
+        except Exception as error:
+            self.finish(error)
+            raise
+        finally:
+            _current.set(self.event.parent)
+        self.finish()
+        return self.event.result
+
+
+def operation(thingy_cls, operation, args=(), kwargs=None, cursor=None):
+    """Return a context manager publishing an operation, if anyone listens"""
+    if not listeners:
+        return _disabled
+    return Operation(thingy_cls, operation, args, kwargs, cursor=cursor)
+
+
+def iterate(iterable, *args, **kwargs):
+    """Iterate, publishing the time spent fetching items as one operation"""
+    if not listeners:
+        return iterable
+    return _iterate(iter(iterable), Operation(*args, **kwargs))
+
+
+def _iterate(iterator, operation):
+    operation.started()
+    duration = 0
+    error = None
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                break
+            finally:
+                duration += time.perf_counter() - start
+            yield item
+    except Exception as exception:
+        error = exception
+        raise
+    finally:
+        operation.finish(error, duration)
+
+
+def aiterate(iterable, *args, **kwargs):
+    """Iterate asynchronously, publishing the time spent fetching items"""
+    if not listeners:
+        return iterable
+    return _aiterate(iterable.__aiter__(), Operation(*args, **kwargs))
+
+
+async def _aiterate(iterator, operation):
+    operation.started()
+    duration = 0
+    error = None
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = await iterator.__anext__()
+            except StopAsyncIteration:
+                break
+            finally:
+                duration += time.perf_counter() - start
+            yield item
+    except Exception as exception:
+        error = exception
+        raise
+    finally:
+        operation.finish(error, duration)
+
+
+def publish_bound(event):
+    for listener in list(listeners):
+        listener.bound(event)
+
+
+def publish_chained(event):
+    for listener in list(listeners):
+        listener.chained(event)
+
+
+def _get_owner(owner):
+    if isinstance(owner, type):
+        return owner, None
+    return type(owner), owner
+
+
+def instrument(function):
+    """Decorate a thingy method so that its calls are published to listeners
+
+    Methods may either return their result, a coroutine or an awaitable: the
+    operation then completes once the awaitable does.
+    """
+    operation = function.__name__
+
+    if inspect.iscoroutinefunction(function):
+
+        @functools.wraps(function)
+        async def wrapper(owner, *args, **kwargs):
+            if not listeners:
+                return await function(owner, *args, **kwargs)
+            thingy_cls, thingy = _get_owner(owner)
+            with Operation(thingy_cls, operation, args, kwargs, thingy) as event:
+                event.result = await function(owner, *args, **kwargs)
+            return event.result
+
+        return wrapper
+
+    @functools.wraps(function)
+    def wrapper(owner, *args, **kwargs):
+        if not listeners:
+            return function(owner, *args, **kwargs)
+        thingy_cls, thingy = _get_owner(owner)
+        context = Operation(thingy_cls, operation, args, kwargs, thingy)
+        context.__enter__()
+        try:
+            result = function(owner, *args, **kwargs)
+        except Exception as error:
+            context.__exit__(type(error), error, error.__traceback__)
+            raise
+        _current.set(context.event.parent)
+        if inspect.isawaitable(result):
+            return context.wait(result)
+        context.event.result = result
+        context.finish()
+        return result
+
+    return wrapper
+
+
+__all__ = [
+    "BindEvent",
+    "ChainEvent",
+    "Operation",
+    "OperationEvent",
+    "OperationListener",
+    "aiterate",
+    "instrument",
+    "iterate",
+    "operation",
+    "register",
+    "unregister",
+]
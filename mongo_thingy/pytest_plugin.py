@@ -0,0 +1,36 @@
+"""Pytest integration of :func:`mongo_thingy.query_budget`
+
+Enable it in a ``conftest.py`` with::
+
+    pytest_plugins = ["mongo_thingy.pytest_plugin"]
+
+then either use the ``query_budget`` fixture, or mark tests with
+``@pytest.mark.query_budget(max_round_trips=3)``. The marker needs pluggy 1.2
+or later.
+"""
+
+import pytest
+
+from mongo_thingy.budget import query_budget as _query_budget
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers", "query_budget: fail a test issuing too many database round trips"
+    )
+
+
+@pytest.hookimpl(wrapper=True)
+def pytest_runtest_call(item):
+    marker = item.get_closest_marker("query_budget")
+    if marker is None:
+        return (yield)
+    # Exceeding the budget fails the test call itself, not the hook teardown
+    with _query_budget(*marker.args, **marker.kwargs):
+        return (yield)
+
+
+@pytest.fixture
+def query_budget():
+    """Return :func:`mongo_thingy.query_budget`"""
+    return _query_budget
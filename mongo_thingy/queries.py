@@ -0,0 +1,314 @@
+import asyncio
+import inspect
+import json
+import logging
+import math
+import threading
+import weakref
+from collections import deque
+from collections.abc import Mapping
+
+from mongo_thingy import monitoring
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER = "?"
+LOGICAL_OPERATORS = ("$and", "$or", "$nor")
+QUERY_OPERATIONS = (
+    "count_documents",
+    "delete_many",
+    "delete_one",
+    "distinct",
+    "find",
+    "find_one",
+    "find_one_and_replace",
+    "find_one_and_update",
+    "update_many",
+    "update_one",
+)
+
+stats = None
+
+
+def get_shape(filter):
+    """Return the shape of a filter: its keys and operators, without values"""
+    if not filter:
+        return {}
+    shape = {}
+    for key, value in filter.items():
+        if key in LOGICAL_OPERATORS and isinstance(value, (list, tuple)):
+            shape[key] = [get_shape(clause) for clause in value]
+        else:
+            shape[key] = _get_value_shape(value)
+    return dict(sorted(shape.items()))
+
+
+def _get_value_shape(value):
+    if not isinstance(value, Mapping) or not value:
+        return PLACEHOLDER
+    if not all(str(key).startswith("$") for key in value):
+        return PLACEHOLDER
+    shape = {}
+    for operator, operand in value.items():
+        if operator == "$elemMatch" and isinstance(operand, Mapping):
+            shape[operator] = get_shape(operand)
+        elif operator == "$not":
+            shape[operator] = _get_value_shape(operand)
+        else:
+            shape[operator] = PLACEHOLDER
+    return dict(sorted(shape.items()))
+
+
+def get_fingerprint(filter):
+    """Return a normalized string identifying the shape of a filter"""
+    return json.dumps(get_shape(filter), sort_keys=True)
+
+
+def get_stages(plan):
+    """Yield the name of every stage of a query plan"""
+    if isinstance(plan, Mapping):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from get_stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from get_stages(value)
+
+
+def get_winning_plan(explanation):
+    planner = explanation.get("queryPlanner", {})
+    plan = planner.get("winningPlan", {})
+    return plan.get("queryPlan", plan)
+
+
+class QueryStatistics:
+    """Aggregated statistics of the queries sharing a fingerprint"""
+
+    def __init__(self, thingy_cls, operation, filter, samples=1000):
+        self.thingy_cls = thingy_cls
+        self.operation = operation
+        self.shape = get_shape(filter)
+        self.fingerprint = json.dumps(self.shape, sort_keys=True)
+        self.calls = 0
+        self.errors = 0
+        self.slow_calls = 0
+        self.documents = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.observed = 0
+        self.samples = deque(maxlen=samples)
+        self.explained = False
+        self.plan = None
+        self.explain_error = None
+
+    def observe(self, duration):
+        self.total_time += duration
+        self.observed += 1
+        self.max_time = max(self.max_time, duration)
+        self.samples.append(duration)
+
+    def get_percentile(self, percent):
+        if not self.samples:
+            return 0.0
+        samples = sorted(self.samples)
+        rank = math.ceil(percent / 100 * len(samples))
+        return samples[max(rank, 1) - 1]
+
+    @property
+    def mean_time(self):
+        if not self.observed:
+            return 0.0
+        return self.total_time / self.observed
+
+    @property
+    def p99_time(self):
+        return self.get_percentile(99)
+
+    @property
+    def stages(self):
+        return list(get_stages(self.plan))
+
+    @property
+    def collscan(self):
+        return "COLLSCAN" in self.stages
+
+    @property
+    def in_memory_sort(self):
+        return "SORT" in self.stages
+
+    def set_explanation(self, explanation):
+        self.plan = get_winning_plan(explanation)
+
+    def to_dict(self):
+        return {
+            "thingy": self.thingy_cls.__name__,
+            "operation": self.operation,
+            "fingerprint": self.fingerprint,
+            "calls": self.calls,
+            "errors": self.errors,
+            "slow_calls": self.slow_calls,
+            "documents": self.documents,
+            "total_time": self.total_time,
+            "mean_time": self.mean_time,
+            "p99_time": self.p99_time,
+            "max_time": self.max_time,
+            "plan": self.plan,
+            "collscan": self.collscan,
+            "in_memory_sort": self.in_memory_sort,
+        }
+
+
+class QueryStats(monitoring.OperationListener):
+    """Aggregate statistics per query fingerprint, like pg_stat_statements
+
+    Queries slower than ``slow_threshold`` seconds are logged, and the winning
+    plan of their fingerprint is captured once with ``explain()``.
+
+    The latency of :meth:`~mongo_thingy.Thingy.find` is the time spent
+    fetching documents from its cursor, and its documents are the ones bound.
+    """
+
+    def __init__(self, slow_threshold=0.1, explain=True, samples=1000):
+        self.slow_threshold = slow_threshold
+        self.explain = explain
+        self.samples = samples
+        self.statistics = {}
+        self._cursors = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _get(self, event):
+        if event.operation not in QUERY_OPERATIONS:
+            return None
+        if event.parent is not None and event.parent.operation in QUERY_OPERATIONS:
+            return None
+        filter = event.filter
+        key = (event.thingy_cls, event.operation, get_fingerprint(filter))
+        try:
+            return self.statistics[key]
+        except KeyError:
+            statistics = QueryStatistics(
+                event.thingy_cls, event.operation, filter, self.samples
+            )
+            return self.statistics.setdefault(key, statistics)
+
+    def succeeded(self, event):
+        cursor = event.cursor
+        with self._lock:
+            if cursor is not None:
+                statistics = self._cursors.get(cursor)
+                if statistics is None:
+                    return
+            else:
+                statistics = self._get(event)
+                if statistics is None:
+                    return
+                statistics.calls += 1
+                if event.operation == "find":
+                    self._cursors[event.result] = statistics
+                    return
+                if event.operation == "find_one" and event.result is not None:
+                    statistics.documents += 1
+                statistics.documents += event.documents
+            statistics.observe(event.duration)
+        if event.duration >= self.slow_threshold:
+            self.slow(statistics, event)
+
+    def failed(self, event):
+        with self._lock:
+            statistics = self._get(event)
+            if statistics is not None:
+                statistics.calls += 1
+                statistics.errors += 1
+
+    def bound(self, event):
+        with self._lock:
+            statistics = self._cursors.get(event.cursor)
+            if statistics is not None:
+                statistics.documents += 1
+
+    def slow(self, statistics, event):
+        with self._lock:
+            statistics.slow_calls += 1
+            explain = self.explain and not statistics.explained
+            statistics.explained = True
+        logger.warning(
+            "Slow %s on %s (%.1f ms): %s",
+            statistics.operation,
+            statistics.thingy_cls.__name__,
+            event.duration * 1000,
+            statistics.fingerprint,
+        )
+        if explain:
+            self.capture_plan(statistics, event)
+
+    def get_explanation(self, statistics, event):
+        if event.cursor is not None:
+            return event.cursor.delegate.clone().explain()
+        return event.thingy_cls.collection.find(event.filter or {}).explain()
+
+    def capture_plan(self, statistics, event):
+        def set_explanation(explanation):
+            try:
+                statistics.set_explanation(explanation)
+            except Exception as error:
+                statistics.explain_error = error
+
+        try:
+            explanation = self.get_explanation(statistics, event)
+        except Exception as error:
+            statistics.explain_error = error
+            return
+
+        if not inspect.isawaitable(explanation):
+            return set_explanation(explanation)
+
+        def done(future):
+            if future.exception() is not None:
+                statistics.explain_error = future.exception()
+            else:
+                set_explanation(future.result())
+
+        asyncio.ensure_future(explanation).add_done_callback(done)
+
+    def report(self, thingy_cls=None, operation=None, order_by="total_time"):
+        """Return the statistics, the most expensive first"""
+        with self._lock:
+            statistics = list(self.statistics.values())
+        if thingy_cls is not None:
+            statistics = [s for s in statistics if s.thingy_cls is thingy_cls]
+        if operation is not None:
+            statistics = [s for s in statistics if s.operation == operation]
+        statistics.sort(key=lambda s: getattr(s, order_by), reverse=True)
+        return statistics
+
+    def reset(self):
+        with self._lock:
+            self.statistics.clear()
+            self._cursors.clear()
+
+
+def enable(query_stats=None, **kwargs):
+    """Start aggregating query statistics, and return the aggregator"""
+    global stats
+    disable()
+    stats = monitoring.register(query_stats or QueryStats(**kwargs))
+    return stats
+
+
+def disable():
+    """Stop aggregating query statistics"""
+    global stats
+    if stats is not None:
+        monitoring.unregister(stats)
+    stats = None
+
+
+__all__ = [
+    "QueryStatistics",
+    "QueryStats",
+    "disable",
+    "enable",
+    "get_fingerprint",
+    "get_shape",
+]
@@ -0,0 +1,137 @@
+import threading
+import weakref
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from pymongo import ReadPreference
+
+from mongo_thingy.connection import gather, register_after_fork
+
+_primary = ContextVar("mongo_thingy_primary", default=False)
+_tenant = ContextVar("mongo_thingy_tenant", default=None)
+_collections = {}
+_clients = {}
+_handles = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def get_read_preference(thingy_cls, read_preference=None):
+    """Return the read preference of a read on a thingy, if it has one"""
+    if read_preference is None:
+        read_preference = thingy_cls._read_preference
+    if read_preference is not None and _primary.get():
+        return ReadPreference.PRIMARY
+    return read_preference
+
+
+def with_read_preference(collection, read_preference):
+    """Return a copy of a collection using a read preference, built once"""
+    key = (collection.full_name, repr(read_preference))
+    cached = _collections.get(key)
+    if cached is not None and cached[0] == collection:
+        return cached[1]
+    derived = collection.with_options(read_preference=read_preference)
+    _collections[key] = (collection, derived)
+    return derived
+
+
+@contextmanager
+def read_your_writes():
+    """Send the reads of the scope to the primary, to read its own writes
+
+    Only the reads routed elsewhere with a read preference are affected.
+    """
+    token = _primary.set(True)
+    try:
+        yield
+    finally:
+        _primary.reset(token)
+
+
+@contextmanager
+def tenant(database_name, uri=None):
+    """Route the thingies of the scope to the database of a tenant
+
+    Without ``uri``, the database is found on the client of each class.
+    Otherwise, the clients are shared by all the tenants of a cluster.
+    """
+    token = _tenant.set((database_name, uri))
+    try:
+        yield
+    finally:
+        _tenant.reset(token)
+
+
+def get_route(thingy_cls):
+    """Return the tenant a thingy is routed to in the current scope, if any"""
+    route = _tenant.get()
+    if route is None or not thingy_cls._tenanted:
+        return None
+    if thingy_cls._collection is not None:
+        return None
+    return route
+
+
+def get_client(client_cls, uri):
+    """Return the client of a cluster, created once"""
+    key = (client_cls, uri)
+    try:
+        return _clients[key]
+    except KeyError:
+        pass
+    with _lock:
+        if key not in _clients:
+            _clients[key] = client_cls(uri)
+        return _clients[key]
+
+
+def get_handles(thingy_cls, route):
+    """Return the database and collection of a thingy for a tenant, built once"""
+    try:
+        return _handles[thingy_cls][route]
+    except KeyError:
+        pass
+    database = thingy_cls._get_tenant_database(*route)
+    collection = thingy_cls._get_table(database, thingy_cls.collection_name)
+    with _lock:
+        handles = _handles.setdefault(thingy_cls, {})
+        return handles.setdefault(route, (database, collection))
+
+
+def clear():
+    """Forget the database and collection handles built for tenants"""
+    with _lock:
+        _handles.clear()
+        _collections.clear()
+
+
+@register_after_fork
+def _forget_clients():
+    global _lock
+    _lock = threading.Lock()
+    # The clients of the parent process can't be used, nor closed
+    _clients.clear()
+    clear()
+
+
+def close_clients():
+    """Close the clients of the clusters tenants were routed to
+
+    Return an awaitable if closing any of them is.
+    """
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    clear()
+    return gather(*[client.close() for client in clients])
+
+
+__all__ = [
+    "clear",
+    "close_clients",
+    "get_client",
+    "get_read_preference",
+    "read_your_writes",
+    "tenant",
+    "with_read_preference",
+]
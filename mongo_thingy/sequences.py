@@ -0,0 +1,139 @@
+import asyncio
+import threading
+
+from mongo_thingy import AsyncThingy, BaseThingy, Thingy
+from mongo_thingy.connection import register_after_fork
+
+_blocks = {}
+_lock = threading.Lock()
+
+
+class Block:
+    """Ids reserved by a process, and handed out locally"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reserving = threading.Lock()
+        self.async_reserving = None
+        self.next = 1
+        self.last = 0
+
+    def take(self):
+        with self.lock:
+            if self.next > self.last:
+                return None
+            self.next += 1
+            return self.next - 1
+
+    def extend(self, last, size):
+        with self.lock:
+            self.next = last - size + 2
+            self.last = last
+        return last - size + 1
+
+
+def get_block(sequence_cls, name):
+    key = (sequence_cls.get_collection().full_name, name)
+    try:
+        return _blocks[key]
+    except KeyError:
+        pass
+    with _lock:
+        return _blocks.setdefault(key, Block())
+
+
+class BaseSequence(BaseThingy):
+    """Sequence of integer ids, holding the last id reserved"""
+
+    _collection_name = "sequence"
+
+
+class Sequence(Thingy, BaseSequence):
+    @classmethod
+    def reserve(cls, name, size):
+        """Reserve ``size`` ids, and return the last one"""
+        update = {"$inc": {"value": size}}
+        return cls.find_one_and_update(name, update, upsert=True).value
+
+
+class AsyncSequence(AsyncThingy, BaseSequence):
+    @classmethod
+    async def reserve(cls, name, size):
+        """Reserve ``size`` ids, and return the last one"""
+        update = {"$inc": {"value": size}}
+        return (await cls.find_one_and_update(name, update, upsert=True)).value
+
+
+class BaseSequential:
+    """Mixin assigning sequential integer ids to the documents saved without one
+
+    Ids are reserved by blocks of ``_block_size``, with a single round trip to
+    the sequence collection, then handed out locally. Ids are unique, but the
+    ones of concurrent processes interleave, and ids left in a block when a
+    process exits are skipped.
+    """
+
+    _sequence_cls = None
+    _sequence_name = None
+    _block_size = 100
+
+    @classmethod
+    def get_sequence_name(cls):
+        return cls._sequence_name or cls.get_collection().name
+
+
+class Sequential(BaseSequential):
+    _sequence_cls = Sequence
+
+    @classmethod
+    def get_next_id(cls):
+        name = cls.get_sequence_name()
+        block = get_block(cls._sequence_cls, name)
+        id = block.take()
+        if id is None:
+            with block.reserving:
+                id = block.take()
+                if id is None:
+                    last = cls._sequence_cls.reserve(name, cls._block_size)
+                    id = block.extend(last, cls._block_size)
+        return id
+
+    def save(self, *args, **kwargs):
+        if self.id is None:
+            self._id = self.get_next_id()
+        return super(Sequential, self).save(*args, **kwargs)
+
+
+class AsyncSequential(BaseSequential):
+    _sequence_cls = AsyncSequence
+
+    @classmethod
+    async def get_next_id(cls):
+        name = cls.get_sequence_name()
+        block = get_block(cls._sequence_cls, name)
+        id = block.take()
+        if id is None:
+            if block.async_reserving is None:
+                block.async_reserving = asyncio.Lock()
+            async with block.async_reserving:
+                id = block.take()
+                if id is None:
+                    last = await cls._sequence_cls.reserve(name, cls._block_size)
+                    id = block.extend(last, cls._block_size)
+        return id
+
+    async def save(self, *args, **kwargs):
+        if self.id is None:
+            self._id = await self.get_next_id()
+        return await super(AsyncSequential, self).save(*args, **kwargs)
+
+
+@register_after_fork
+def _forget_blocks():
+    global _lock
+    _lock = threading.Lock()
+    # The ids reserved by the parent process are handed out by the parent
+    _blocks.clear()
+
+
+__all__ = ["AsyncSequence", "AsyncSequential", "Sequence", "Sequential"]
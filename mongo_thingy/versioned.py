@@ -1,27 +1,330 @@
+import asyncio
+import inspect
+import time
 import warnings
-from datetime import datetime
+from collections.abc import Mapping
+from datetime import datetime, timezone
+from itertools import groupby, islice
+from operator import itemgetter
 
-from pymongo import ASCENDING, DESCENDING
+from bson import ObjectId
+from pymongo import (
+    ASCENDING,
+    DESCENDING,
+    DeleteMany,
+    DeleteOne,
+    ReplaceOne,
+    ReturnDocument,
+    UpdateOne,
+)
 
-from mongo_thingy import AsyncThingy, BaseThingy, Thingy
-from mongo_thingy.cursor import AsyncCursor, BaseCursor, Cursor
+from mongo_thingy import AsyncThingy, BaseThingy, Thingy, metrics, monitoring
+from mongo_thingy.camelcase import uncamelize
+from mongo_thingy.cursor import AsyncCursor, BaseCursor, Cursor, _AsyncBindingProxy
+from mongo_thingy.write_behind import AsyncWriteBehind, BaseWriteBehind, WriteBehind
+
+_partitions = {}
+
+
+def get_operation(result):
+    """Tell whether a document write created the document, or updated it"""
+    if hasattr(result, "inserted_id") or result.upserted_id is not None:
+        return "create"
+    return "update"
+
+
+def get_delta(before, after):
+    """Return the top-level fields set and unset from ``before`` to ``after``"""
+    delta = {}
+    changed = {k: v for k, v in after.items() if k not in before or before[k] != v}
+    if changed:
+        delta["set"] = changed
+    unset = [k for k in before if k not in after]
+    if unset:
+        delta["unset"] = unset
+    return delta
+
+
+def apply_delta(document, delta):
+    """Return a copy of ``document`` with a delta of :func:`get_delta` applied"""
+    document = dict(document)
+    document.update(delta.get("set", {}))
+    for key in delta.get("unset", []):
+        document.pop(key, None)
+    return document
+
+
+def rebuild(revisions):
+    """Return a document from its snapshot revision, and the deltas after it"""
+    document = {}
+    for revision in revisions:
+        if "document" in revision:
+            document = revision["document"]
+        elif "delta" in revision:
+            document = apply_delta(document, revision["delta"])
+    return document
+
+
+def get_utc(when):
+    """Return ``when`` as a naive UTC datetime, like revision creation dates"""
+    if when.tzinfo is None:
+        return when
+    return when.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def get_batches(iterable, size):
+    iterator = iter(iterable)
+    batch = list(islice(iterator, size))
+    while batch:
+        yield batch
+        batch = list(islice(iterator, size))
+
+
+async def get_async_batches(iterable, size):
+    if not hasattr(iterable, "__aiter__"):
+        for batch in get_batches(iterable, size):
+            yield batch
+        return
+    batch = []
+    async for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def get_states(revisions, chains):
+    """Return the ``(document_id, document)`` of last revisions, ``None`` if deleted
+
+    ``chains`` are the revisions needed to rebuild the delta ones, by ``_id``.
+    """
+    by_document = {}
+    for revision in chains:
+        by_document.setdefault(revision["document_id"], []).append(revision)
+
+    states = []
+    for revision in revisions:
+        document_id = revision["document_id"]
+        if revision["operation"] == "delete":
+            document = None
+        elif "delta" in revision:
+            document = rebuild(by_document.get(document_id, []))
+            document = apply_delta(document, revision["delta"])
+        else:
+            document = revision["document"]
+        states.append((document_id, document))
+    return states
+
+
+def get_creation_date(revision):
+    date = revision.get("creation_date")
+    if date is None:
+        date = revision["_id"].generation_time.replace(tzinfo=None)
+    return date
+
+
+def get_period(date, thinning):
+    """Return the day or the week of ``date``, for a ``daily`` or ``weekly`` thinning"""
+    if thinning == "daily":
+        return date.date()
+    if thinning == "weekly":
+        return tuple(date.isocalendar()[:2])
+    raise ValueError(f"Unknown thinning {thinning!r}, use 'daily' or 'weekly'")
+
+
+def get_kept(revisions, keep=None, max_age=None, thinning=None, now=None):
+    """Return the indexes of the revisions of a document kept by a retention policy
+
+    A revision is kept if it is one of the ``keep`` last ones, if it is newer
+    than ``max_age``, or if it is the last one of its day or week. The last
+    revision is always kept, and all of them without any policy.
+    """
+    if keep is None and max_age is None and thinning is None:
+        return set(range(len(revisions)))
+
+    kept = {len(revisions) - 1}
+    if keep is not None:
+        kept.update(range(max(len(revisions) - keep, 0), len(revisions)))
+    if max_age is not None or thinning is not None:
+        now = now or datetime.utcnow()
+        periods = {}
+        for i, revision in enumerate(revisions):
+            date = get_creation_date(revision)
+            if max_age is not None and date > now - max_age:
+                kept.add(i)
+            if thinning is not None:
+                periods[get_period(date, thinning)] = i
+        kept.update(periods.values())
+    return kept
+
+
+def get_compaction(revisions, kept):
+    """Return the revisions to delete, and the documents of the ones to squash
+
+    Delta revisions whose chain loses a revision are squashed into snapshots.
+    """
+    deleted, squashed = [], {}
+    document, is_broken = {}, False
+    for i, revision in enumerate(revisions):
+        if "document" in revision:
+            document = revision["document"]
+        elif "delta" in revision:
+            document = apply_delta(document, revision["delta"])
+
+        if i not in kept:
+            deleted.append(revision)
+            is_broken = True
+        elif "delta" not in revision:
+            is_broken = False
+        elif is_broken:
+            squashed[revision["_id"]] = document
+            is_broken = False
+    return deleted, squashed
+
+
+class Compaction:
+    """Revisions of a versioned class to delete or squash, taken by batches"""
+
+    def __init__(self, thingy_cls, now=None):
+        self.thingy_cls = thingy_cls
+        self.now = now or datetime.utcnow()
+        self.deleted = []
+        self.squashed = []
+        self.stats = {"documents": 0, "revisions": 0, "deleted": 0, "squashed": 0}
+
+    @property
+    def size(self):
+        return len(self.deleted) + len(self.squashed)
+
+    def get_cursor(self, collection):
+        cls = self.thingy_cls
+        filter = cls.get_revision_cls().get_type_filter(cls.__name__)
+        sort = [("document_id", ASCENDING), ("_id", ASCENDING)]
+        return collection.find(filter).sort(sort)
+
+    def add(self, revisions):
+        cls = self.thingy_cls
+        kept = get_kept(
+            revisions,
+            keep=cls._keep_revisions,
+            max_age=cls._keep_revisions_for,
+            thinning=cls._thin_revisions,
+            now=self.now,
+        )
+        deleted, squashed = get_compaction(revisions, kept)
+        self.deleted.extend(deleted)
+        self.squashed.extend(squashed.items())
+        self.stats["documents"] += 1
+        self.stats["revisions"] += len(revisions)
+        metrics.increment(cls, "revision_compaction_scanned", len(revisions))
+
+    def take(self, limit):
+        # Squashes are written before the deletions breaking their chains
+        squashed = self.squashed[:limit]
+        del self.squashed[:limit]
+        deleted = self.deleted[: limit - len(squashed)]
+        del self.deleted[: len(deleted)]
+        return deleted, squashed
+
+    def get_requests(self, deleted, squashed):
+        unset = {"delta": "", "depth": "", "snapshot_id": ""}
+        requests = [
+            UpdateOne({"_id": id}, {"$set": {"document": document}, "$unset": unset})
+            for id, document in squashed
+        ]
+        if deleted:
+            ids = [revision["_id"] for revision in deleted]
+            requests.append(DeleteMany({"_id": {"$in": ids}}))
+        return requests
+
+    def get_archive_requests(self, deleted):
+        return [ReplaceOne({"_id": r["_id"]}, r, upsert=True) for r in deleted]
+
+    def written(self, deleted, squashed):
+        cls = self.thingy_cls
+        self.stats["deleted"] += len(deleted)
+        self.stats["squashed"] += len(squashed)
+        metrics.increment(cls, "revision_compaction_deleted", len(deleted))
+        metrics.increment(cls, "revision_compaction_squashed", len(squashed))
+        metrics.set_gauge(cls, "revision_compaction_documents", self.stats["documents"])
 
 
 class BaseRevisionCursor(BaseCursor):
     def __init__(self, *args, **kwargs):
         super(BaseRevisionCursor, self).__init__(*args, **kwargs)
+        self._previous = None
+
+    def _get_base(self, revision):
+        """Return the document of the previous revision, if just bound"""
+        previous = self._previous
+        if (
+            previous is not None
+            and previous.document_id == revision.document_id
+            and previous.document_type == revision.document_type
+            and (previous.snapshot_id or previous.id) == revision.snapshot_id
+            and (previous.depth or 0) == revision.depth - 1
+        ):
+            return previous.document
+
+    def _follow(self, revision):
+        if isinstance(revision, BaseRevision):
+            self._previous = revision if revision.document is not None else None
 
 
 class RevisionCursor(Cursor, BaseRevisionCursor):
     def __getitem__(self, index):
-        if index < 0 and self.thingy:
-            version = self.thingy.count_revisions()
-            index = version + index
+        if index < 0:
+            return self.clone().sort("_id", DESCENDING)[-index - 1]
         return super(RevisionCursor, self).__getitem__(index)
 
+    def bind(self, document):
+        revision = super(RevisionCursor, self).bind(document)
+        if isinstance(revision, BaseRevision) and revision.delta is not None:
+            base = self._get_base(revision)
+            if base is None:
+                revision.resolve()
+            else:
+                revision.resolve_from(base)
+        self._follow(revision)
+        return revision
+
 
 class AsyncRevisionCursor(AsyncCursor, BaseRevisionCursor):
-    pass
+    _anext = _AsyncBindingProxy("__anext__")
+    _to_list = _AsyncBindingProxy("to_list")
+
+    async def _resolve(self, revision):
+        if isinstance(revision, BaseRevision) and revision.delta is not None:
+            base = self._get_base(revision)
+            if base is None:
+                await revision.resolve()
+            else:
+                revision.resolve_from(base)
+        self._follow(revision)
+        return revision
+
+    async def __aiter__(self):
+        async for revision in super(AsyncRevisionCursor, self).__aiter__():
+            yield await self._resolve(revision)
+
+    async def __anext__(self):
+        return await self._resolve(await self._anext())
+
+    next = __anext__
+
+    async def to_list(self, length):
+        revisions = await self._to_list(length)
+        for revision in revisions:
+            await self._resolve(revision)
+        return revisions
+
+    async def first(self):
+        revision = await super(AsyncRevisionCursor, self).first()
+        if revision is not None:
+            await self._resolve(revision)
+        return revision
 
 
 class BaseRevision(BaseThingy):
@@ -29,9 +332,42 @@ class BaseRevision(BaseThingy):
 
     _collection_name = "revision"
     _cursor_cls = None
+    _document_type = None
+
+    @classmethod
+    def get_partition_cls(cls, name, document_type=None):
+        """Return the revision class of the ``<collection>_<name>`` collection
+
+        With a ``document_type``, the collection only holds revisions of that
+        type, which are then not filtered, nor indexed, by type. A collection
+        is either shared or typed, so a partition name can't be both.
+        """
+        key = (cls, name, document_type)
+        try:
+            return _partitions[key]
+        except KeyError:
+            pass
+
+        for other_cls, other_name, other_type in list(_partitions):
+            if other_cls is cls and other_name == name:
+                owner = other_type or "a group of classes"
+                raise ValueError(f"Revision partition {name!r} is used by {owner}")
+
+        attrs = {
+            "_collection": None,
+            "_collection_name": f"{cls.get_table_name()}_{name}",
+            "_document_type": document_type,
+            "_indexes": [],
+        }
+        partition_cls = type(cls)(cls.__name__, (cls,), attrs)
+        keys = [("document_id", ASCENDING), ("_id", ASCENDING)]
+        if document_type is None:
+            keys.insert(1, ("document_type", ASCENDING))
+        partition_cls.add_index(keys)
+        return _partitions.setdefault(key, partition_cls)
 
     @classmethod
-    def from_thingy(cls, thingy, author=None, operation="update"):
+    def from_thingy(cls, thingy, author=None, operation="update", number=None):
         version = cls(
             document_id=thingy.id,
             document_type=type(thingy).__name__,
@@ -41,58 +377,357 @@ class BaseRevision(BaseThingy):
             version.document = thingy.__dict__
         if author:
             version.author = author
+        if number is not None:
+            version.number = number
         return version
 
-    def _prev(self):
-        return self.find_one(
-            {"document_id": self.document_id, "document_type": self.document_type}
-        )
+    @classmethod
+    def get_type_filter(cls, document_type):
+        if cls._document_type is not None:
+            return {}
+        return {"document_type": document_type}
+
+    @classmethod
+    def get_filter(cls, thingy):
+        filter = {"document_id": thingy.id}
+        filter.update(cls.get_type_filter(type(thingy).__name__))
+        return filter
+
+    def get_chain_filter(self):
+        filter = {"document_id": self.document_id}
+        filter.update(self.get_type_filter(self.document_type))
+        filter["_id"] = {"$gte": self.snapshot_id, "$lt": self.id}
+        return filter
+
+    def set_delta(self, before, chain):
+        """Store the changes from ``before``, unless the revision starts a chain"""
+        if before is None or not chain["depth"]:
+            return
+        self.delta = get_delta(before, self.document)
+        self.depth = chain["depth"]
+        self.snapshot_id = chain["snapshot_id"]
+        del self.document
+
+    def resolve_from(self, document):
+        self.document = apply_delta(document, self.delta)
 
 
-BaseRevision.add_index([("document_id", DESCENDING), ("document_type", DESCENDING)])
+BaseRevision.add_index(
+    [("document_id", ASCENDING), ("document_type", ASCENDING), ("_id", ASCENDING)]
+)
 
 
 class Revision(Thingy, BaseRevision):
     _cursor_cls = RevisionCursor
 
+    @classmethod
+    def get_last(cls, thingy):
+        """Return the last revision of a thingy, without its document"""
+        projection = {"operation": 1, "number": 1}
+        filter = cls.get_filter(thingy)
+        return cls.find_one(filter, projection, sort=[("_id", DESCENDING)])
+
+    def resolve(self):
+        """Rebuild the document of a delta revision"""
+        cursor = self.get_collection().find(self.get_chain_filter())
+        self.resolve_from(rebuild(cursor.sort("_id", ASCENDING)))
+
     def save(self):
         self.creation_date = datetime.utcnow()
-        if not self._prev():
-            self.operation = "create"
         return super(Revision, self).save()
 
 
 class AsyncRevision(AsyncThingy, BaseRevision):
     _cursor_cls = AsyncRevisionCursor
 
+    @classmethod
+    async def get_last(cls, thingy):
+        """Return the last revision of a thingy, without its document"""
+        projection = {"operation": 1, "number": 1}
+        filter = cls.get_filter(thingy)
+        return await cls.find_one(filter, projection, sort=[("_id", DESCENDING)])
+
+    async def resolve(self):
+        """Rebuild the document of a delta revision"""
+        cursor = self.get_collection().find(self.get_chain_filter())
+        revisions = await cursor.sort("_id", ASCENDING).to_list(None)
+        self.resolve_from(rebuild(revisions))
+
     async def save(self):
         self.creation_date = datetime.utcnow()
-        if not await self._prev():
-            self.operation = "create"
         return await super(AsyncRevision, self).save()
 
 
+class DeferredRevision(WriteBehind, Revision):
+    """Revision queued, and written by batches from a background thread
+
+    Revisions get their ``_id`` when queued, so they keep their order. Durable
+    saves write the queued revisions, then their own, before returning.
+    """
+
+    def save(self, durable=False):
+        self.creation_date = datetime.utcnow()
+        if not durable:
+            return super(DeferredRevision, self).save()
+        self.flush()
+        return Revision.save(self)
+
+
+class AsyncDeferredRevision(AsyncWriteBehind, AsyncRevision):
+    """Revision queued, and written by batches from a background task
+
+    Revisions get their ``_id`` when queued, so they keep their order. Durable
+    saves write the queued revisions, then their own, before returning.
+    """
+
+    async def save(self, durable=False):
+        self.creation_date = datetime.utcnow()
+        if not durable:
+            return await super(AsyncDeferredRevision, self).save()
+        await self.flush()
+        return await AsyncRevision.save(self)
+
+
 class BaseVersioned:
-    """Mixin to versionate changes in a collection"""
+    """Mixin to versionate changes in a collection
+
+    With ``_delta_revisions``, revisions only store the fields changed since
+    the previous revision, and a full snapshot every ``_snapshot_interval``
+    revisions. Documents are rebuilt transparently when revisions are read.
+    Changes made to a document without saving it from a versioned thingy are
+    only captured by the next snapshot. The position of the document in its
+    chain of deltas is kept in its ``_revision_chain`` field, so that saves do
+    not read revisions back; revisions do not store this field. Remove it from
+    documents whose revisions are deleted otherwise than by compaction.
+
+    With a ``_revision_partition``, revisions are stored in a collection of
+    their own, named after the class when ``True``, or shared by the classes of
+    the same partition name. :meth:`migrate_revisions` moves the existing
+    revisions there.
+
+    With a ``_revision_cls`` of :class:`DeferredRevision`, revisions are queued
+    and written in background, and read once written: reading methods write
+    the queued revisions first, but :meth:`get_revisions` does not.
+
+    With a ``_revision_counter`` field name, the number of revisions is kept in
+    the document, and each revision gets its ``number``, so that
+    :meth:`count_revisions` reads it from the last revision.
+
+    The retention policy enforced by ``compact_revisions`` keeps the
+    ``_keep_revisions`` last revisions of each document, the ones newer than
+    the ``_keep_revisions_for`` timedelta, and the last one of each day or
+    week with a ``_thin_revisions`` of ``"daily"`` or ``"weekly"``. Deleted
+    revisions are copied to the collection of ``_archive_revision_cls`` first.
+    """
 
-    _revisions_cls = None
+    _revision_cls = None
+    _revision_counter = None
+    _delta_revisions = False
+    _snapshot_interval = 10
+    _revision_chain = "revision_chain"
+    _revision_write = "_written"
+    _keep_revisions = None
+    _keep_revisions_for = None
+    _thin_revisions = None
+    _archive_revision_cls = None
+    _revision_partition = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls._revision_partition is not None and cls._revision_cls is not None:
+            cls.get_revision_cls()  # Registered, for create_indexes()
+
+    @classmethod
+    def get_revision_cls(cls):
+        """Return the revision class of the class, after partitioning"""
+        partition = cls._revision_partition
+        if partition is None or cls._revision_cls is None:
+            return cls._revision_cls
+        if partition is True:
+            name = uncamelize(cls.__name__)
+            return cls._revision_cls.get_partition_cls(name, cls.__name__)
+        return cls._revision_cls.get_partition_cls(partition)
+
+    @classmethod
+    def _get_migration(cls):
+        source_cls, target_cls = cls._revision_cls, cls.get_revision_cls()
+        if target_cls is source_cls:
+            return None, None, None
+        filter = source_cls.get_type_filter(cls.__name__)
+        cursor = source_cls.get_collection().find(filter).sort("_id", ASCENDING)
+        return cursor, source_cls.get_collection(), target_cls.get_collection()
+
+    @staticmethod
+    def _get_migration_requests(revisions):
+        requests = [ReplaceOne({"_id": r["_id"]}, r, upsert=True) for r in revisions]
+        return requests, {"_id": {"$in": [r["_id"] for r in revisions]}}
+
+    def _start_write(self):
+        """Return where ``_save`` notes its operation and the document replaced
+
+        It is passed in the document, so that the save goes through the
+        ``save`` of every mixin, and taken out by ``_save`` before writing.
+        """
+        write = self.__dict__[self._revision_write] = {"before": None}
+        return write
+
+    def _take_write(self):
+        return self.__dict__.pop(self._revision_write, {"before": None})
+
+    def _is_delta_save(self, force_insert=False):
+        return self._delta_revisions and self.id is not None and not force_insert
+
+    def _count_revisions(self, last):
+        if last is None:
+            return 0
+        return last.number
+
+    def _increment_counter(self, count):
+        number = (count or 0) + 1
+        self.__dict__[self._revision_counter] = number
+        return number
+
+    def _next_revision_chain(self, force_insert=False):
+        """Return the id of the next revision, and its position in a delta chain
+
+        The position is stored in the document, with the revision starting a
+        new chain when the document has none yet, or once it is long enough.
+        """
+        if not self._delta_revisions:
+            return None, None
+        revision_id = ObjectId()
+        chain = self.__dict__.get(self._revision_chain)
+        if (
+            chain
+            and self._is_delta_save(force_insert)
+            and chain["depth"] + 1 < self._snapshot_interval
+        ):
+            chain = {"snapshot_id": chain["snapshot_id"], "depth": chain["depth"] + 1}
+        else:
+            chain = {"snapshot_id": revision_id, "depth": 0}
+        self.__dict__[self._revision_chain] = chain
+        return revision_id, chain
+
+    def _set_revision_chain(self, version, before, revision_id, chain):
+        field = self._revision_chain
+        version._id = revision_id
+        version.document = {k: v for k, v in version.document.items() if k != field}
+        if before is not None:
+            before = {k: v for k, v in before.items() if k != field}
+        version.set_delta(before, chain)
+
+    def _restore(self, document):
+        fields = (self._revision_counter, self._revision_chain)
+        kept = {k: v for k, v in self.__dict__.items() if k in fields}
+        self.__dict__ = dict(document)
+        self.__dict__.update(kept)
+
+    def _is_deferred(self):
+        return issubclass(self.get_revision_cls(), BaseWriteBehind)
 
     def get_revisions(self, **kwargs):
-        filter = {"document_id": self.id, "document_type": type(self).__name__}
+        revision_cls = self.get_revision_cls()
+        filter = revision_cls.get_filter(self)
         filter.update(kwargs)
 
-        cursor = self._revision_cls.find(filter)
+        cursor = revision_cls.find(filter)
         cursor.thingy = self
         return cursor.sort("_id", ASCENDING)
 
-    def count_revisions(self, **kwargs):
-        filter = {"document_id": self.id, "document_type": type(self).__name__}
-        return self._revision_cls.count_documents(filter, **kwargs)
+    @classmethod
+    def _get_as_of_pipeline(cls, ids, when):
+        filter = cls.get_revision_cls().get_type_filter(cls.__name__)
+        filter["document_id"] = {"$in": ids}
+        filter["creation_date"] = {"$lte": get_utc(when)}
+        return [
+            {"$match": filter},
+            {"$sort": {"document_id": ASCENDING, "_id": ASCENDING}},
+            {"$group": {"_id": "$document_id", "revision": {"$last": "$$ROOT"}}},
+        ]
+
+    @classmethod
+    def _get_chains_filter(cls, revisions):
+        filters = [
+            cls.get_revision_cls()(revision).get_chain_filter()
+            for revision in revisions
+            if "delta" in revision
+        ]
+        if filters:
+            return {"$or": filters}
+
+    @classmethod
+    def _get_restore_requests(cls, states):
+        requests = []
+        for document_id, document in states:
+            if document is None:
+                requests.append(DeleteOne({"_id": document_id}))
+            else:
+                document = cls(document)._to_document()
+                requests.append(ReplaceOne({"_id": document_id}, document, upsert=True))
+        return requests
+
+    @classmethod
+    def _get_restore_revisions(cls, states, result, author=None):
+        creation_date = datetime.utcnow()
+        revisions = []
+        for i, (document_id, document) in enumerate(states):
+            if document is None:
+                operation, document = "delete", {"_id": document_id}
+            elif i in result.upserted_ids:
+                operation = "create"
+            else:
+                operation = "update"
+            revision = cls.get_revision_cls().from_thingy(
+                cls(document), author, operation
+            )
+            revision.creation_date = creation_date
+            revisions.append(revision.__dict__)
+        return revisions
+
+    @classmethod
+    def _get_restore_states(cls, states):
+        # The revision count and chain kept in the document are reset on next save
+        fields = (cls._revision_counter, cls._revision_chain)
+        return [
+            (id, None if d is None else {k: v for k, v in d.items() if k not in fields})
+            for id, d in states
+        ]
 
 
 class Versioned(BaseVersioned):
+    def _flush_revisions(self):
+        if self._is_deferred():
+            self.get_revision_cls().flush()
+
+    def _save_revision(self, version, durable=False):
+        # Only deferred revisions can be queued, the others always are durable
+        if durable and self._is_deferred():
+            return version.save(durable=True)
+        return version.save()
+
+    def count_revisions(self, **kwargs):
+        self._flush_revisions()
+        revision_cls = self.get_revision_cls()
+        if self._revision_counter is not None and not kwargs:
+            count = self._count_revisions(revision_cls.get_last(self))
+            if count is not None:
+                return count
+        filter = revision_cls.get_filter(self)
+        return revision_cls.count_documents(filter, **kwargs)
+
+    def _next_revision_number(self):
+        if self._revision_counter is None:
+            return None
+        count = self.__dict__.get(self._revision_counter)
+        if count is None and self.id is not None:
+            self._flush_revisions()
+            revision_cls = self.get_revision_cls()
+            count = revision_cls.count_documents(revision_cls.get_filter(self))
+        return self._increment_counter(count)
+
     def is_versioned(self):
-        return bool(self.count_revisions(limit=1))
+        self._flush_revisions()
+        return self.get_revision_cls().get_last(self) is not None
 
     @property
     def version(self):
@@ -116,53 +751,369 @@ class Versioned(BaseVersioned):
         return self.get_revisions()
 
     def revert(self):
-        revisions = list(self.get_revisions().limit(3))
+        self._flush_revisions()
+        revisions = list(self.get_revisions().sort("_id", DESCENDING).limit(2))
         try:
-            self.__dict__ = revisions[-2].document
+            self._restore(revisions[1].document)
         except IndexError:
-            self.__dict__ = {"_id": self.id}
+            self._restore({"_id": self.id})
         return self.save()
 
-    def save(self, author=None, **kwargs):
-        result = super(Versioned, self).save(**kwargs)
-        version = self._revision_cls.from_thingy(self, author=author)
-        version.save()
-        return result
+    @classmethod
+    def _get_states_as_of(cls, ids_or_filter, when, batch_size):
+        if isinstance(ids_or_filter, Mapping):
+            cursor = cls.get_collection().find(ids_or_filter, {"_id": 1})
+            ids_or_filter = (document["_id"] for document in cursor)
+
+        collection = cls.get_revision_cls().get_collection()
+        for ids in get_batches(ids_or_filter, batch_size):
+            pipeline = cls._get_as_of_pipeline(ids, when)
+            revisions = [d["revision"] for d in collection.aggregate(pipeline)]
+            filter = cls._get_chains_filter(revisions)
+            chains = []
+            if filter is not None:
+                chains = list(collection.find(filter).sort("_id", ASCENDING))
+            yield get_states(revisions, chains)
+
+    @classmethod
+    def migrate_revisions(cls, batch_size=1000):
+        """Move the revisions of the class from ``_revision_cls`` to its partition
+
+        Revisions are copied, then deleted, by batches of ``batch_size``. Return
+        the number of revisions moved.
+        """
+        cursor, source, target = cls._get_migration()
+        count = 0
+        for revisions in get_batches(cursor or [], batch_size):
+            requests, filter = cls._get_migration_requests(revisions)
+            target.bulk_write(requests, ordered=False)
+            source.delete_many(filter)
+            count += len(revisions)
+        return count
+
+    @classmethod
+    def _write_compaction(cls, compaction, batch_size):
+        deleted, squashed = compaction.take(batch_size)
+        with monitoring.operation(cls, "compact_revisions"):
+            if deleted and cls._archive_revision_cls is not None:
+                requests = compaction.get_archive_requests(deleted)
+                archive = cls._archive_revision_cls.get_collection()
+                archive.bulk_write(requests, ordered=False)
+            requests = compaction.get_requests(deleted, squashed)
+            cls.get_revision_cls().get_collection().bulk_write(requests)
+        compaction.written(deleted, squashed)
+
+    @classmethod
+    def compact_revisions(cls, batch_size=1000, pause=None, now=None):
+        """Delete the revisions out of the retention policy, by batches
 
-    def delete(self, author=None):
+        Each batch squashes and deletes ``batch_size`` revisions at most, with
+        one bulk write, and is followed by a ``pause`` in seconds. Return the
+        number of documents and revisions scanned, deleted and squashed.
+        """
+        compaction = Compaction(cls, now)
+        collection = cls.get_revision_cls().get_collection()
+        cursor = compaction.get_cursor(collection)
+        for _, revisions in groupby(cursor, key=itemgetter("document_id")):
+            compaction.add(list(revisions))
+            while compaction.size >= batch_size:
+                cls._write_compaction(compaction, batch_size)
+                if pause:
+                    time.sleep(pause)
+        while compaction.size:
+            cls._write_compaction(compaction, batch_size)
+        return compaction.stats
+
+    @classmethod
+    def history_as_of(cls, ids_or_filter, when, batch_size=1000):
+        """Yield the documents as they were at ``when``
+
+        ``ids_or_filter`` is a list of ids, or a filter matching the documents
+        in their current state. Documents are rebuilt by batches of
+        ``batch_size``, from one aggregation over their revisions. Documents
+        deleted at ``when``, or created after, are skipped.
+        """
+        for states in cls._get_states_as_of(ids_or_filter, when, batch_size):
+            for _, document in states:
+                if document is not None:
+                    yield cls(document)
+
+    @classmethod
+    def restore_as_of(cls, ids_or_filter, when, author=None, batch_size=1000):
+        """Restore the documents as they were at ``when``, by bulk writes
+
+        Documents deleted at ``when`` are deleted, and documents created after
+        are left untouched. Each restored document gets a revision. Return the
+        number of documents restored.
+        """
+        count = 0
+        for states in cls._get_states_as_of(ids_or_filter, when, batch_size):
+            if not states:
+                continue
+            states = cls._get_restore_states(states)
+            requests = cls._get_restore_requests(states)
+            result = cls.get_collection().bulk_write(requests, ordered=False)
+            revisions = cls._get_restore_revisions(states, result, author)
+            cls.get_revision_cls().get_collection().insert_many(revisions)
+            count += len(states)
+        return count
+
+    def _save(self, force_insert=False):
+        write = self._take_write()
+        if not self._is_delta_save(force_insert):
+            result = super(Versioned, self)._save(force_insert)
+            write["operation"] = get_operation(result)
+            return result
+
+        before = self.get_collection().find_one_and_replace(
+            {"_id": self.id},
+            self._to_document(),
+            upsert=True,
+            return_document=ReturnDocument.BEFORE,
+        )
+        write["operation"] = "create" if before is None else "update"
+        if before is not None:
+            write["before"] = self._from_document(before).__dict__
+        return before
+
+    def save(self, author=None, durable=False, force_insert=False, refresh=False):
+        number = self._next_revision_number()
+        revision_id, chain = self._next_revision_chain(force_insert)
+        write = self._start_write()
+        try:
+            super(Versioned, self).save(force_insert=force_insert, refresh=refresh)
+        finally:
+            self.__dict__.pop(self._revision_write, None)
+        version = self.get_revision_cls().from_thingy(
+            self, author=author, operation=write["operation"], number=number
+        )
+        if chain is not None:
+            self._set_revision_chain(version, write["before"], revision_id, chain)
+        self._save_revision(version, durable)
+        return self
+
+    def delete(self, author=None, durable=False):
+        number = self._next_revision_number()
         result = super(Versioned, self).delete()
-        version = self._revision_cls.from_thingy(
-            self, author=author, operation="delete"
+        self.__dict__.pop(self._revision_chain, None)  # A new document starts one
+        version = self.get_revision_cls().from_thingy(
+            self, author=author, operation="delete", number=number
         )
-        version.save()
+        self._save_revision(version, durable)
         return result
 
 
 class AsyncVersioned(BaseVersioned):
+    async def _flush_revisions(self):
+        if self._is_deferred():
+            await self.get_revision_cls().flush()
+
+    async def _save_revision(self, version, durable=False):
+        # Only deferred revisions can be queued, the others always are durable
+        if durable and self._is_deferred():
+            return await version.save(durable=True)
+        return await version.save()
+
+    async def count_revisions(self, **kwargs):
+        await self._flush_revisions()
+        revision_cls = self.get_revision_cls()
+        if self._revision_counter is not None and not kwargs:
+            count = self._count_revisions(await revision_cls.get_last(self))
+            if count is not None:
+                return count
+        filter = revision_cls.get_filter(self)
+        return await revision_cls.count_documents(filter, **kwargs)
+
+    async def _next_revision_number(self):
+        if self._revision_counter is None:
+            return None
+        count = self.__dict__.get(self._revision_counter)
+        if count is None and self.id is not None:
+            await self._flush_revisions()
+            revision_cls = self.get_revision_cls()
+            count = await revision_cls.count_documents(revision_cls.get_filter(self))
+        return self._increment_counter(count)
+
     async def is_versioned(self):
-        return bool(await self.count_revisions(limit=1))
+        await self._flush_revisions()
+        return await self.get_revision_cls().get_last(self) is not None
 
     async def revert(self):
-        revisions = await self.get_revisions().limit(3).to_list(length=3)
+        await self._flush_revisions()
+        cursor = self.get_revisions().sort("_id", DESCENDING).limit(2)
+        revisions = await cursor.to_list(length=2)
         try:
-            self.__dict__ = revisions[-2].document
+            self._restore(revisions[1].document)
         except IndexError:
-            self.__dict__ = {"_id": self.id}
+            self._restore({"_id": self.id})
         return await self.save()
 
-    async def save(self, author=None, **kwargs):
-        result = await super(AsyncVersioned, self).save(**kwargs)
-        version = self._revision_cls.from_thingy(self, author=author)
-        await version.save()
-        return result
+    @classmethod
+    async def _get_ids(cls, filter):
+        cursor = cls.get_collection().find(filter, {"_id": 1})
+        async for document in cursor:
+            yield document["_id"]
+
+    @classmethod
+    async def _get_states_as_of(cls, ids_or_filter, when, batch_size):
+        if isinstance(ids_or_filter, Mapping):
+            batches = get_async_batches(cls._get_ids(ids_or_filter), batch_size)
+        else:
+            batches = get_async_batches(ids_or_filter, batch_size)
+
+        collection = cls.get_revision_cls().get_collection()
+        async for ids in batches:
+            cursor = collection.aggregate(cls._get_as_of_pipeline(ids, when))
+            if inspect.isawaitable(cursor):
+                cursor = await cursor
+            revisions = [d["revision"] for d in await cursor.to_list(None)]
+            filter = cls._get_chains_filter(revisions)
+            chains = []
+            if filter is not None:
+                cursor = collection.find(filter).sort("_id", ASCENDING)
+                chains = await cursor.to_list(None)
+            yield get_states(revisions, chains)
+
+    @classmethod
+    async def migrate_revisions(cls, batch_size=1000):
+        """Move the revisions of the class from ``_revision_cls`` to its partition
+
+        Revisions are copied, then deleted, by batches of ``batch_size``. Return
+        the number of revisions moved.
+        """
+        cursor, source, target = cls._get_migration()
+        count = 0
+        async for revisions in get_async_batches(cursor or [], batch_size):
+            requests, filter = cls._get_migration_requests(revisions)
+            await target.bulk_write(requests, ordered=False)
+            await source.delete_many(filter)
+            count += len(revisions)
+        return count
+
+    @classmethod
+    async def _write_compaction(cls, compaction, batch_size):
+        deleted, squashed = compaction.take(batch_size)
+        with monitoring.operation(cls, "compact_revisions"):
+            if deleted and cls._archive_revision_cls is not None:
+                requests = compaction.get_archive_requests(deleted)
+                archive = cls._archive_revision_cls.get_collection()
+                await archive.bulk_write(requests, ordered=False)
+            requests = compaction.get_requests(deleted, squashed)
+            await cls.get_revision_cls().get_collection().bulk_write(requests)
+        compaction.written(deleted, squashed)
+
+    @classmethod
+    async def compact_revisions(cls, batch_size=1000, pause=None, now=None):
+        """Delete the revisions out of the retention policy, by batches
+
+        Each batch squashes and deletes ``batch_size`` revisions at most, with
+        one bulk write, and is followed by a ``pause`` in seconds. Return the
+        number of documents and revisions scanned, deleted and squashed.
+        """
+        compaction = Compaction(cls, now)
+        collection = cls.get_revision_cls().get_collection()
+        revisions = []
+        async for revision in compaction.get_cursor(collection):
+            if revisions and revision["document_id"] != revisions[0]["document_id"]:
+                compaction.add(revisions)
+                revisions = []
+                while compaction.size >= batch_size:
+                    await cls._write_compaction(compaction, batch_size)
+                    if pause:
+                        await asyncio.sleep(pause)
+            revisions.append(revision)
+        if revisions:
+            compaction.add(revisions)
+        while compaction.size:
+            await cls._write_compaction(compaction, batch_size)
+        return compaction.stats
+
+    @classmethod
+    async def history_as_of(cls, ids_or_filter, when, batch_size=1000):
+        """Yield the documents as they were at ``when``
+
+        ``ids_or_filter`` is a list of ids, or a filter matching the documents
+        in their current state. Documents are rebuilt by batches of
+        ``batch_size``, from one aggregation over their revisions. Documents
+        deleted at ``when``, or created after, are skipped.
+        """
+        async for states in cls._get_states_as_of(ids_or_filter, when, batch_size):
+            for _, document in states:
+                if document is not None:
+                    yield cls(document)
+
+    @classmethod
+    async def restore_as_of(cls, ids_or_filter, when, author=None, batch_size=1000):
+        """Restore the documents as they were at ``when``, by bulk writes
+
+        Documents deleted at ``when`` are deleted, and documents created after
+        are left untouched. Each restored document gets a revision. Return the
+        number of documents restored.
+        """
+        count = 0
+        async for states in cls._get_states_as_of(ids_or_filter, when, batch_size):
+            if not states:
+                continue
+            states = cls._get_restore_states(states)
+            requests = cls._get_restore_requests(states)
+            result = await cls.get_collection().bulk_write(requests, ordered=False)
+            revisions = cls._get_restore_revisions(states, result, author)
+            await cls.get_revision_cls().get_collection().insert_many(revisions)
+            count += len(states)
+        return count
+
+    async def _save(self, force_insert=False):
+        write = self._take_write()
+        if not self._is_delta_save(force_insert):
+            result = await super(AsyncVersioned, self)._save(force_insert)
+            write["operation"] = get_operation(result)
+            return result
+
+        before = await self.get_collection().find_one_and_replace(
+            {"_id": self.id},
+            self._to_document(),
+            upsert=True,
+            return_document=ReturnDocument.BEFORE,
+        )
+        write["operation"] = "create" if before is None else "update"
+        if before is not None:
+            write["before"] = self._from_document(before).__dict__
+        return before
+
+    async def save(self, author=None, durable=False, force_insert=False, refresh=False):
+        number = await self._next_revision_number()
+        revision_id, chain = self._next_revision_chain(force_insert)
+        write = self._start_write()
+        try:
+            await super(AsyncVersioned, self).save(
+                force_insert=force_insert, refresh=refresh
+            )
+        finally:
+            self.__dict__.pop(self._revision_write, None)
+        version = self.get_revision_cls().from_thingy(
+            self, author=author, operation=write["operation"], number=number
+        )
+        if chain is not None:
+            self._set_revision_chain(version, write["before"], revision_id, chain)
+        await self._save_revision(version, durable)
+        return self
 
-    async def delete(self, author=None):
+    async def delete(self, author=None, durable=False):
+        number = await self._next_revision_number()
         result = await super(AsyncVersioned, self).delete()
-        version = self._revision_cls.from_thingy(
-            self, author=author, operation="delete"
+        self.__dict__.pop(self._revision_chain, None)  # A new document starts one
+        version = self.get_revision_cls().from_thingy(
+            self, author=author, operation="delete", number=number
         )
-        await version.save()
+        await self._save_revision(version, durable)
         return result
 
 
-__all__ = ["AsyncRevision", "AsyncVersioned", "Revision", "Versioned"]
+__all__ = [
+    "AsyncDeferredRevision",
+    "AsyncRevision",
+    "AsyncVersioned",
+    "DeferredRevision",
+    "Revision",
+    "Versioned",
+]
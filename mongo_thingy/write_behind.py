@@ -0,0 +1,350 @@
+import asyncio
+import atexit
+import logging
+import threading
+from copy import deepcopy
+
+from bson import ObjectId
+from pymongo import ReplaceOne
+
+from mongo_thingy import metrics, monitoring
+from mongo_thingy.connection import gather, register_after_fork
+
+logger = logging.getLogger(__name__)
+
+_queues = {}
+_lock = threading.Lock()
+
+
+class BaseWriteQueue:
+    """Documents waiting to be written, coalesced by collection and ``_id``"""
+
+    def __init__(self, thingy_cls):
+        self.thingy_cls = thingy_cls
+        self.pending = {}
+        self.size = 0
+        self.closed = False
+
+    @property
+    def is_full(self):
+        return self.size >= self.thingy_cls._queue_size
+
+    @property
+    def is_ready(self):
+        return self.closed or self.size >= self.thingy_cls._batch_size
+
+    def is_pending(self, collection, document):
+        documents = self.pending.get(collection.full_name, (None, {}))[1]
+        return document["_id"] in documents
+
+    def add(self, collection, document):
+        name = collection.full_name
+        documents = self.pending.setdefault(name, (collection, {}))[1]
+        if document["_id"] not in documents:
+            self.size += 1
+        documents[document["_id"]] = document
+        metrics.set_gauge(self.thingy_cls, "write_behind_queue_depth", self.size)
+
+    def drop(self, count=1):
+        metrics.increment(self.thingy_cls, "write_behind_dropped_writes", count)
+
+    def take(self, limit=None):
+        batches = []
+        for name in list(self.pending):
+            if limit is not None and limit <= 0:
+                break
+            collection, documents = self.pending[name]
+            ids = list(documents)[:limit]
+            batches.append((collection, [documents.pop(id) for id in ids]))
+            if not documents:
+                del self.pending[name]
+            self.size -= len(ids)
+            if limit is not None:
+                limit -= len(ids)
+        metrics.set_gauge(self.thingy_cls, "write_behind_queue_depth", self.size)
+        return batches
+
+    def get_requests(self, collection, documents):
+        if self.thingy_cls._write_concern is not None:
+            write_concern = self.thingy_cls._write_concern
+            collection = collection.with_options(write_concern=write_concern)
+        requests = [ReplaceOne({"_id": d["_id"]}, d, upsert=True) for d in documents]
+        return collection, requests
+
+    def written(self, documents):
+        metrics.increment(self.thingy_cls, "write_behind_writes", len(documents))
+
+    def failed(self, documents, error):
+        metrics.increment(self.thingy_cls, "write_behind_errors")
+        self.drop(len(documents))
+        name = self.thingy_cls.__name__
+        logger.error("Write-behind of %d %s failed: %s", len(documents), name, error)
+
+
+class WriteQueue(BaseWriteQueue):
+    """Write queue drained by a background thread"""
+
+    def __init__(self, thingy_cls):
+        super().__init__(thingy_cls)
+        self.condition = threading.Condition()
+        self.flushing = threading.Lock()
+        self.thread = None
+
+    def put(self, collection, document):
+        with self.condition:
+            closed = self.closed
+            if closed:
+                self.add(collection, document)
+            else:
+                if self.is_full and not self.is_pending(collection, document):
+                    timeout = self.thingy_cls._queue_timeout
+                    if not self.condition.wait_for(lambda: not self.is_full, timeout):
+                        return self.drop()
+                self.add(collection, document)
+                if self.is_ready:
+                    self.condition.notify_all()
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self.run, daemon=True)
+                    self.thread.start()
+        if closed:
+            self.flush()  # Closed queues write through
+
+    def run(self):
+        while True:
+            with self.condition:
+                interval = self.thingy_cls._flush_interval
+                self.condition.wait_for(lambda: self.is_ready, interval)
+                if self.closed:
+                    return
+            try:
+                self.flush(self.thingy_cls._batch_size)
+            except Exception:
+                continue  # Logged by failed()
+
+    def flush(self, limit=None):
+        """Write the pending documents, ``limit`` at most"""
+        with self.flushing:
+            with self.condition:
+                batches = self.take(limit)
+                self.condition.notify_all()
+            for collection, documents in batches:
+                try:
+                    collection, requests = self.get_requests(collection, documents)
+                    with monitoring.operation(self.thingy_cls, "write_behind.flush"):
+                        collection.bulk_write(requests, ordered=False)
+                except Exception as error:
+                    self.failed(documents, error)
+                    raise
+                self.written(documents)
+
+    def close(self):
+        """Stop the background thread, and write the pending documents
+
+        Documents put once the queue is closed are written right away.
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+        self.flush()
+
+
+class AsyncWriteQueue(BaseWriteQueue):
+    """Write queue drained by a background task"""
+
+    def __init__(self, thingy_cls):
+        super().__init__(thingy_cls)
+        self.condition = asyncio.Condition()
+        self.flushing = asyncio.Lock()
+        self.task = None
+
+    async def put(self, collection, document):
+        async with self.condition:
+            closed = self.closed
+            if closed:
+                self.add(collection, document)
+            else:
+                if self.is_full and not self.is_pending(collection, document):
+                    timeout = self.thingy_cls._queue_timeout
+                    waiting = self.condition.wait_for(lambda: not self.is_full)
+                    try:
+                        await asyncio.wait_for(waiting, timeout)
+                    except asyncio.TimeoutError:
+                        return self.drop()
+                self.add(collection, document)
+                if self.is_ready:
+                    self.condition.notify_all()
+                if self.task is None:
+                    self.task = asyncio.ensure_future(self.run())
+        if closed:
+            await self.flush()  # Closed queues write through
+
+    async def run(self):
+        while True:
+            async with self.condition:
+                if not self.is_ready:
+                    interval = self.thingy_cls._flush_interval
+                    waiting = self.condition.wait_for(lambda: self.is_ready)
+                    try:
+                        await asyncio.wait_for(waiting, interval)
+                    except asyncio.TimeoutError:
+                        pass
+                if self.closed:
+                    return
+            try:
+                await self.flush(self.thingy_cls._batch_size)
+            except Exception:
+                continue  # Logged by failed()
+
+    async def flush(self, limit=None):
+        """Write the pending documents, ``limit`` at most"""
+        async with self.flushing:
+            async with self.condition:
+                batches = self.take(limit)
+                self.condition.notify_all()
+            for collection, documents in batches:
+                try:
+                    collection, requests = self.get_requests(collection, documents)
+                    with monitoring.operation(self.thingy_cls, "write_behind.flush"):
+                        await collection.bulk_write(requests, ordered=False)
+                except Exception as error:
+                    self.failed(documents, error)
+                    raise
+                self.written(documents)
+
+    async def close(self):
+        """Stop the background task, and write the pending documents
+
+        Documents put once the queue is closed are written right away.
+        """
+        async with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        if self.task is not None:
+            await self.task
+        await self.flush()
+
+
+class BaseWriteBehind:
+    """Mixin queuing the saves of a class, to write them later by batches
+
+    Saves of the same document coalesce while queued, and batches are written
+    with unordered bulk writes, every ``_flush_interval`` seconds or once
+    ``_batch_size`` documents are queued. When ``_queue_size`` documents are
+    queued, saves wait for ``_queue_timeout`` seconds (forever if ``None``)
+    before the document is dropped. Use a ``_write_concern`` of ``w=0`` for
+    unacknowledged writes.
+
+    Batches are not retried: a batch failing to be written is logged, counted
+    in the ``write_behind_errors`` metric, and its documents are dropped.
+
+    Saves with ``force_insert`` or ``refresh`` are not queued: the pending
+    documents are written, then the save is written through.
+    """
+
+    _queue_size = 10000
+    _queue_timeout = None
+    _batch_size = 1000
+    _flush_interval = 1.0
+    _write_concern = None
+    _write_queue_cls = None
+
+    @classmethod
+    def get_write_queue(cls):
+        try:
+            return _queues[cls]
+        except KeyError:
+            pass
+        with _lock:
+            if cls not in _queues:
+                _queues[cls] = cls._write_queue_cls(cls)
+            return _queues[cls]
+
+    def get_queued_document(self):
+        """Return a copy of the document, as it is when saved"""
+        if self.id is None:
+            self._id = ObjectId()
+        return deepcopy(self._to_document())
+
+
+class WriteBehind(BaseWriteBehind):
+    _write_queue_cls = WriteQueue
+
+    def save(self, force_insert=False, refresh=False):
+        queue = self.get_write_queue()
+        if force_insert or refresh:
+            queue.flush()
+            return super().save(force_insert=force_insert, refresh=refresh)
+        queue.put(self.get_collection(), self.get_queued_document())
+        return self
+
+    @classmethod
+    def flush(cls):
+        cls.get_write_queue().flush()
+
+
+class AsyncWriteBehind(BaseWriteBehind):
+    _write_queue_cls = AsyncWriteQueue
+
+    async def save(self, force_insert=False, refresh=False):
+        queue = self.get_write_queue()
+        if force_insert or refresh:
+            await queue.flush()
+            return await super().save(force_insert=force_insert, refresh=refresh)
+        await queue.put(self.get_collection(), self.get_queued_document())
+        return self
+
+    @classmethod
+    async def flush(cls):
+        await cls.get_write_queue().flush()
+
+
+def flush():
+    """Write the pending documents of every class
+
+    Return an awaitable if any of them is asynchronous.
+    """
+    with _lock:
+        queues = list(_queues.values())
+    return gather(*[queue.flush() for queue in queues])
+
+
+def close():
+    """Write the pending documents of every class, and stop writing in background
+
+    Return an awaitable if any of them is asynchronous.
+    """
+    with _lock:
+        queues = list(_queues.values())
+        _queues.clear()
+    return gather(*[queue.close() for queue in queues])
+
+
+@atexit.register
+def _close_at_exit():
+    with _lock:
+        queues = [q for q in _queues.values() if isinstance(q, WriteQueue)]
+    for queue in queues:
+        try:
+            queue.close()
+        except Exception:
+            pass
+
+
+@register_after_fork
+def _forget_queues():
+    global _lock
+    _lock = threading.Lock()
+    # The documents queued by the parent process are written by the parent
+    _queues.clear()
+
+
+__all__ = [
+    "AsyncWriteBehind",
+    "AsyncWriteQueue",
+    "WriteBehind",
+    "WriteQueue",
+    "close",
+    "flush",
+]
@@ -1,6 +1,10 @@
 import asyncio
+import subprocess
+import sys
+import time
 from datetime import datetime, timezone
 
+import pymongo
 import pytest
 from bson import ObjectId
 
@@ -8,12 +12,52 @@ from mongo_thingy import (
     Thingy,
     ThingyList,
     connect,
+    counts,
     create_indexes,
     disconnect,
+    get_async_client_cls,
+    get_motor_client_cls,
+    has_async_client,
+    has_motor,
+    query_budget,
     registry,
 )
 
 
+def test_import_does_not_load_motor():
+    command = [sys.executable, "-X", "importtime", "-c", "import mongo_thingy"]
+    result = subprocess.run(command, capture_output=True, text=True, check=True)
+    modules = [
+        line.rsplit("|", 1)[-1].strip()
+        for line in result.stderr.splitlines()
+        if line.startswith("import time:")
+    ]
+    assert "pymongo" in modules
+    assert not [m for m in modules if m.split(".")[0] in ("motor", "tornado")]
+
+
+def test_get_motor_client_cls():
+    client_cls = get_motor_client_cls()
+    assert get_motor_client_cls() is client_cls
+    if client_cls is not None:
+        assert client_cls.__module__.startswith("motor.")
+        assert has_motor()
+
+
+def test_get_async_client_cls(monkeypatch):
+    class AsyncMongoClient:
+        pass
+
+    monkeypatch.setattr(pymongo, "AsyncMongoClient", AsyncMongoClient, raising=False)
+    get_async_client_cls.cache_clear()
+    try:
+        assert get_async_client_cls() is AsyncMongoClient
+        assert has_async_client()
+    finally:
+        monkeypatch.undo()
+        get_async_client_cls.cache_clear()
+
+
 async def test_thingy_list_distinct_thingies():
     foos = ThingyList()
     foos.append(Thingy())
@@ -209,6 +253,81 @@ async def test_async_thingy_count_documents(TestThingy, collection):
     assert await TestThingy.count_documents({"foo": "bar"}) == 1
 
 
+def test_thingy_count_many(TestThingy, collection):
+    collection.insert_many([{"bar": "baz"}, {"bar": "baz"}, {"bar": "qux"}])
+
+    with query_budget() as budget:
+        result = TestThingy.count_many(
+            {"all": {}, "baz": {"bar": "baz"}, "foo": {"foo": "bar"}}
+        )
+    assert result == {"all": 3, "baz": 2, "foo": 0}
+    assert list(result) == ["all", "baz", "foo"]
+    assert budget.round_trips == 1
+
+    result = TestThingy.count_many({"all": None, "baz": {"bar": "baz"}}, estimated=True)
+    assert result == {"all": 3, "baz": 2}
+    assert TestThingy.count_many({"all": {}}, estimated=True) == {"all": 3}
+    assert TestThingy.count_many({}) == {}
+
+
+def test_thingy_count_many_cache(TestThingy, collection):
+    collection.insert_one({"bar": "baz"})
+    filters = {"baz": {"bar": "baz"}}
+    assert TestThingy.count_many(filters, cache_ttl=60) == {"baz": 1}
+
+    collection.insert_one({"bar": "baz"})
+    assert TestThingy.count_many(filters, cache_ttl=60) == {"baz": 1}
+    assert TestThingy.count_many(filters) == {"baz": 2}
+    assert TestThingy.count_many(filters, estimated=True, cache_ttl=60) == {"baz": 2}
+
+    counts.clear_cache()
+    assert TestThingy.count_many(filters, cache_ttl=60) == {"baz": 2}
+
+
+def test_thingy_count_many_cache_expiry(TestThingy, collection, monkeypatch):
+    monkeypatch.setattr(counts, "MAX_CACHE_SIZE", 2)
+    counts.clear_cache()
+    for i in range(3):
+        collection.insert_one({"bar": i})
+        assert TestThingy.count_many({"bar": {"bar": i}}, cache_ttl=0.01) == {"bar": 1}
+    assert len(counts._cache) == 2
+
+    time.sleep(0.01)
+    assert TestThingy.count_many({"bar": {"bar": 0}}, cache_ttl=60) == {"bar": 1}
+    assert len(counts._cache) == 1
+    counts.clear_cache()
+
+
+async def test_async_thingy_count_many(TestThingy, collection):
+    await collection.insert_many([{"bar": "baz"}, {"bar": "baz"}, {"bar": "qux"}])
+
+    result = await TestThingy.count_many({"all": {}, "baz": {"bar": "baz"}})
+    assert result == {"all": 3, "baz": 2}
+
+    result = await TestThingy.count_many({"all": {}}, estimated=True, cache_ttl=60)
+    assert result == {"all": 3}
+    await collection.insert_one({"bar": "baz"})
+    result = await TestThingy.count_many({"all": {}}, estimated=True, cache_ttl=60)
+    assert result == {"all": 3}
+    result = await TestThingy.count_many({"all": {}}, cache_ttl=60)
+    assert result == {"all": 4}
+
+
+async def test_async_thingy_count_many_command_cursor(TestThingy):
+    class Cursor:
+        async def to_list(self, length):
+            return [{"_0": [{"count": 2}]}]
+
+    class Collection:
+        async def aggregate(self, pipeline):
+            return Cursor()
+
+    class Foo(TestThingy):
+        _collection = Collection()
+
+    assert await Foo.count_many({"baz": {"bar": "baz"}}) == {"baz": 2}
+
+
 @pytest.mark.ignore_backends("montydb")
 def test_connect_disconnect(thingy_cls, client_cls):
     connect(client_cls=client_cls)
@@ -264,23 +383,42 @@ def test_thingy_create_indexes(TestThingy, collection):
     class Foo(TestThingy):
         _indexes = [("foo", {"unique": True, "background": True})]
 
-    Foo.create_indexes()
+    assert TestThingy.create_indexes() == []
+    assert [i.document["name"] for i in Foo.create_indexes(dry_run=True)] == ["foo_1"]
+    assert len(collection.index_information()) == 0
+
+    assert [i.document["name"] for i in Foo.create_indexes()] == ["foo_1"]
     indexes = collection.index_information()
     assert "_id_" in indexes
     assert "foo_1" in indexes
     assert len(indexes) == 2
 
+    Foo._indexes.append((["foo", "bar"], {}))
+    assert [i.document["name"] for i in Foo.create_indexes()] == ["foo_1_bar_1"]
+    assert Foo.create_indexes() == []
+
 
 async def test_async_thingy_create_indexes(TestThingy, collection):
     class Foo(TestThingy):
         _indexes = [("foo", {"unique": True, "background": True})]
 
-    await Foo.create_indexes()
+    assert await TestThingy.create_indexes() == []
+    indexes = await Foo.create_indexes(dry_run=True)
+    assert [i.document["name"] for i in indexes] == ["foo_1"]
+    assert len(await collection.index_information()) == 0
+
+    indexes = await Foo.create_indexes()
+    assert [i.document["name"] for i in indexes] == ["foo_1"]
     indexes = await collection.index_information()
     assert "_id_" in indexes
     assert "foo_1" in indexes
     assert len(indexes) == 2
 
+    Foo._indexes.append((["foo", "bar"], {}))
+    indexes = await Foo.create_indexes()
+    assert [i.document["name"] for i in indexes] == ["foo_1_bar_1"]
+    assert await Foo.create_indexes() == []
+
 
 def test_thingy_distinct(TestThingy, collection):
     collection.insert_many([{"bar": "baz"}, {"bar": "qux"}])
@@ -669,6 +807,45 @@ async def test_create_indexes(is_async, thingy_cls, database):
         assert len(Bar.collection.index_information()) == 3
 
 
+@pytest.mark.ignore_backends("montydb")
+@pytest.mark.all_backends
+async def test_create_indexes_dry_run_cache(is_async, thingy_cls, database):
+    del registry[:]
+
+    class Foo(thingy_cls):
+        _database = database
+        _indexes = [("foo", {})]
+
+    class Bar(thingy_cls):
+        _database = database
+        _indexes = [("bar", {"unique": True}), ("baz", {"sparse": True})]
+
+    class Baz(thingy_cls):
+        _database = database
+
+    async def run(**kwargs):
+        indexes = create_indexes(**kwargs)
+        if is_async:
+            indexes = await indexes
+        return {cls: [i.document["name"] for i in v] for cls, v in indexes.items()}
+
+    cache = {}
+    assert await run(dry_run=True, cache=cache) == {
+        Foo: ["foo_1"],
+        Bar: ["bar_1", "baz_1"],
+    }
+    assert cache == {}
+
+    assert await run(cache=cache) == {Foo: ["foo_1"], Bar: ["bar_1", "baz_1"]}
+    assert len(cache) == 2
+    assert await run(cache=cache) == {}
+    assert await run() == {Foo: [], Bar: []}
+
+    Foo.add_index("qux")
+    assert await run(cache=cache) == {Foo: ["qux_1"]}
+    assert await run(cache=cache) == {}
+
+
 @pytest.mark.all_backends
 def test_github_issue_6(thingy_cls, client):
     class SynchronisedSwimming(thingy_cls):
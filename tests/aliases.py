@@ -0,0 +1,129 @@
+import pytest
+from pymongo import DESCENDING
+
+from mongo_thingy.aliases import (
+    Aliased,
+    AsyncAliased,
+    alias_filter,
+    alias_keys,
+    alias_update,
+    get_names,
+)
+
+
+@pytest.fixture
+def aliased_cls(is_async):
+    if is_async:
+        return AsyncAliased
+    return Aliased
+
+
+@pytest.fixture
+def TestAliasedThingy(aliased_cls, TestThingy):
+    class TestAliasedThingy(aliased_cls, TestThingy):
+        _aliases = {"last_login": "ll", "name": "n"}
+
+    return TestAliasedThingy
+
+
+aliases = {"last_login": "ll", "name": "n"}
+
+
+def test_get_names():
+    assert get_names(aliases) == {"ll": "last_login", "n": "name"}
+    assert get_names(aliases) is get_names(aliases)
+    with pytest.raises(ValueError):
+        get_names({"foo": "f", "bar": "f"})
+
+
+def test_alias_filter():
+    assert alias_filter(None, aliases) is None
+    assert alias_filter("foo", aliases) == "foo"
+    assert alias_filter({"name": 1, "last_login.at": 2}, aliases) == {
+        "n": 1,
+        "ll.at": 2,
+    }
+    filter = {"$or": [{"name": 1}, {"age": 2}], "$expr": {"$eq": ["$name", 1]}}
+    assert alias_filter(filter, aliases) == {
+        "$or": [{"n": 1}, {"age": 2}],
+        "$expr": {"$eq": ["$name", 1]},
+    }
+
+
+def test_alias_update():
+    assert alias_update([{"$set": {}}], aliases) == [{"$set": {}}]
+    assert alias_update({"name": 1, "age": 2}, aliases) == {"n": 1, "age": 2}
+    update = {"$set": {"name": 1}, "$rename": {"last_login": "name"}}
+    assert alias_update(update, aliases) == {
+        "$set": {"n": 1},
+        "$rename": {"ll": "n"},
+    }
+
+
+def test_alias_keys():
+    assert alias_keys(None, aliases) is None
+    assert alias_keys("name", aliases) == "n"
+    assert alias_keys({"name": 1, "age": 1}, aliases) == {"n": 1, "age": 1}
+    assert alias_keys(["name", ("last_login", -1)], aliases) == ["n", ("ll", -1)]
+
+
+def test_aliased(TestAliasedThingy, collection):
+    TestAliasedThingy.add_index([("last_login", DESCENDING)])
+    TestAliasedThingy.create_indexes()
+    assert "ll_-1" in collection.index_information()
+
+    thingy = TestAliasedThingy(name="John", last_login=1, age=42).save()
+    assert thingy.name == "John"
+    assert collection.find_one() == {"_id": thingy.id, "n": "John", "ll": 1, "age": 42}
+    TestAliasedThingy(name="Jane", last_login=2).save()
+
+    thingy = TestAliasedThingy.find_one({"name": "John"})
+    assert thingy.__dict__ == {
+        "_id": thingy.id,
+        "name": "John",
+        "last_login": 1,
+        "age": 42,
+    }
+    cursor = TestAliasedThingy.find({}, {"name": 1}).sort("last_login", -1)
+    assert [t.__dict__ for t in cursor] == [
+        {"_id": t.id, "name": n} for t, n in zip(list(cursor.clone()), ["Jane", "John"])
+    ]
+    cursor = TestAliasedThingy.find(
+        filter={"last_login": {"$gt": 0}}, sort=[("name", 1)]
+    )
+    assert [t.name for t in cursor] == ["Jane", "John"]
+    assert sorted(TestAliasedThingy.find().distinct("name")) == ["Jane", "John"]
+    assert TestAliasedThingy.distinct("name", {"last_login": 2}) == ["Jane"]
+    assert TestAliasedThingy.count_documents({"name": "John"}) == 1
+    assert TestAliasedThingy.count_many({"john": {"name": "John"}}) == {"john": 1}
+
+    TestAliasedThingy.update_one({"name": "John"}, {"$inc": {"last_login": 1}})
+    TestAliasedThingy.update_many({}, {"$set": {"age": 7}})
+    thingy = TestAliasedThingy.find_one_and_update(
+        {"name": "John"}, {"$inc": {"last_login": 1}}, projection={"last_login": 1}
+    )
+    assert thingy.__dict__ == {"_id": thingy.id, "last_login": 3}
+    thingy = TestAliasedThingy.find_one_and_replace({"name": "Jane"}, {"name": "Janet"})
+    assert thingy.name == "Janet"
+
+    TestAliasedThingy.delete_one({"name": "Janet"})
+    assert TestAliasedThingy.delete_many({"name": "John"}).deleted_count == 1
+    assert collection.count_documents({}) == 0
+
+    TestAliasedThingy.create_index("name")
+    assert "n_1" in collection.index_information()
+
+
+async def test_async_aliased(TestAliasedThingy, collection):
+    thingy = await TestAliasedThingy(name="John", last_login=1).save()
+    assert await collection.find_one() == {"_id": thingy.id, "n": "John", "ll": 1}
+    await TestAliasedThingy(name="Jane", last_login=2).save()
+
+    cursor = TestAliasedThingy.find({"last_login": {"$gt": 0}}).sort("name", -1)
+    assert [t.name async for t in cursor] == ["John", "Jane"]
+    assert sorted(await TestAliasedThingy.find().distinct("name")) == ["Jane", "John"]
+    assert await TestAliasedThingy.count_documents({"name": "John"}) == 1
+    thingy = await TestAliasedThingy.find_one_and_update(
+        {"name": "John"}, {"$set": {"last_login": 3}}
+    )
+    assert thingy.last_login == 3
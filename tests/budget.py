@@ -0,0 +1,133 @@
+import asyncio
+import threading
+
+import pytest
+
+from mongo_thingy import monitoring, query_budget
+from mongo_thingy.budget import QueryBudgetExceeded, RepeatedQueryWarning
+
+
+def test_query_budget(TestThingy, collection):
+    with query_budget(max_round_trips=3) as budget:
+        thingy = TestThingy.find_one({"bar": "baz"})
+        assert thingy is None
+        thingy = TestThingy(bar="baz").save()
+        list(TestThingy.find())
+
+    assert budget.round_trips == 3
+    assert [e.operation for e in budget.events] == [
+        "find_one",
+        "save",
+        "cursor.__iter__",
+    ]
+    assert budget not in monitoring.listeners
+
+
+def test_query_budget_cursors(TestThingy, collection):
+    collection.insert_many([{"bar": i} for i in range(3)])
+
+    with query_budget(max_round_trips=1) as budget:
+        cursor = TestThingy.find()
+        assert cursor.first().bar == 0
+    assert [e.operation for e in budget.events] == ["cursor.first"]
+
+    with query_budget(max_round_trips=2) as budget:
+        cursor = TestThingy.find()
+        assert [cursor.next().bar, cursor.next().bar] == [0, 1]
+        assert cursor[2].bar == 2
+    assert [e.operation for e in budget.events] == [
+        "cursor.__next__",
+        "cursor.__getitem__",
+    ]
+
+
+def test_query_budget_exceeded(TestThingy, collection):
+    with pytest.raises(QueryBudgetExceeded) as excinfo:
+        with query_budget(max_round_trips=1):
+            TestThingy(bar="baz").save()
+            TestThingy.count_documents({"bar": "baz"})
+
+    assert str(excinfo.value) == (
+        "2 round trips issued, for a budget of 1:\n"
+        '  - TestThingy.save {"_id": "?"}\n'
+        '  - TestThingy.count_documents {"bar": "?"}'
+    )
+    assert TestThingy.count_documents() == 1
+
+
+def test_query_budget_exceeded_swallowed(TestThingy, collection):
+    with pytest.raises(QueryBudgetExceeded):
+        with query_budget(max_round_trips=0):
+            try:
+                TestThingy.count_documents()
+            except Exception:
+                pass
+
+
+def test_query_budget_cursors_repeated(TestThingy, collection):
+    with pytest.raises(QueryBudgetExceeded) as excinfo:
+        with query_budget(max_round_trips=1, repeat_threshold=2):
+            TestThingy.find({"bar": "baz"}).first()
+            list(TestThingy.find({"_id": 0}))
+
+    assert str(excinfo.value) == (
+        "2 round trips issued, for a budget of 1:\n"
+        '  - TestThingy.cursor.first {"bar": "?"}\n'
+        '  - TestThingy.cursor.__iter__ {"_id": "?"}'
+    )
+
+
+def test_query_budget_create_indexes(TestThingy, collection):
+    class Foo(TestThingy):
+        _indexes = [("foo", {}), ("bar", {})]
+
+    with query_budget() as budget:
+        Foo.create_indexes()
+        with monitoring.operation(Foo, "migrate"):
+            Foo.find_one()
+
+    assert [e.operation for e in budget.events] == ["create_indexes", "find_one"]
+
+
+def test_query_budget_nested(TestThingy, collection):
+    with query_budget() as outer:
+        TestThingy.count_documents()
+        with query_budget(max_round_trips=1) as inner:
+            TestThingy.count_documents()
+
+    assert outer.round_trips == 2
+    assert inner.round_trips == 1
+
+
+def test_query_budget_threads(TestThingy, collection):
+    with query_budget(max_round_trips=0):
+        thread = threading.Thread(target=TestThingy.count_documents)
+        thread.start()
+        thread.join()
+
+
+def test_query_budget_repeated(TestThingy, collection):
+    with pytest.warns(RepeatedQueryWarning, match="find_one .* repeated 3 times"):
+        with query_budget(repeat_threshold=3):
+            for i in range(5):
+                TestThingy.find_one({"_id": i})
+
+
+async def test_async_query_budget(TestThingy, collection):
+    with query_budget(max_round_trips=3) as budget:
+        thingy = await TestThingy(bar="baz").save()
+        await asyncio.gather(
+            TestThingy.find_one(thingy.id), TestThingy.count_documents()
+        )
+
+    assert budget.round_trips == 3
+
+    with pytest.raises(QueryBudgetExceeded):
+        with query_budget(max_round_trips=1):
+            await TestThingy.find_one(thingy.id)
+            await TestThingy.find().to_list(None)
+
+    with query_budget(max_round_trips=1) as budget:
+        cursor = TestThingy.find()
+        assert (await cursor.first()).bar == "baz"
+    assert [e.operation for e in budget.events] == ["cursor.first"]
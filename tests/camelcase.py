@@ -1,8 +1,17 @@
+import gc
 from datetime import datetime, timezone
 
 import pytest
 
-from mongo_thingy.camelcase import CamelCase, camelize, uncamelize
+from mongo_thingy import camelcase
+from mongo_thingy.camelcase import (
+    CamelCase,
+    CamelCaseStorage,
+    camelize,
+    get_class_attributes,
+    translate,
+    uncamelize,
+)
 
 
 def test_camelize():
@@ -49,6 +58,62 @@ def test_camelcase(TestThingy):
     }
 
 
+def test_translate():
+    document = {"_id": 1, "fooBar": [{"bazQux": 1}, 2], "quux": {"fooBar": {}}, 3: 4}
+    assert translate(document, uncamelize) == {
+        "_id": 1,
+        "foo_bar": [{"baz_qux": 1}, 2],
+        "quux": {"foo_bar": {}},
+        3: 4,
+    }
+    assert translate(translate(document, uncamelize), camelize) == document
+
+
+def test_camelize_cache():
+    camelize.cache_clear()
+    assert camelize("foo_bar") == camelize("foo_bar") == "fooBar"
+    assert camelize.cache_info().hits == 1
+
+
+def test_camelcase_class_attributes(TestThingy):
+    class TestCamelCaseThingy(CamelCase, TestThingy):
+        def get_foo_bar(self):
+            return self.foo_bar
+
+    thingy = TestCamelCaseThingy(fooBar=1)
+    assert thingy.get_foo_bar() == 1
+    assert thingy.__dict__ == {"fooBar": 1}
+    assert thingy.missing_attribute is None
+
+    TestCamelCaseThingy.added_later = lambda self: 2
+    assert thingy.added_later() == 2
+    del TestCamelCaseThingy.get_foo_bar
+    assert thingy.get_foo_bar is None
+
+
+def test_camelcase_class_defaults(TestThingy):
+    class TestCamelCaseThingy(CamelCase, TestThingy):
+        is_active = False
+
+    thingy = TestCamelCaseThingy()
+    assert thingy.is_active is False
+    thingy.is_active = True
+    assert thingy.__dict__ == {"isActive": True}
+    assert thingy.is_active is True
+    assert TestCamelCaseThingy({"isActive": True}).is_active is True
+
+
+def test_class_attributes_cache():
+    class Foo:
+        bar = 1
+
+    assert "bar" in get_class_attributes(Foo)
+    assert Foo in camelcase._class_attributes
+    del Foo
+    gc.collect()
+    assert all(cls.__name__ != "Foo" for cls in camelcase._class_attributes)
+
+
 def test_camelcase_property(TestThingy):
     class TestCamelCaseThingy(CamelCase, TestThingy):
         @property
@@ -88,3 +153,48 @@ def test_camelcase_save_refresh(TestThingy):
 
     assert TestCamelCaseThingy.find_one().created_at != created_at
     assert TestCamelCaseThingy.find_one().created_at == thingy.created_at
+
+
+def test_camelcase_storage(TestThingy):
+    class TestCamelCaseThingy(CamelCaseStorage, TestThingy):
+        pass
+
+    thingy = TestCamelCaseThingy(first_name="John", last_login={"user_agent": "x"})
+    thingy.save()
+    assert TestCamelCaseThingy.collection.find_one(thingy.id) == {
+        "_id": thingy.id,
+        "firstName": "John",
+        "lastLogin": {"userAgent": "x"},
+    }
+    assert thingy.__dict__ == {
+        "_id": thingy.id,
+        "first_name": "John",
+        "last_login": {"user_agent": "x"},
+    }
+
+    thingy = TestCamelCaseThingy.find_one({"lastLogin.userAgent": "x"})
+    assert thingy.last_login == {"user_agent": "x"}
+    assert TestCamelCaseThingy.find().distinct("firstName") == ["John"]
+
+    update = {"$set": {"pastNames": [{"firstName": "Jo"}]}}
+    thingy = TestCamelCaseThingy.find_one_and_update(thingy.id, update)
+    assert thingy.past_names == [{"first_name": "Jo"}]
+    thingy.first_name = "Jonny"
+    thingy.save()
+    assert TestCamelCaseThingy.collection.find_one(thingy.id)["firstName"] == "Jonny"
+
+
+async def test_async_camelcase_storage(TestThingy):
+    class TestCamelCaseThingy(CamelCaseStorage, TestThingy):
+        pass
+
+    thingy = await TestCamelCaseThingy(first_name="John").save()
+    document = await TestCamelCaseThingy.collection.find_one(thingy.id)
+    assert document == {"_id": thingy.id, "firstName": "John"}
+
+    thingy = await TestCamelCaseThingy.find_one({"firstName": "John"})
+    assert thingy.first_name == "John"
+    thingy = await TestCamelCaseThingy.find_one_and_replace(
+        thingy.id, {"lastName": "Doe"}
+    )
+    assert thingy.__dict__ == {"_id": thingy.id, "last_name": "Doe"}
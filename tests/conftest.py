@@ -5,6 +5,7 @@ from _pytest.compat import get_real_func
 from pymongo import MongoClient
 
 from mongo_thingy import AsyncThingy, BaseThingy, Thingy
+from mongo_thingy.executor import executor_client_cls
 from mongo_thingy.versioned import AsyncRevision, AsyncVersioned, Revision, Versioned
 
 try:
@@ -27,11 +28,18 @@ try:
 except ImportError:
     AsyncIOMotorClient = None
 
+try:
+    from pymongo import AsyncMongoClient
+except ImportError:
+    AsyncMongoClient = None
+
 try:
     from mongomock_motor import AsyncMongoMockClient
 except ImportError:
     AsyncMongoMockClient = None
 
+pytest_plugins = ["mongo_thingy.pytest_plugin"]
+
 sync_backends = {
     "pymongo": MongoClient,
     "mongomock": MongomockClient,
@@ -39,9 +47,11 @@ sync_backends = {
 }
 
 async_backends = {
+    "pymongo_async": AsyncMongoClient,
     "motor_tornado": MotorClient,
     "motor_asyncio": AsyncIOMotorClient,
     "mongomock_motor": AsyncMongoMockClient,
+    "mongomock_executor": MongomockClient and executor_client_cls(MongomockClient),
 }
 
 backends = {**sync_backends, **async_backends}
@@ -0,0 +1,157 @@
+import asyncio
+
+import pytest
+
+from mongo_thingy import connect, connection, disconnect, routing, tenant
+
+
+@pytest.mark.all_backends
+def test_connect_lazy(thingy_cls, client_cls):
+    class Foo(thingy_cls):
+        pass
+
+    thingy_cls.connect(client_cls=client_cls, database_name="database", lazy=True)
+    assert thingy_cls._client is None
+    assert thingy_cls._database is None
+
+    assert isinstance(Foo.client, client_cls)
+    assert thingy_cls._client is Foo.client
+    assert Foo.database.name == "database"
+    assert Foo.collection.name == "foo"
+
+    client = Foo.client
+    thingy_cls._connection.open()
+    assert Foo.client is client
+
+    thingy_cls.disconnect()
+    assert thingy_cls._connection is None
+    with pytest.raises(AttributeError):
+        Foo.client
+
+
+@pytest.mark.all_backends
+def test_connect_after_fork(thingy_cls, client_cls):
+    class Foo(thingy_cls):
+        pass
+
+    thingy_cls.connect(client_cls=client_cls)
+    client = Foo.client
+    with tenant("mongo_thingy_tenant_a", uri="mongodb://localhost"):
+        tenant_client = Foo.client
+        tenant_collection = Foo.collection
+
+    connection._after_fork()
+    assert thingy_cls._client is client
+    assert Foo.client is not client
+    assert thingy_cls._client is Foo.client
+    with tenant("mongo_thingy_tenant_a", uri="mongodb://localhost"):
+        assert Foo.client is not tenant_client
+        assert Foo.collection is not tenant_collection
+    disconnect()
+
+
+@pytest.mark.all_backends
+def test_connect_after_fork_database(thingy_cls, client_cls):
+    class Foo(thingy_cls):
+        pass
+
+    thingy_cls.connect(client_cls=client_cls)
+    database = Foo.database
+    connection._after_fork()
+    assert Foo.database is not database
+    with tenant("mongo_thingy_tenant_a"):
+        connection._after_fork()
+        assert Foo.database.client is thingy_cls._client
+    disconnect()
+
+
+def test_connect_prewarm(thingy_cls, client_cls, monkeypatch):
+    calls = []
+    monkeypatch.setattr(
+        thingy_cls, "prewarm", classmethod(lambda c, n: calls.append(n))
+    )
+
+    thingy_cls.connect(client_cls=client_cls, prewarm=2)
+    assert calls == [2]
+
+    thingy_cls.connect(client_cls=client_cls, prewarm=2, lazy=True)
+    assert calls == [2]
+    thingy_cls.client
+    thingy_cls.client
+    assert calls == [2, 2]
+    disconnect()
+
+
+async def test_async_connect_prewarm(thingy_cls, client_cls, monkeypatch):
+    calls = []
+
+    async def prewarm(cls, connections):
+        calls.append(connections)
+
+    monkeypatch.setattr(thingy_cls, "prewarm", classmethod(prewarm))
+
+    thingy_cls.connect(client_cls=client_cls, prewarm=2, lazy=True)
+    thingy_cls.client
+    await asyncio.sleep(0)
+    assert calls == [2]
+    disconnect()
+
+
+def test_connect_prewarm_without_loop(thingy_cls, client_cls, monkeypatch):
+    async def prewarm(cls, connections):
+        raise AssertionError("Should not run without a loop")
+
+    monkeypatch.setattr(thingy_cls, "prewarm", classmethod(prewarm))
+    thingy_cls.connect(client_cls=client_cls, prewarm=2)
+    assert thingy_cls._client is not None
+    disconnect()
+
+
+def test_prewarm(thingy_cls, client_cls):
+    connect(client_cls=client_cls)
+    thingy_cls.prewarm(3)
+    disconnect()
+
+
+async def test_async_prewarm(thingy_cls, client_cls):
+    thingy_cls.connect(client_cls=client_cls)
+    await thingy_cls.prewarm(3)
+    disconnect()
+
+
+def test_register_after_fork():
+    calls = []
+    callback = connection.register_after_fork(lambda: calls.append(True))
+    try:
+        connection._after_fork()
+        assert calls == [True]
+    finally:
+        connection._after_fork_callbacks.remove(callback)
+    assert routing._clients == {}
+
+
+async def test_gather():
+    calls = []
+
+    async def close(name):
+        calls.append(name)
+
+    assert connection.gather(None, None) is None
+    await connection.gather(None, close("foo"), close("bar"))
+    assert calls == ["foo", "bar"]
+
+
+async def test_async_disconnect_awaitable(thingy_cls, client_cls):
+    closed = []
+
+    class Client(client_cls):
+        async def close(self):
+            closed.append(self)
+
+    connect(client_cls=Client)
+    client = thingy_cls.client
+    with tenant("mongo_thingy_tenant_a", uri="mongodb://localhost"):
+        tenant_client = thingy_cls.client
+
+    await disconnect()
+    assert closed == [client, tenant_client]
@@ -0,0 +1,187 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from mongo_thingy import counters
+from mongo_thingy.counters import AsyncCounter, BaseCounter, Counter
+
+
+@pytest.fixture
+def counter_cls(is_async):
+    if is_async:
+        return AsyncCounter
+    return Counter
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+async def async_wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not await predicate():
+        assert time.monotonic() < deadline
+        await asyncio.sleep(0.01)
+
+
+def fail(*args, **kwargs):
+    raise RuntimeError("nope")
+
+
+def test_counter(TestThingy, collection):
+    counter = Counter(TestThingy, flush_interval=60)
+    for i in range(3):
+        counter.increment("foo", "views")
+    counter.increment("foo", "likes", 2)
+    counter.increment("bar", "views")
+    assert counter.size == 2
+    assert collection.count_documents({}) == 0
+
+    counter.flush()
+    assert counter.size == 0
+    assert collection.find_one("foo") == {"_id": "foo", "views": 3, "likes": 2}
+    assert collection.find_one("bar") == {"_id": "bar", "views": 1}
+
+    counter.increment("foo", "views")
+    counter.close()
+    assert collection.find_one("foo")["views"] == 4
+    assert not counter.thread.is_alive()
+    with pytest.raises(ValueError):
+        counter.increment("foo", "views")
+
+
+def test_counter_batches(TestThingy, collection):
+    counter = Counter(TestThingy, batch_size=2, flush_interval=60)
+    counter.increment("foo", "views")
+    counter.increment("bar", "views")
+    wait_for(lambda: collection.count_documents({}) == 2)
+    counter.close()
+
+    counter = Counter(TestThingy, flush_interval=0.01)
+    counter.increment("baz", "views")
+    wait_for(lambda: collection.count_documents({}) == 3)
+    counter.close()
+
+
+def test_counter_threads(TestThingy, collection):
+    counter = Counter(TestThingy, batch_size=1, flush_interval=0.01)
+
+    def increment():
+        for i in range(500):
+            counter.increment("foo", "views")
+
+    threads = [threading.Thread(target=increment) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    counter.close()
+    assert collection.find_one("foo")["views"] == 2000
+
+
+def test_counter_errors(TestThingy, collection, monkeypatch):
+    monkeypatch.setattr(BaseCounter, "get_requests", fail)
+    counter = Counter(TestThingy, flush_interval=60)
+    counter.increment("foo", "views")
+    with pytest.raises(RuntimeError):
+        counter.flush()
+    assert counter.size == 0
+
+    counter.flush_interval = 0.01
+    counter.increment("foo", "views")
+    counter.wake()
+    wait_for(lambda: counter.size == 0)
+    monkeypatch.undo()
+    counter.close()
+    assert collection.count_documents({}) == 0
+
+
+def test_counter_at_exit(TestThingy, collection):
+    counter = Counter(TestThingy, flush_interval=60)
+    counter.increment("foo", "views")
+    assert counter in counters._counters
+    counters._close_at_exit()
+    assert counter not in counters._counters
+    assert collection.find_one("foo")["views"] == 1
+
+    counter = Counter(TestThingy, flush_interval=60)
+    counter.increment("foo", "views")
+    counter.flush = fail
+    counters._close_at_exit()
+
+
+def test_counter_after_fork(TestThingy, collection):
+    counter = Counter(TestThingy, flush_interval=60)
+    counter.increment("foo", "views")
+    thread = counter.thread
+    counters._forget_counters()
+    assert counters._counters == set()
+    assert counter.size == 0
+    assert counter.thread is None
+
+    counter.increment("foo", "views")
+    assert counter.thread is not thread
+    counter.close()
+    thread.join(0)
+    assert collection.find_one("foo")["views"] == 1
+
+
+async def test_async_counter(TestThingy, collection):
+    counter = AsyncCounter(TestThingy, flush_interval=60)
+    await counter.flush()
+    for i in range(3):
+        counter.increment("foo", "views")
+    counter.increment("foo", "likes", 2)
+    counter.increment("bar", "views")
+    assert await collection.count_documents({}) == 0
+
+    await counter.flush()
+    assert await collection.find_one("foo") == {"_id": "foo", "views": 3, "likes": 2}
+    assert await collection.find_one("bar") == {"_id": "bar", "views": 1}
+
+    counter.increment("foo", "views")
+    await counter.close()
+    assert (await collection.find_one("foo"))["views"] == 4
+    assert counter.task.done()
+    with pytest.raises(ValueError):
+        counter.increment("foo", "views")
+    await AsyncCounter(TestThingy).close()
+
+
+async def test_async_counter_batches(TestThingy, collection):
+    async def count(expected):
+        return await collection.count_documents({}) == expected
+
+    counter = AsyncCounter(TestThingy, batch_size=2, flush_interval=60)
+    counter.increment("foo", "views")
+    counter.increment("bar", "views")
+    await async_wait_for(lambda: count(2))
+    await counter.close()
+
+    counter = AsyncCounter(TestThingy, flush_interval=0.01)
+    counter.increment("baz", "views")
+    await async_wait_for(lambda: count(3))
+    await counter.close()
+
+
+async def test_async_counter_errors(TestThingy, collection, monkeypatch):
+    async def is_empty():
+        return counter.size == 0
+
+    monkeypatch.setattr(BaseCounter, "get_requests", fail)
+    counter = AsyncCounter(TestThingy, flush_interval=60)
+    counter.increment("foo", "views")
+    with pytest.raises(RuntimeError):
+        await counter.flush()
+
+    counter.increment("foo", "views")
+    counter.wake()
+    await async_wait_for(is_empty)
+    monkeypatch.undo()
+    await counter.close()
+    assert await collection.count_documents({}) == 0
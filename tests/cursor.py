@@ -177,6 +177,19 @@ def test_cursor_getitem(collection):
     assert result.bar == "qux"
 
 
+def test_cursor_iter(thingy_cls, collection):
+    class Foo(thingy_cls):
+        _collection = collection
+
+    collection.insert_many([{"bar": "baz"}, {"bar": "qux"}])
+    cursor = Cursor(collection.find(), thingy_cls=Foo)
+
+    results = list(cursor)
+    assert [result.bar for result in results] == ["baz", "qux"]
+    assert all(isinstance(result, Foo) for result in results)
+    assert [result.bar for result in cursor] == ["baz", "qux"]
+
+
 def test_cursor_clone(collection):
     collection.insert_many([{"bar": "baz"}, {"bar": "qux"}])
 
@@ -0,0 +1,98 @@
+import pytest
+from pymongo import ReadPreference
+
+from mongo_thingy.executor import (
+    ExecutorClient,
+    ExecutorCollection,
+    ExecutorCursor,
+    ExecutorDatabase,
+    executor_client_cls,
+)
+
+mongomock = pytest.importorskip("mongomock")
+
+
+@pytest.fixture
+def client():
+    client = executor_client_cls(mongomock.MongoClient, max_workers=2, batch_size=2)()
+    yield client
+    client.close()
+
+
+def test_executor_client_cls():
+    client_cls = executor_client_cls(mongomock.MongoClient, max_workers=2)
+    assert client_cls.__name__ == "ExecutorMongoClient"
+    assert issubclass(client_cls, ExecutorClient)
+    assert client_cls.max_workers == 2
+
+    client = client_cls()
+    assert isinstance(client.delegate, mongomock.MongoClient)
+    assert client.executor._max_workers == 2
+    client.close()
+
+
+def test_executor_handles(client):
+    database = client.get_database("database")
+    assert isinstance(database, ExecutorDatabase)
+    assert database == client["database"]
+    assert database != database.delegate
+    assert hash(database) == hash(database.delegate)
+    assert repr(database).startswith("ExecutorDatabase(")
+    assert database.name == "database"
+    assert database.client is client
+
+    collection = database.get_collection("foo")
+    assert isinstance(collection, ExecutorCollection)
+    assert collection == database["foo"] == database.foo
+    assert collection.database == database
+    assert collection.full_name == "database.foo"
+
+    options = {"read_preference": ReadPreference.NEAREST}
+    assert database.with_options(**options).delegate.read_preference.mongos_mode == (
+        "nearest"
+    )
+    assert collection.with_options(**options).delegate.read_preference.mongos_mode == (
+        "nearest"
+    )
+
+
+async def test_executor_collection(client):
+    collection = client.database.foo
+    await collection.insert_many([{"bar": i} for i in range(5)])
+    assert await collection.count_documents({}) == 5
+    assert (await collection.find_one({"bar": 1}))["bar"] == 1
+    assert await collection.create_index("bar") == "bar_1"
+
+    indexes = await collection.list_indexes().to_list(None)
+    assert [index["name"] for index in indexes] == ["_id_", "bar_1"]
+
+    cursor = collection.aggregate([{"$match": {"bar": {"$gt": 2}}}])
+    assert isinstance(cursor, ExecutorCursor)
+    assert [document["bar"] async for document in cursor] == [3, 4]
+
+    await client.drop_database("database")
+    assert await client.database.foo.count_documents({}) == 0
+
+
+async def test_executor_cursor(client):
+    collection = client.database.foo
+    await collection.insert_many([{"bar": i} for i in range(5)])
+
+    cursor = collection.find().sort("bar", -1).skip(1)
+    assert cursor.collection == collection
+    assert (await cursor.next())["bar"] == 3
+    assert len(cursor.buffer) == 1
+    assert [document["bar"] for document in await cursor.to_list(2)] == [2, 1]
+    assert [document["bar"] for document in await cursor.to_list(None)] == [0]
+    assert await cursor.to_list(None) == []
+
+    cursor = collection.find().batch_size(3)
+    assert (await cursor.__anext__())["bar"] == 0
+    assert len(cursor.buffer) == 2
+    assert [document["bar"] for document in await cursor.to_list(1)] == [1]
+    assert len(cursor.buffer) == 1
+
+    clone = cursor.clone()
+    assert clone.delegate is not cursor.delegate
+    assert (await clone.limit(-1).__anext__())["bar"] == 0
+    assert sorted(await collection.find().distinct("bar")) == [0, 1, 2, 3, 4]
@@ -0,0 +1,209 @@
+import pytest
+from pymongo import ASCENDING, DESCENDING
+
+from mongo_thingy import indexes, monitoring
+from mongo_thingy.indexes import QueryShape
+
+
+@pytest.fixture
+def advisor():
+    advisor = indexes.enable()
+    yield advisor
+    indexes.disable()
+
+
+def test_get_index_keys():
+    assert indexes.get_index_keys("foo") == (("foo", 1),)
+    assert indexes.get_index_keys(["foo", ("bar", -1)]) == (("foo", 1), ("bar", -1))
+    assert indexes.get_index_keys({"foo": 1, "bar": -1}) == (("foo", 1), ("bar", -1))
+
+
+def test_get_sort_keys():
+    assert indexes.get_sort_keys(None) == ()
+    assert indexes.get_sort_keys("foo") == (("foo", 1),)
+    assert indexes.get_sort_keys("foo", DESCENDING) == (("foo", -1),)
+    assert indexes.get_sort_keys([("foo", -1)]) == (("foo", -1),)
+
+
+def test_get_missing_indexes(TestThingy):
+    class Foo(TestThingy):
+        _indexes = [("foo", {}), ([("bar", -1)], {"unique": True})]
+
+    models = indexes.get_index_models(Foo)
+    assert [model.document for model in models] == [
+        {"key": {"foo": 1}, "name": "foo_1"},
+        {"key": {"bar": -1}, "name": "bar_-1", "unique": True},
+    ]
+    missing = indexes.get_missing_indexes(Foo, [{"name": "_id_"}, {"name": "foo_1"}])
+    assert [i.document["name"] for i in missing] == ["bar_-1"]
+
+
+def test_get_spec_hash(TestThingy):
+    class Foo(TestThingy):
+        _indexes = [("foo", {})]
+
+    spec_hash = indexes.get_spec_hash(Foo)
+    assert spec_hash == indexes.get_spec_hash(Foo)
+    assert indexes.get_cache_key(Foo).endswith("test_get_spec_hash.<locals>.Foo")
+
+    Foo.add_index("bar")
+    assert indexes.get_spec_hash(Foo) != spec_hash
+
+
+def test_query_shape_from_filter():
+    (shape,) = QueryShape.from_filter(
+        None,
+        {
+            "a": 1,
+            "b": {"$in": [1, 2]},
+            "c": {"$gt": 1},
+            "d": {"e": 1},
+            "$and": [{"f": 1}, {"g": {"$exists": True}}],
+            "$comment": "foo",
+        },
+        sort=[("h", -1)],
+    )
+    assert shape.equality == {"a", "b", "d", "f"}
+    assert shape.range == {"c", "g"}
+    assert shape.sort == (("h", -1),)
+    assert shape.fields == {"a", "b", "c", "d", "f", "g", "h"}
+
+    shapes = QueryShape.from_filter(
+        None, {"a": 1, "$or": [{"b": 1}, {"c": {"$lt": 1}}]}
+    )
+    assert [(s.equality, s.range) for s in shapes] == [
+        ({"a", "b"}, set()),
+        ({"a"}, {"c"}),
+    ]
+
+    (shape,) = QueryShape.from_filter(None, None)
+    assert not shape.fields
+
+
+def test_query_shape_is_supported():
+    shape = QueryShape(None, equality=["a", "b"], sort=[("c", 1)], range=["d"])
+    assert shape.is_supported([("a", 1), ("b", 1), ("c", 1), ("d", 1)])
+    assert shape.is_supported([("b", 1), ("a", -1), ("c", -1), ("d", 1), ("e", 1)])
+    assert not shape.is_supported([("a", 1), ("b", 1), ("d", 1), ("c", 1)])
+    assert not shape.is_supported([("a", 1), ("c", 1), ("b", 1), ("d", 1)])
+    assert not shape.is_supported([("a", 1), ("b", 1), ("c", 1)])
+    assert shape.suggest() == (("a", 1), ("b", 1), ("c", 1), ("d", 1))
+
+    shape = QueryShape(None, sort=[("a", 1), ("b", -1)])
+    assert shape.is_supported([("a", 1), ("b", -1)])
+    assert shape.is_supported([("a", -1), ("b", 1)])
+    assert not shape.is_supported([("a", 1), ("b", 1)])
+
+    shape = QueryShape(None, equality=["a"], sort=[("a", 1)])
+    assert shape.is_supported([("a", 1)])
+
+    shape = QueryShape(None, equality=["_id", "a"])
+    assert shape.is_supported([("_id", 1)])
+    assert shape.is_usable([("_id", 1)])
+    assert not shape.is_usable([("b", 1)])
+    assert not shape.is_usable([])
+
+
+def test_index_advisor(advisor, TestThingy, collection):
+    class Foo(TestThingy):
+        pass
+
+    Foo.add_index("unused")
+    Foo.add_index([("a", ASCENDING), ("c", DESCENDING)])
+    collection.create_index([("b", ASCENDING), ("c", ASCENDING)])
+
+    list(Foo.find({"a": 1}).sort("c", DESCENDING).limit(1))
+    list(Foo.find({"a": 1, "b": {"$gt": 1}}).sort([("c", DESCENDING)]))
+    Foo.find({"never": "fetched"})
+    Foo.find_one({"b": 1}, sort=[("c", ASCENDING)])
+    Foo.find_one({"_id": 1})
+    Foo.count_documents({"d": 1, "e": {"$lt": 2}})
+    Foo.count_documents({"d": 1, "e": {"$lt": 2}})
+    Foo.count_documents({"d": 1})
+    Foo.update_one({"f": 1}, {"$set": {"g": 1}})
+    Foo.count_documents()
+    Foo(foo="bar").save()
+
+    report = advisor.report()
+    assert report.to_dict() == {
+        "unindexed": [
+            {
+                "thingy": "Foo",
+                "equality": ["d"],
+                "sort": [],
+                "range": ["e"],
+                "calls": 2,
+            },
+            {"thingy": "Foo", "equality": ["d"], "sort": [], "range": [], "calls": 1},
+            {"thingy": "Foo", "equality": ["f"], "sort": [], "range": [], "calls": 1},
+        ],
+        "suggestions": [
+            {"thingy": "Foo", "keys": [["a", 1], ["c", -1], ["b", 1]]},
+            {"thingy": "Foo", "keys": [["d", 1], ["e", 1]]},
+            {"thingy": "Foo", "keys": [["f", 1]]},
+        ],
+        "unused": [{"thingy": "Foo", "keys": [["unused", 1]]}],
+    }
+
+    report = advisor.report(live=False)
+    assert {"thingy": "Foo", "keys": [["b", 1], ["c", 1]]} in (
+        report.to_dict()["suggestions"]
+    )
+
+
+async def test_async_index_advisor(advisor, TestThingy, collection):
+    class Foo(TestThingy):
+        pass
+
+    Foo.add_index("a")
+    await collection.create_index("b")
+
+    await Foo.find({"a": 1}).to_list(None)
+    await Foo.count_documents({"b": 1})
+    await Foo.count_documents({"c": 1})
+
+    report = await advisor.async_report()
+    assert report.to_dict() == {
+        "unindexed": [
+            {"thingy": "Foo", "equality": ["c"], "sort": [], "range": [], "calls": 1}
+        ],
+        "suggestions": [{"thingy": "Foo", "keys": [["c", 1]]}],
+        "unused": [],
+    }
+
+    report = await advisor.async_report(live=False)
+    assert len(report.unindexed) == 2
+
+
+async def test_async_list_indexes(TestThingy):
+    class Collection:
+        def __init__(self, indexes):
+            self.indexes = indexes
+
+        def list_indexes(self):
+            return self.indexes
+
+    class Cursor:
+        async def to_list(self, length):
+            return [{"key": {"_id": 1}}]
+
+    async def command_cursor():
+        return Cursor()
+
+    class Foo(TestThingy):
+        _collection = Collection(Cursor())
+
+    assert await indexes.async_list_indexes(Foo) == [{"key": {"_id": 1}}]
+
+    Foo._collection = Collection(command_cursor())
+    assert await indexes.async_list_indexes(Foo) == [{"key": {"_id": 1}}]
+
+
+def test_enable_disable():
+    advisor = indexes.enable()
+    assert indexes.advisor is advisor
+    assert advisor in monitoring.listeners
+
+    indexes.disable()
+    assert indexes.advisor is None
+    assert advisor not in monitoring.listeners
@@ -0,0 +1,125 @@
+import pytest
+
+from mongo_thingy import metrics, monitoring
+
+
+@pytest.fixture
+def collector():
+    collector = metrics.enable()
+    yield collector
+    metrics.disable()
+
+
+def test_histogram():
+    histogram = metrics.Histogram(buckets=[1, 2])
+    histogram.observe(0.5)
+    histogram.observe(1)
+    histogram.observe(3)
+
+    assert histogram.count == 3
+    assert histogram.sum == 4.5
+    assert histogram.to_dict() == {
+        "buckets": {1: 2, 2: 2, float("inf"): 3},
+        "count": 3,
+        "sum": 4.5,
+    }
+
+
+def test_enable_disable():
+    collector = metrics.enable()
+    assert metrics.collector is collector
+    assert collector in monitoring.listeners
+
+    other = metrics.enable(metrics.Metrics())
+    assert collector not in monitoring.listeners
+    assert other in monitoring.listeners
+
+    metrics.disable()
+    assert metrics.collector is None
+    assert other not in monitoring.listeners
+
+    metrics.increment(None, "foo")
+    metrics.set_gauge(None, "foo", 1)
+
+
+def test_metrics(collector, TestThingy, collection):
+    thingy = TestThingy(bar="baz").save()
+    TestThingy.find_one(thingy.id)
+    TestThingy.find_one_and_update(thingy.id, {"$set": {"bar": "qux"}})
+    with pytest.raises(Exception):
+        TestThingy(_id=thingy.id).save(force_insert=True)
+
+    metrics.increment(TestThingy, "dropped_writes", 2)
+    metrics.set_gauge(TestThingy, "queue_depth", 3)
+
+    snapshot = collector.snapshot()["TestThingy"]
+    operations = snapshot["operations"]
+    assert operations["save"]["calls"] == 2
+    assert operations["save"]["errors"] == 1
+    assert operations["save"]["bytes"] > 0
+    assert operations["save"]["latency"]["count"] == 2
+    assert operations["find"]["calls"] == 1
+    assert operations["find_one"]["calls"] == 1
+    assert operations["find_one_and_update"]["documents"] == 1
+    assert operations["bind"]["documents"] == 1
+    assert operations["bind"]["bytes"] > 0
+    assert operations["bind"]["bind_time"] > 0
+    assert snapshot["counters"] == {"dropped_writes": 2}
+    assert snapshot["gauges"] == {"queue_depth": 3}
+
+    collector.reset()
+    assert collector.snapshot() == {}
+
+
+async def test_async_metrics(collector, TestThingy, collection):
+    thingy = await TestThingy(bar="baz").save()
+    await TestThingy.find_one(thingy.id)
+    assert await TestThingy.count_documents() == 1
+
+    operations = collector.snapshot()["TestThingy"]["operations"]
+    assert operations["save"]["calls"] == 1
+    assert operations["count_documents"]["calls"] == 1
+    assert operations["bind"]["documents"] == 1
+
+
+def test_metrics_export(collector):
+    class Foo:
+        pass
+
+    event = monitoring.OperationEvent(Foo, "find")
+    event.duration = 0.002
+    collector.succeeded(event)
+    collector.failed(event)
+    metrics.increment(Foo, "dropped_writes")
+    metrics.increment(None, "dropped_writes")
+    metrics.set_gauge(Foo, "queue_depth", 3)
+
+    export = collector.export()
+    assert "# TYPE mongo_thingy_operations_total counter" in export
+    assert 'mongo_thingy_operations_total{thingy="Foo",operation="find"} 2' in export
+    assert (
+        'mongo_thingy_operation_errors_total{thingy="Foo",operation="find"} 1' in export
+    )
+    assert (
+        "mongo_thingy_operation_duration_seconds_bucket"
+        '{thingy="Foo",operation="find",le="0.001"} 0'
+    ) in export
+    assert (
+        "mongo_thingy_operation_duration_seconds_bucket"
+        '{thingy="Foo",operation="find",le="0.0025"} 2'
+    ) in export
+    assert (
+        "mongo_thingy_operation_duration_seconds_bucket"
+        '{thingy="Foo",operation="find",le="+Inf"} 2'
+    ) in export
+    assert (
+        'mongo_thingy_operation_duration_seconds_count{thingy="Foo",operation="find"} 2'
+        in export
+    )
+    assert export.count("# TYPE mongo_thingy_dropped_writes_total counter") == 1
+    assert 'mongo_thingy_dropped_writes_total{thingy=""} 1' in export
+    assert 'mongo_thingy_dropped_writes_total{thingy="Foo"} 1' in export
+    assert 'mongo_thingy_queue_depth{thingy="Foo"} 3' in export
+
+    collector.reset()
+    assert collector.export() == "\n"
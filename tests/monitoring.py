@@ -0,0 +1,295 @@
+import pytest
+
+from mongo_thingy import monitoring
+from mongo_thingy.cursor import AsyncCursor, Cursor
+
+
+class Listener(monitoring.OperationListener):
+    def __init__(self):
+        self.started_events = []
+        self.succeeded_events = []
+        self.failed_events = []
+        self.bound_events = []
+        self.chained_events = []
+
+    def started(self, event):
+        self.started_events.append(event)
+
+    def succeeded(self, event):
+        self.succeeded_events.append(event)
+
+    def failed(self, event):
+        self.failed_events.append(event)
+
+    def bound(self, event):
+        self.bound_events.append(event)
+
+    def chained(self, event):
+        self.chained_events.append(event)
+
+    @property
+    def operations(self):
+        return [(e.operation, e.depth) for e in self.succeeded_events]
+
+
+@pytest.fixture
+def listener():
+    listener = monitoring.register(Listener())
+    yield listener
+    monitoring.unregister(listener)
+
+
+def test_register_unregister():
+    listener = monitoring.OperationListener()
+    assert monitoring.register(listener) is listener
+    assert monitoring.register(listener) is listener
+    assert monitoring.listeners.count(listener) == 1
+
+    monitoring.unregister(listener)
+    monitoring.unregister(listener)
+    assert listener not in monitoring.listeners
+
+
+def test_operation_listener(TestThingy, collection):
+    listener = monitoring.register(monitoring.OperationListener())
+    try:
+        thingy = TestThingy().save()
+        TestThingy.find_one(thingy.id)
+        TestThingy.find().limit(1)
+        with pytest.raises(Exception):
+            TestThingy(_id=thingy.id).save(force_insert=True)
+    finally:
+        monitoring.unregister(listener)
+
+
+def test_get_size():
+    assert monitoring.get_size({}) == 5
+    assert monitoring.get_size({"foo": "bar"}) == 18
+    assert monitoring.get_size({"foo": object()}) == 0
+
+
+def test_operation_event():
+    event = monitoring.OperationEvent(None, "find", ({"foo": "bar"},))
+    assert event.filter == {"foo": "bar"}
+    assert event.documents == 0
+    assert event.size == 0
+
+    event = monitoring.OperationEvent(None, "delete_one", ("foo",))
+    assert event.filter == {"_id": "foo"}
+
+    event = monitoring.OperationEvent(None, "find", (), {"filter": {"foo": "bar"}})
+    assert event.filter == {"foo": "bar"}
+
+    event = monitoring.OperationEvent(None, "find")
+    assert event.filter is None
+
+    event = monitoring.OperationEvent(None, "distinct", ("foo", {"bar": "baz"}))
+    assert event.filter == {"bar": "baz"}
+
+
+def test_operation_disabled():
+    with monitoring.operation(None, "foo") as event:
+        assert event is None
+
+
+def test_operation_stop_iteration(listener):
+    with pytest.raises(StopIteration):
+        with monitoring.operation(None, "foo"):
+            raise StopIteration
+
+    assert listener.operations == [("foo", 0)]
+    assert not listener.failed_events
+
+
+def test_thingy_operations(listener, TestThingy, collection):
+    thingy = TestThingy(bar="baz").save()
+    assert TestThingy.count_documents({"bar": "baz"}) == 1
+    assert TestThingy.find_one(thingy.id) == thingy
+    TestThingy.find_one_and_update(thingy.id, {"$set": {"bar": "qux"}})
+    thingy.delete()
+
+    assert listener.operations == [
+        ("save", 0),
+        ("count_documents", 0),
+        ("find", 1),
+        ("cursor.first", 1),
+        ("find_one", 0),
+        ("find_one_and_update", 0),
+        ("delete", 0),
+    ]
+    assert [e.operation for e in listener.started_events] == [
+        "save",
+        "count_documents",
+        "find_one",
+        "find",
+        "cursor.first",
+        "find_one_and_update",
+        "delete",
+    ]
+
+    save, count, find, _, find_one, find_one_and_update, delete = (
+        listener.succeeded_events
+    )
+    assert save.thingy_cls is TestThingy
+    assert save.thingy is thingy
+    assert save.filter == {"_id": thingy.id}
+    assert save.size > 0
+    assert count.filter == {"bar": "baz"}
+    assert count.result == 1
+    assert find_one.filter == {"_id": thingy.id}
+    assert find_one_and_update.documents == 1
+    assert find_one_and_update.size > 0
+    assert delete.filter == {"_id": thingy.id}
+    assert all(e.duration >= 0 for e in listener.succeeded_events)
+
+    (bound,) = listener.bound_events
+    assert bound.thingy_cls is TestThingy
+    assert bound.cursor.thingy_cls is TestThingy
+    assert bound.size > 0
+
+
+async def test_async_thingy_operations(listener, TestThingy, collection):
+    thingy = await TestThingy(bar="baz").save()
+    assert await TestThingy.count_documents({"bar": "baz"}) == 1
+    assert await TestThingy.find_one(thingy.id) == thingy
+    await TestThingy.find_one_and_update(thingy.id, {"$set": {"bar": "qux"}})
+    await thingy.delete()
+
+    assert listener.operations == [
+        ("save", 0),
+        ("count_documents", 0),
+        ("find", 1),
+        ("cursor.first", 1),
+        ("find_one", 0),
+        ("find_one_and_update", 0),
+        ("delete", 0),
+    ]
+    assert len(listener.bound_events) == 1
+
+
+def test_thingy_operation_failed(listener, TestThingy, collection):
+    thingy = TestThingy().save()
+    with pytest.raises(Exception):
+        TestThingy(_id=thingy.id).save(force_insert=True)
+
+    (failed,) = listener.failed_events
+    assert failed.operation == "save"
+    assert failed.error is not None
+    assert failed.duration >= 0
+
+
+async def test_async_thingy_operation_failed(listener, TestThingy, collection):
+    thingy = await TestThingy().save()
+    with pytest.raises(Exception):
+        await TestThingy(_id=thingy.id).save(force_insert=True)
+    with pytest.raises(Exception):
+        await TestThingy.update_one({"$foo": 1}, {"$set": {"bar": "baz"}})
+
+    assert [e.operation for e in listener.failed_events] == ["save", "update_one"]
+
+
+def test_instrument_sync_failed(listener):
+    class Foo:
+        @monitoring.instrument
+        def foo(self):
+            raise ValueError
+
+    with pytest.raises(ValueError):
+        Foo().foo()
+
+    (failed,) = listener.failed_events
+    assert failed.operation == "foo"
+    assert isinstance(failed.error, ValueError)
+    assert isinstance(failed.thingy, Foo)
+    assert failed.thingy_cls is Foo
+
+
+def test_cursor_operations(listener, TestThingy, collection):
+    collection.insert_many([{"bar": "baz"}, {"bar": "qux"}])
+    TestThingy.add_view("empty")
+
+    cursor = Cursor(collection.find(), thingy_cls=TestThingy, view="empty")
+    assert cursor.next() == {}
+    assert cursor[1] == {}
+    assert list(cursor) == [{}, {}]
+
+    assert listener.operations == [
+        ("cursor.__next__", 0),
+        ("cursor.__getitem__", 0),
+        ("cursor.__iter__", 0),
+    ]
+    assert listener.succeeded_events[-1].cursor is cursor
+    assert len(listener.bound_events) == 4
+    assert all(e.view_duration > 0 for e in listener.bound_events)
+
+
+def test_cursor_chained(listener, TestThingy, collection):
+    cursor = TestThingy.find().sort("foo", -1).limit(1)
+    assert [(e.name, e.args) for e in listener.chained_events] == [
+        ("sort", ("foo", -1)),
+        ("limit", (1,)),
+    ]
+    assert all(e.cursor is cursor for e in listener.chained_events)
+    assert all(e.thingy_cls is TestThingy for e in listener.chained_events)
+
+
+async def test_async_cursor_operations(listener, TestThingy, collection):
+    await collection.insert_many([{"bar": "baz"}, {"bar": "qux"}])
+
+    cursor = AsyncCursor(collection.find(), thingy_cls=TestThingy)
+    assert (await cursor.next()).bar == "baz"
+    assert len(await cursor.to_list(length=10)) == 1
+
+    async for thingy in AsyncCursor(collection.find(), thingy_cls=TestThingy):
+        assert isinstance(thingy, TestThingy)
+
+    assert listener.operations == [
+        ("cursor.__anext__", 0),
+        ("cursor.to_list", 0),
+        ("cursor.__iter__", 0),
+    ]
+    assert len(listener.bound_events) == 4
+
+
+def test_iterate(listener):
+    assert list(monitoring.iterate([1, 2], None, "foo")) == [1, 2]
+
+    for item in monitoring.iterate([1, 2], None, "bar"):
+        break
+
+    def fail():
+        yield 1
+        raise ValueError
+
+    with pytest.raises(ValueError):
+        list(monitoring.iterate(fail(), None, "baz"))
+
+    assert listener.operations == [("foo", 0), ("bar", 0)]
+    assert [e.operation for e in listener.failed_events] == ["baz"]
+    assert all(e.duration >= 0 for e in listener.succeeded_events)
+
+
+async def test_aiterate(listener):
+    async def iterable(fail=False):
+        yield 1
+        yield 2
+        if fail:
+            raise ValueError
+
+    assert [item async for item in monitoring.aiterate(iterable(), None, "foo")] == [
+        1,
+        2,
+    ]
+
+    with pytest.raises(ValueError):
+        async for item in monitoring.aiterate(iterable(fail=True), None, "bar"):
+            pass
+
+    assert listener.operations == [("foo", 0)]
+    assert [e.operation for e in listener.failed_events] == ["bar"]
+
+
+def test_iterate_disabled():
+    iterable = [1, 2]
+    assert monitoring.iterate(iterable, None, "foo") is iterable
+    assert monitoring.aiterate(iterable, None, "foo") is iterable
@@ -0,0 +1,29 @@
+import pytest
+
+from mongo_thingy.budget import QueryBudget
+
+
+def test_query_budget_fixture(query_budget, TestThingy, collection):
+    with query_budget(max_round_trips=1) as budget:
+        TestThingy.count_documents()
+
+    assert isinstance(budget, QueryBudget)
+    assert budget.round_trips == 1
+
+
+@pytest.mark.query_budget(max_round_trips=2)
+def test_query_budget_marker(TestThingy, collection):
+    TestThingy.count_documents()
+    TestThingy.count_documents()
+
+
+@pytest.mark.query_budget(max_round_trips=1)
+async def test_async_query_budget_marker(TestThingy, collection):
+    await TestThingy.count_documents()
+
+
+@pytest.mark.xfail(strict=True, raises=AssertionError)
+@pytest.mark.query_budget(max_round_trips=1)
+def test_query_budget_marker_exceeded(TestThingy, collection):
+    TestThingy.count_documents()
+    TestThingy.count_documents()
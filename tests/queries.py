@@ -0,0 +1,262 @@
+import asyncio
+import logging
+
+import pytest
+
+from mongo_thingy import monitoring, queries
+
+
+@pytest.fixture
+def stats():
+    stats = queries.enable(slow_threshold=float("inf"))
+    yield stats
+    queries.disable()
+
+
+def test_get_shape():
+    assert queries.get_shape(None) == {}
+    assert queries.get_shape({"foo": "bar"}) == {"foo": "?"}
+    assert queries.get_shape({"foo": {"bar": 1}}) == {"foo": "?"}
+    assert queries.get_shape({"foo": {}}) == {"foo": "?"}
+    assert queries.get_shape({"foo": {"$gt": 1, "$lt": 3}}) == {
+        "foo": {"$gt": "?", "$lt": "?"}
+    }
+    assert queries.get_shape({"foo": {"$in": [1, 2, 3]}}) == {"foo": {"$in": "?"}}
+    assert queries.get_shape({"foo": {"$not": {"$gt": 1}}}) == {
+        "foo": {"$not": {"$gt": "?"}}
+    }
+    assert queries.get_shape({"foo": {"$elemMatch": {"bar": 1, "baz": 2}}}) == {
+        "foo": {"$elemMatch": {"bar": "?", "baz": "?"}}
+    }
+    assert queries.get_shape({"$or": [{"foo": 1}, {"bar": {"$gt": 2}}]}) == {
+        "$or": [{"foo": "?"}, {"bar": {"$gt": "?"}}]
+    }
+
+
+def test_get_fingerprint():
+    assert queries.get_fingerprint({"b": 1, "a": 2}) == '{"a": "?", "b": "?"}'
+    assert queries.get_fingerprint({"a": 2, "b": 1}) == '{"a": "?", "b": "?"}'
+    assert queries.get_fingerprint({}) == "{}"
+
+
+def test_get_stages():
+    explanation = {
+        "queryPlanner": {
+            "winningPlan": {
+                "stage": "SORT",
+                "inputStage": {
+                    "stage": "OR",
+                    "inputStages": [{"stage": "COLLSCAN"}, {"stage": "IXSCAN"}],
+                },
+            }
+        }
+    }
+    plan = queries.get_winning_plan(explanation)
+    assert list(queries.get_stages(plan)) == ["SORT", "OR", "COLLSCAN", "IXSCAN"]
+
+    explanation = {"queryPlanner": {"winningPlan": {"queryPlan": {"stage": "FETCH"}}}}
+    assert queries.get_winning_plan(explanation) == {"stage": "FETCH"}
+
+
+def test_query_statistics():
+    statistics = queries.QueryStatistics(None, "find", {"foo": "bar"})
+    assert statistics.fingerprint == '{"foo": "?"}'
+    assert statistics.mean_time == 0
+    assert statistics.p99_time == 0
+    assert not statistics.collscan
+
+    for duration in range(1, 101):
+        statistics.observe(duration)
+    assert statistics.total_time == 5050
+    assert statistics.max_time == 100
+    assert statistics.mean_time == 50.5
+    assert statistics.p99_time == 99
+    assert statistics.get_percentile(50) == 50
+    assert statistics.get_percentile(0) == 1
+
+    statistics.set_explanation(
+        {"queryPlanner": {"winningPlan": {"stage": "SORT", "inputStage": {}}}}
+    )
+    assert statistics.in_memory_sort
+    assert not statistics.collscan
+
+
+def test_query_statistics_samples():
+    statistics = queries.QueryStatistics(None, "find", {}, samples=10)
+    for duration in range(1, 101):
+        statistics.observe(duration)
+    assert len(statistics.samples) == 10
+    assert statistics.mean_time == 50.5
+    assert statistics.get_percentile(0) == 91
+
+
+def test_query_stats(stats, TestThingy, collection):
+    collection.insert_many([{"bar": i} for i in range(3)])
+    TestThingy(bar=3).delete()
+
+    list(TestThingy.find({"bar": {"$gte": 1}}))
+    list(TestThingy.find({"bar": {"$gte": 0}}))
+    assert TestThingy.find_one({"bar": 1}).bar == 1
+    assert TestThingy.find_one({"bar": 4}) is None
+    assert TestThingy.count_documents({"bar": 2}) == 1
+    TestThingy.update_one({"bar": 2}, {"$set": {"baz": True}})
+    with pytest.raises(Exception):
+        TestThingy.update_one({"$bar": 2}, {"$set": {"baz": True}})
+
+    count, find, find_one, update_error, update = sorted(
+        stats.report(TestThingy), key=lambda s: (s.operation, s.fingerprint)
+    )
+    assert find.operation == "find"
+    assert find.fingerprint == '{"bar": {"$gte": "?"}}'
+    assert find.calls == 2
+    assert find.documents == 5
+    assert len(find.samples) == 2
+    assert find.total_time > 0
+
+    assert find_one.operation == "find_one"
+    assert find_one.calls == 2
+    assert find_one.documents == 1
+
+    assert count.operation == "count_documents"
+    assert count.calls == 1
+
+    assert update.operation == "update_one"
+    assert update.fingerprint == '{"bar": "?"}'
+    assert update_error.fingerprint == '{"$bar": "?"}'
+    assert update_error.errors == 1
+
+    assert stats.report(operation="find") == [find]
+    assert find.to_dict() == {
+        "thingy": "TestThingy",
+        "operation": "find",
+        "fingerprint": '{"bar": {"$gte": "?"}}',
+        "calls": 2,
+        "errors": 0,
+        "slow_calls": 0,
+        "documents": 5,
+        "total_time": find.total_time,
+        "mean_time": find.mean_time,
+        "p99_time": find.p99_time,
+        "max_time": find.max_time,
+        "plan": None,
+        "collscan": False,
+        "in_memory_sort": False,
+    }
+    assert stats.report(order_by="calls")[0].calls == 2
+
+    stats.reset()
+    assert stats.report() == []
+
+
+async def test_async_query_stats(stats, TestThingy, collection):
+    await collection.insert_many([{"bar": i} for i in range(3)])
+
+    assert len(await TestThingy.find({"bar": {"$gte": 1}}).to_list(None)) == 2
+    await TestThingy.find_one({"bar": 1})
+    await TestThingy.find_one_and_update({"bar": 1}, {"$set": {"baz": True}})
+
+    find, find_one, find_one_and_update = stats.report(order_by="operation")[::-1]
+    assert (find.operation, find.calls, find.documents) == ("find", 1, 2)
+    assert (find_one.operation, find_one.calls, find_one.documents) == (
+        "find_one",
+        1,
+        1,
+    )
+    assert find_one_and_update.documents == 1
+
+
+EXPLANATION = {"queryPlanner": {"winningPlan": {"stage": "COLLSCAN"}}}
+
+
+class ExplainingQueryStats(queries.QueryStats):
+    def __init__(self, explanation, **kwargs):
+        super().__init__(slow_threshold=0, **kwargs)
+        self.explanation = explanation
+        self.explained_events = []
+
+    def get_explanation(self, statistics, event):
+        self.explained_events.append(event)
+        if isinstance(self.explanation, Exception):
+            raise self.explanation
+        return self.explanation
+
+
+def test_query_stats_slow(TestThingy, collection, caplog):
+    stats = queries.enable(ExplainingQueryStats(EXPLANATION))
+    try:
+        with caplog.at_level(logging.WARNING, logger="mongo_thingy.queries"):
+            TestThingy.count_documents({"bar": 1})
+            TestThingy.count_documents({"bar": 2})
+            list(TestThingy.find({"bar": 1}))
+    finally:
+        queries.disable()
+
+    count, find = sorted(stats.report(), key=lambda s: s.operation)
+    assert count.slow_calls == 2
+    assert count.collscan
+    assert count.plan == {"stage": "COLLSCAN"}
+    assert find.collscan
+    assert len(stats.explained_events) == 2
+    assert stats.explained_events[1].cursor is not None
+    assert "Slow count_documents on TestThingy" in caplog.text
+
+
+def test_query_stats_slow_errors(TestThingy, collection):
+    error = ValueError()
+    stats = queries.enable(ExplainingQueryStats(error))
+    try:
+        TestThingy.count_documents({"bar": 1})
+        stats.explanation = None
+        TestThingy.count_documents({"baz": 1})
+    finally:
+        queries.disable()
+
+    second, first = stats.report(order_by="fingerprint")
+    assert first.explain_error is error
+    assert second.explain_error is not None
+    assert first.plan is None
+
+
+def test_query_stats_explain(TestThingy, collection):
+    stats = queries.QueryStats()
+    event = monitoring.OperationEvent(TestThingy, "find", ({"bar": 1},))
+    with pytest.raises(Exception):
+        stats.get_explanation(None, event)
+
+    cursor = TestThingy.find({"bar": 1})
+    event = monitoring.OperationEvent(TestThingy, "cursor.first", cursor=cursor)
+    with pytest.raises(Exception):
+        stats.get_explanation(None, event)
+
+
+async def test_async_query_stats_slow(TestThingy, collection):
+    async def explain():
+        return EXPLANATION
+
+    async def fail():
+        raise ValueError
+
+    stats = queries.enable(ExplainingQueryStats(None))
+    try:
+        stats.explanation = explain()
+        await TestThingy.count_documents({"bar": 1})
+        stats.explanation = fail()
+        await TestThingy.count_documents({"baz": 1})
+        await asyncio.sleep(0.01)
+    finally:
+        queries.disable()
+
+    second, first = stats.report(order_by="fingerprint")
+    assert first.collscan
+    assert isinstance(second.explain_error, ValueError)
+
+
+def test_enable_disable():
+    stats = queries.enable(slow_threshold=1)
+    assert stats.slow_threshold == 1
+    assert queries.stats is stats
+    assert stats in monitoring.listeners
+
+    queries.disable()
+    assert queries.stats is None
+    assert stats not in monitoring.listeners
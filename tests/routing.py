@@ -0,0 +1,191 @@
+import pytest
+from pymongo import ReadPreference
+from pymongo.read_preferences import SecondaryPreferred
+from thingy import registry
+
+from mongo_thingy import (
+    connect,
+    create_indexes,
+    disconnect,
+    read_your_writes,
+    tenant,
+)
+from mongo_thingy.routing import (
+    close_clients,
+    get_client,
+    get_read_preference,
+    with_read_preference,
+)
+
+
+def test_get_read_preference(TestThingy):
+    secondary = SecondaryPreferred(max_staleness=90)
+
+    class Report(TestThingy):
+        _read_preference = secondary
+
+    assert get_read_preference(TestThingy) is None
+    assert get_read_preference(TestThingy, ReadPreference.NEAREST).mongos_mode == (
+        "nearest"
+    )
+    assert get_read_preference(Report) is secondary
+
+    with read_your_writes():
+        assert get_read_preference(TestThingy) is None
+        assert get_read_preference(Report) == ReadPreference.PRIMARY
+    assert get_read_preference(Report) is secondary
+
+
+def test_with_read_preference(collection):
+    secondary = SecondaryPreferred(max_staleness=90)
+
+    derived = with_read_preference(collection, secondary)
+    assert derived.read_preference == secondary
+    assert derived.name == collection.name
+    assert with_read_preference(collection, secondary) is derived
+    assert (
+        with_read_preference(collection, SecondaryPreferred(max_staleness=90))
+        is derived
+    )
+
+    other = collection.database[collection.name + "_other"]
+    assert with_read_preference(other, secondary) is not derived
+    assert with_read_preference(collection, ReadPreference.NEAREST) is not derived
+
+
+async def test_async_with_read_preference(collection):
+    secondary = SecondaryPreferred(max_staleness=90)
+
+    derived = with_read_preference(collection, secondary)
+    assert derived.read_preference == secondary
+    assert with_read_preference(collection, secondary) is derived
+
+
+def test_thingy_read_preference(TestThingy, collection):
+    collection.insert_many([{"bar": "baz"}, {"bar": "qux"}])
+    secondary = SecondaryPreferred(max_staleness=90)
+
+    class Report(TestThingy):
+        _read_preference = secondary
+
+    assert TestThingy.get_read_collection() is collection
+    assert Report.get_read_collection().read_preference == secondary
+    assert Report.get_read_collection() is Report.get_read_collection()
+
+    cursor = Report.find()
+    assert cursor.delegate.collection.read_preference == secondary
+    assert len(list(cursor)) == 2
+    assert Report.find_one({"bar": "baz"}).bar == "baz"
+    assert Report.count_documents() == 2
+    assert sorted(Report.distinct("bar")) == ["baz", "qux"]
+
+    cursor = TestThingy.find(read_preference=secondary)
+    assert cursor.delegate.collection.read_preference == secondary
+    assert TestThingy.count_documents({"bar": "baz"}, read_preference=secondary) == 1
+    assert sorted(TestThingy.distinct("bar", read_preference=secondary)) == [
+        "baz",
+        "qux",
+    ]
+
+    with read_your_writes():
+        Report(bar="quux").save()
+        cursor = Report.find({"bar": "quux"})
+        assert cursor.delegate.collection.read_preference == ReadPreference.PRIMARY
+        assert cursor.first().bar == "quux"
+
+
+def test_tenant(thingy_cls, database):
+    class Foo(thingy_cls):
+        _database = database
+
+    class Shared(thingy_cls):
+        _database = database
+        _tenanted = False
+
+    with tenant("mongo_thingy_tenant_a"):
+        assert Foo.database.name == "mongo_thingy_tenant_a"
+        assert Foo.database.client is database.client
+        assert Foo.collection.name == "foo"
+        assert Foo.collection is Foo.collection
+        assert Shared.database is database
+        Foo(bar="baz").save()
+        assert Foo.count_documents() == 1
+
+        with tenant("mongo_thingy_tenant_b"):
+            assert Foo.database.name == "mongo_thingy_tenant_b"
+            assert Foo.count_documents() == 0
+
+    assert Foo.database is database
+    assert Foo.count_documents({"bar": "baz"}) == 0
+    Foo.database.client.drop_database("mongo_thingy_tenant_a")
+
+
+async def test_async_tenant(thingy_cls, database):
+    class Foo(thingy_cls):
+        _database = database
+
+    with tenant("mongo_thingy_tenant_a"):
+        assert Foo.database.name == "mongo_thingy_tenant_a"
+        await Foo(bar="baz").save()
+        assert await Foo.count_documents() == 1
+
+    assert await Foo.count_documents({"bar": "baz"}) == 0
+    await Foo.database.client.drop_database("mongo_thingy_tenant_a")
+
+
+@pytest.mark.ignore_backends("montydb")
+def test_tenant_create_indexes(thingy_cls, database):
+    del registry[:]
+
+    class Foo(thingy_cls):
+        _database = database
+        _indexes = [("foo", {})]
+
+    with tenant("mongo_thingy_tenant_a"):
+        create_indexes()
+        assert len(Foo.collection.index_information()) == 2
+
+    assert Foo.collection.index_information() == {}
+    Foo.database.client.drop_database("mongo_thingy_tenant_a")
+
+
+def test_tenant_collection(TestThingy):
+    with tenant("mongo_thingy_tenant_a"):
+        assert TestThingy.collection is TestThingy._collection
+
+
+@pytest.mark.all_backends
+def test_tenant_uri(thingy_cls, client_cls):
+    class Foo(thingy_cls):
+        _client_cls = client_cls
+
+    uri = "mongodb://localhost"
+    with tenant("mongo_thingy_tenant_a", uri=uri):
+        client = Foo.client
+        assert isinstance(client, client_cls)
+        assert Foo.database.name == "mongo_thingy_tenant_a"
+        assert Foo.collection.name == "foo"
+
+    with tenant("mongo_thingy_tenant_b", uri=uri):
+        assert Foo.client is client
+        assert Foo.database.name == "mongo_thingy_tenant_b"
+
+    assert get_client(client_cls, uri) is client
+    disconnect()
+    assert get_client(client_cls, uri) is not client
+    close_clients()
+
+
+def test_tenant_connect(thingy_cls, client_cls):
+    class Foo(thingy_cls):
+        pass
+
+    connect(client_cls=client_cls)
+    with tenant("mongo_thingy_tenant_a"):
+        client = Foo.client
+        assert Foo.database.client is client
+
+    connect(client_cls=client_cls)
+    with tenant("mongo_thingy_tenant_a"):
+        assert Foo.client is not client
+    disconnect()
@@ -0,0 +1,105 @@
+import asyncio
+import threading
+
+import pytest
+
+from mongo_thingy import query_budget, sequences
+from mongo_thingy.sequences import (
+    AsyncSequence,
+    AsyncSequential,
+    Sequence,
+    Sequential,
+)
+
+
+@pytest.fixture
+async def TestSequence(is_async, database):
+    class TestSequence(AsyncSequence if is_async else Sequence):
+        _database = database
+
+    if is_async:
+        await TestSequence.collection.delete_many({})
+    else:
+        TestSequence.collection.delete_many({})
+    return TestSequence
+
+
+@pytest.fixture
+def TestSequential(is_async, TestSequence, TestThingy):
+    class TestSequential(AsyncSequential if is_async else Sequential, TestThingy):
+        _sequence_cls = TestSequence
+        _block_size = 3
+
+    return TestSequential
+
+
+def test_sequential(TestSequential, TestSequence, collection):
+    with query_budget() as budget:
+        thingies = [TestSequential(bar=i).save() for i in range(4)]
+
+    assert [thingy.id for thingy in thingies] == [1, 2, 3, 4]
+    assert [e.operation for e in budget.events].count("find_one_and_update") == 2
+    assert collection.find_one(4)["bar"] == 3
+
+    sequence = TestSequence.find_one(collection.name)
+    assert sequence.value == 6
+    assert TestSequential(_id=42).save().id == 42
+    assert TestSequential().save().id == 5
+
+
+def test_sequential_name(TestSequential, TestSequence):
+    class Foo(TestSequential):
+        _sequence_name = "foo"
+
+    assert Foo.get_sequence_name() == "foo"
+    assert Foo().save().id == 1
+    assert TestSequential().save().id == 1
+    assert TestSequence.count_documents() == 2
+
+
+def test_sequential_threads(TestSequential, TestSequence, monkeypatch):
+    lock = threading.Lock()
+    reserved = []
+
+    # Mongomock isn't thread-safe: only the blocks are shared by the threads
+    def reserve(cls, name, size):
+        with lock:
+            reserved.append(size)
+            return sum(reserved)
+
+    monkeypatch.setattr(TestSequence, "reserve", classmethod(reserve))
+    ids = []
+
+    def take():
+        for i in range(20):
+            ids.append(TestSequential.get_next_id())
+
+    threads = [threading.Thread(target=take) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(ids) == list(range(1, 81))
+    assert len(reserved) == 27
+
+
+def test_sequential_after_fork(TestSequential):
+    assert TestSequential().save().id == 1
+    sequences._forget_blocks()
+    assert sequences._blocks == {}
+    assert TestSequential().save().id == 4
+
+
+async def test_async_sequential(TestSequential, TestSequence, collection):
+    with query_budget() as budget:
+        thingies = await asyncio.gather(*[TestSequential().save() for i in range(5)])
+
+    assert sorted(thingy.id for thingy in thingies) == [1, 2, 3, 4, 5]
+    assert [e.operation for e in budget.events].count("find_one_and_update") == 2
+    assert await collection.count_documents({}) == 5
+
+    sequence = await TestSequence.find_one(collection.name)
+    assert sequence.value == 6
+    assert (await TestSequential(_id=42).save()).id == 42
+    assert (await TestSequential().save()).id == 6
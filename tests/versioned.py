@@ -1,6 +1,84 @@
+from datetime import datetime, timedelta, timezone
+
 import pytest
+from bson import ObjectId
 
+from mongo_thingy import metrics, query_budget, write_behind
+from mongo_thingy.camelcase import CamelCaseStorage
 from mongo_thingy.cursor import AsyncCursor, Cursor
+from mongo_thingy.sequences import (
+    AsyncSequence,
+    AsyncSequential,
+    Sequence,
+    Sequential,
+)
+from mongo_thingy.versioned import (
+    AsyncDeferredRevision,
+    DeferredRevision,
+    Versioned,
+    apply_delta,
+    get_delta,
+    get_kept,
+)
+
+
+@pytest.fixture
+async def TestDeferredThingy(is_async, TestVersionedThingy, TestRevision, database):
+    deferred_cls = AsyncDeferredRevision if is_async else DeferredRevision
+
+    class TestDeferredRevision(deferred_cls):
+        _database = database
+        _flush_interval = 60
+
+    class TestDeferredThingy(TestVersionedThingy):
+        _revision_cls = TestDeferredRevision
+
+    yield TestDeferredThingy
+    closing = write_behind.close()
+    if closing is not None:
+        await closing
+
+
+def get_document(thingy):
+    """Return the document of a thingy, as stored in its revisions"""
+    return {k: v for k, v in thingy.__dict__.items() if k != "revision_chain"}
+
+
+def day(n, hour=0):
+    return datetime(2020, 1, n, hour)
+
+
+def date_revisions(TestRevision):
+    revisions = TestRevision.collection.find().sort("_id", 1)
+    for i, revision in enumerate(list(revisions)):
+        update = {"$set": {"creation_date": day(i + 1)}}
+        TestRevision.collection.update_one({"_id": revision["_id"]}, update)
+
+
+async def async_date_revisions(TestRevision):
+    revisions = TestRevision.collection.find().sort("_id", 1)
+    for i, revision in enumerate(await revisions.to_list(None)):
+        update = {"$set": {"creation_date": day(i + 1)}}
+        await TestRevision.collection.update_one({"_id": revision["_id"]}, update)
+
+
+@pytest.fixture
+def TestDeltaThingy(TestVersionedThingy):
+    class TestDeltaThingy(TestVersionedThingy):
+        _delta_revisions = True
+        _snapshot_interval = 3
+
+    return TestDeltaThingy
+
+
+def test_delta():
+    before = {"_id": 1, "foo": "bar", "baz": [1], "qux": None}
+    after = {"_id": 1, "foo": "bar", "baz": [1, 2], "quux": None}
+    delta = get_delta(before, after)
+    assert delta == {"set": {"baz": [1, 2], "quux": None}, "unset": ["qux"]}
+    assert apply_delta(before, delta) == after
+    assert before["baz"] == [1]
+    assert get_delta(after, after) == {}
 
 
 def test_revision_save(TestRevision):
@@ -17,13 +95,13 @@ async def test_async_revision_save(TestRevision):
 def test_revision_indexes(TestRevision):
     TestRevision.create_indexes()
     indexes = TestRevision.collection.index_information()
-    assert "document_id_-1_document_type_-1" in indexes
+    assert "document_id_1_document_type_1__id_1" in indexes
 
 
 async def test_async_revision_indexes(TestRevision):
     await TestRevision.create_indexes()
     indexes = await TestRevision.collection.index_information()
-    assert "document_id_-1_document_type_-1" in indexes
+    assert "document_id_1_document_type_1__id_1" in indexes
 
 
 def test_versioned_get_revisions(TestVersionedThingy):
@@ -141,6 +219,56 @@ def test_versioned_revisions_operation(TestVersionedThingy):
     assert revisions[2].operation == "delete"
 
 
+def test_versioned_save_round_trips(TestVersionedThingy):
+    with query_budget(max_round_trips=2) as budget:
+        thingy = TestVersionedThingy({"_id": "foo", "bar": "baz"}).save()
+    assert [e.operation for e in budget.events] == ["save", "save"]
+    assert thingy.get_revisions()[0].operation == "create"
+
+    with query_budget(max_round_trips=2):
+        thingy.save()
+    assert thingy.get_revisions()[1].operation == "update"
+
+
+class Hooked:
+    def save(self, *args, **kwargs):
+        self.hooked = True
+        return super(Hooked, self).save(*args, **kwargs)
+
+
+def test_versioned_save_mixins(TestVersioned, TestThingy, database):
+    class TestSequence(Sequence):
+        _database = database
+
+    class Foo(TestVersioned, Hooked, Sequential, TestThingy):
+        _sequence_cls = TestSequence
+
+    thingy = Foo(bar="baz").save()
+    assert isinstance(thingy.id, int)
+    assert thingy.hooked is True
+    assert "_written" not in Foo.collection.find_one(thingy.id)
+
+    revision = thingy.get_revisions()[0]
+    assert revision.document_id == thingy.id
+    assert revision.document == thingy.__dict__
+    assert revision.operation == "create"
+
+
+class Refreshed:
+    @classmethod
+    def _from_document(cls, document):
+        return super(Refreshed, cls)._from_document(dict(document, refreshed=True))
+
+
+def test_versioned_save_refresh(TestVersionedThingy):
+    class TestRefreshedThingy(Refreshed, TestVersionedThingy):
+        pass
+
+    thingy = TestRefreshedThingy(bar="baz").save(refresh=True)
+    assert thingy.refreshed is True
+    assert thingy.get_revisions()[0].document == thingy.__dict__
+
+
 async def test_async_versioned_revisions_operation(TestVersionedThingy):
     thingy = await TestVersionedThingy({"bar": "baz"}).save()
     revisions = await thingy.get_revisions().to_list(length=10)
@@ -156,6 +284,39 @@ async def test_async_versioned_revisions_operation(TestVersionedThingy):
     assert revisions[2].operation == "delete"
 
 
+async def test_async_versioned_save_round_trips(TestVersionedThingy):
+    with query_budget(max_round_trips=4):
+        thingy = await TestVersionedThingy({"_id": "foo", "bar": "baz"}).save()
+        await thingy.save()
+
+    revisions = await thingy.get_revisions().to_list(length=10)
+    assert [revision.operation for revision in revisions] == ["create", "update"]
+
+
+async def test_async_versioned_save_mixins(TestVersioned, TestThingy, database):
+    class TestSequence(AsyncSequence):
+        _database = database
+
+    class Foo(TestVersioned, AsyncSequential, TestThingy):
+        _sequence_cls = TestSequence
+
+    thingy = await Foo(bar="baz").save()
+    assert isinstance(thingy.id, int)
+    revision = await thingy.get_revisions().first()
+    assert revision.document_id == thingy.id
+    assert revision.operation == "create"
+
+
+async def test_async_versioned_save_refresh(TestVersionedThingy):
+    class TestRefreshedThingy(Refreshed, TestVersionedThingy):
+        pass
+
+    thingy = await TestRefreshedThingy(bar="baz").save(refresh=True)
+    assert thingy.refreshed is True
+    revisions = await thingy.get_revisions().to_list(length=10)
+    assert revisions[0].document == thingy.__dict__
+
+
 def test_versioned_versioned(TestVersionedThingy):
     thingy = TestVersionedThingy({"bar": "baz"})
     with pytest.deprecated_call():
@@ -204,3 +365,659 @@ async def test_async_versioned_revert(TestVersionedThingy):
     await thingy.revert()
     assert await thingy.count_revisions() == 3
     assert thingy.bar == "baz"
+
+
+def test_versioned_delta_revisions(TestDeltaThingy, TestRevision):
+    thingy = TestDeltaThingy(bar="baz", content="x" * 100).save()
+    documents = [get_document(thingy)]
+    for i in range(4):
+        thingy.bar = i
+        thingy.save()
+        documents.append(get_document(thingy))
+    del thingy.content
+    thingy.save(author="me")
+    documents.append(get_document(thingy))
+
+    stored = list(TestRevision.collection.find().sort("_id", 1))
+    assert ["document" in r for r in stored] == [True, False, False, True, False, False]
+    assert stored[1]["delta"] == {"set": {"bar": 0}}
+    assert stored[1]["depth"] == 1
+    assert stored[2]["snapshot_id"] == stored[0]["_id"]
+    assert stored[5]["delta"] == {"unset": ["content"]}
+    assert stored[5]["author"] == "me"
+
+    assert [r.document for r in thingy.get_revisions()] == documents
+    assert thingy.get_revisions()[2].document == documents[2]
+    assert thingy.get_revisions()[-1].document == documents[-1]
+    assert thingy.get_revisions().skip(4).first().document == documents[4]
+    revisions = thingy.get_revisions(operation="update")
+    assert [r.document for r in revisions.skip(1)] == documents[2:]
+    assert thingy.get_revisions().view().next()["document"] == documents[0]
+
+
+def test_versioned_delta_save_round_trips(TestDeltaThingy, TestRevision):
+    thingy = TestDeltaThingy(bar="baz").save()
+    for i in range(3):
+        thingy.bar = i
+        with query_budget(max_round_trips=2):
+            thingy.save()
+
+    stored = list(TestRevision.collection.find().sort("_id", 1))
+    assert ["document" in r for r in stored] == [True, False, False, True]
+    assert thingy.revision_chain == {"snapshot_id": stored[3]["_id"], "depth": 0}
+    assert "revision_chain" not in stored[3]["document"]
+
+
+def test_versioned_delta_revisions_create(TestDeltaThingy, TestRevision):
+    thingy = TestDeltaThingy(_id="foo", bar="baz").save()
+    thingy.delete()
+    thingy.save()
+    thingy.bar = "qux"
+    thingy.save(force_insert=False)
+
+    revisions = list(thingy.get_revisions())
+    assert [r.operation for r in revisions] == ["create", "delete", "create", "update"]
+    assert [r.depth for r in revisions] == [None, None, None, 1]
+    assert revisions[-1].document == {"_id": "foo", "bar": "qux"}
+
+    TestRevision.collection.delete_many({})
+    del thingy.revision_chain
+    thingy.save()
+    assert TestRevision.find_one().document == {"_id": "foo", "bar": "qux"}
+
+
+def test_versioned_delta_revisions_camelcase(TestDeltaThingy, TestRevision):
+    class Foo(CamelCaseStorage, TestDeltaThingy):
+        pass
+
+    thingy = Foo(first_name="John", last_name="Doe").save()
+    thingy.first_name = "Jonny"
+    thingy.save()
+
+    stored = list(TestRevision.collection.find().sort("_id", 1))
+    assert stored[1]["delta"] == {"set": {"first_name": "Jonny"}}
+    assert thingy.get_revisions()[-1].document == get_document(thingy)
+
+
+def test_versioned_delta_revert(TestDeltaThingy):
+    thingy = TestDeltaThingy(bar="baz").save()
+    thingy.bar = "qux"
+    thingy.save()
+    thingy.bar = "quux"
+    thingy.save()
+
+    thingy.revert()
+    assert thingy.bar == "qux"
+    assert thingy.get_revisions()[-1].document == get_document(thingy)
+
+
+async def test_async_versioned_delta_revisions(TestDeltaThingy, TestRevision):
+    thingy = await TestDeltaThingy(bar="baz", content="x" * 100).save()
+    documents = [get_document(thingy)]
+    for i in range(4):
+        thingy.bar = i
+        await thingy.save()
+        documents.append(get_document(thingy))
+
+    stored = await TestRevision.collection.find().sort("_id", 1).to_list(None)
+    assert ["document" in r for r in stored] == [True, False, False, True, False]
+
+    revisions = await thingy.get_revisions().to_list(None)
+    assert [r.document for r in revisions] == documents
+    assert [r.document async for r in thingy.get_revisions()] == documents
+    revision = await thingy.get_revisions().skip(2).first()
+    assert revision.document == documents[2]
+    assert await thingy.get_revisions().skip(9).first() is None
+
+    cursor = thingy.get_revisions().skip(1)
+    assert (await cursor.next()).document == documents[1]
+    assert (await cursor.next()).document == documents[2]
+
+
+def test_versioned_revision_counter(TestVersionedThingy, TestRevision):
+    class Foo(TestVersionedThingy):
+        _revision_counter = "revision_count"
+
+    thingy = Foo(bar="baz").save()
+    assert thingy.revision_count == 1
+    thingy.save()
+    thingy.delete()
+    assert [r.number for r in thingy.get_revisions()] == [1, 2, 3]
+    assert thingy.count_revisions() == 3
+    assert thingy.count_revisions(limit=1) == 1
+    assert thingy.is_versioned() is True
+
+    with query_budget(max_round_trips=1):
+        assert thingy.count_revisions() == 3
+    with query_budget(max_round_trips=2):
+        thingy.save()
+    assert thingy.get_revisions()[-1].number == 4
+
+    assert Foo().count_revisions() == 0
+    assert Foo().is_versioned() is False
+
+
+def test_versioned_revision_counter_enabled_later(TestVersionedThingy):
+    thingy = TestVersionedThingy(bar="baz").save()
+    thingy.save()
+
+    TestVersionedThingy._revision_counter = "revision_count"
+    assert thingy.count_revisions() == 2
+    thingy.save()
+    assert thingy.revision_count == 3
+    assert thingy.count_revisions() == 3
+
+
+def test_versioned_negative_index(TestVersionedThingy):
+    thingy = TestVersionedThingy(bar=0).save()
+    for i in range(1, 5):
+        thingy.bar = i
+        thingy.save()
+
+    with query_budget() as budget:
+        assert thingy.get_revisions()[-1].document["bar"] == 4
+        assert thingy.get_revisions()[-4].document["bar"] == 1
+    assert [e.operation for e in budget.events] == [
+        "cursor.__getitem__",
+        "cursor.__getitem__",
+    ]
+
+    thingy.revert()
+    assert thingy.bar == 3
+    assert thingy.count_revisions() == 6
+
+
+async def test_async_versioned_revision_counter(TestVersionedThingy):
+    class Foo(TestVersionedThingy):
+        _revision_counter = "revision_count"
+
+    thingy = await Foo(bar="baz").save()
+    await thingy.save()
+    await thingy.delete()
+    revisions = await thingy.get_revisions().to_list(None)
+    assert [r.number for r in revisions] == [1, 2, 3]
+    assert await thingy.count_revisions() == 3
+    assert await thingy.is_versioned() is True
+    assert await Foo().count_revisions() == 0
+
+    thingy = Foo(_id=thingy.id, bar="qux")
+    await thingy.save()
+    assert thingy.revision_count == 4
+
+    thingy.bar = "quux"
+    await thingy.save()
+    await thingy.revert()
+    assert thingy.bar == "qux"
+    assert thingy.revision_count == 6
+
+
+def test_versioned_history_as_of(TestVersionedThingy, TestRevision):
+    foo = TestVersionedThingy(_id="foo", bar=1).save()
+    baz = TestVersionedThingy(_id="baz", bar=1).save()
+    foo.bar = 2
+    foo.save()
+    baz.delete()
+    TestVersionedThingy(_id="qux", bar=1).save()
+    date_revisions(TestRevision)
+
+    ids = ["foo", "baz", "qux"]
+    history = TestVersionedThingy.history_as_of(ids, day(3, 12))
+    assert sorted((t.id, t.bar) for t in history) == [("baz", 1), ("foo", 2)]
+    assert isinstance(next(TestVersionedThingy.history_as_of(ids, day(3))), Versioned)
+
+    history = TestVersionedThingy.history_as_of(ids, day(4, 12), batch_size=1)
+    assert [(t.id, t.bar) for t in history] == [("foo", 2)]
+
+    when = datetime(2020, 1, 2, 13, tzinfo=timezone(timedelta(hours=1)))
+    history = TestVersionedThingy.history_as_of({"bar": 2}, when)
+    assert [(t.id, t.bar) for t in history] == [("foo", 1)]
+    assert list(TestVersionedThingy.history_as_of(["quux"], day(9))) == []
+
+
+def test_versioned_history_as_of_delta(TestDeltaThingy, TestRevision):
+    thingy = TestDeltaThingy(bar=0, content="x" * 100).save()
+    documents = [get_document(thingy)]
+    for i in range(1, 6):
+        thingy.bar = i
+        thingy.save()
+        documents.append(get_document(thingy))
+    date_revisions(TestRevision)
+
+    for i, document in enumerate(documents):
+        history = TestDeltaThingy.history_as_of([thingy.id], day(i + 1))
+        assert [t.__dict__ for t in history] == [document]
+
+
+def test_versioned_restore_as_of(TestVersionedThingy, TestRevision):
+    TestVersionedThingy._revision_counter = "revision_count"
+    foo = TestVersionedThingy(_id="foo", bar=1).save()
+    baz = TestVersionedThingy(_id="baz", bar=1).save()
+    foo.bar = 2
+    foo.save()
+    baz.delete()
+    TestVersionedThingy(_id="qux", bar=1).save()
+    date_revisions(TestRevision)
+
+    ids = ["foo", "baz", "qux", "quux"]
+    with query_budget(max_round_trips=4):
+        count = TestVersionedThingy.restore_as_of(ids, day(2, 12), author="me")
+    assert count == 2
+    assert TestVersionedThingy.collection.find_one("foo") == {"_id": "foo", "bar": 1}
+    assert TestVersionedThingy.find_one("baz").bar == 1
+    assert TestVersionedThingy.find_one("qux").bar == 1
+
+    foo = TestVersionedThingy.find_one("foo")
+    revision = foo.get_revisions()[-1]
+    assert (revision.operation, revision.author) == ("update", "me")
+    assert revision.document == {"_id": "foo", "bar": 1}
+    assert TestVersionedThingy.find_one("baz").get_revisions()[-1].operation == "create"
+    foo.save()
+    assert foo.revision_count == foo.count_revisions() == 4
+
+    assert TestVersionedThingy.restore_as_of(["baz"], day(4, 12)) == 1
+    assert TestVersionedThingy.find_one("baz") is None
+    assert TestVersionedThingy(_id="baz").get_revisions()[-1].operation == "delete"
+    assert TestVersionedThingy.restore_as_of(["quux"], day(9)) == 0
+
+
+async def test_async_versioned_history_as_of(TestVersionedThingy, TestRevision):
+    foo = await TestVersionedThingy(_id="foo", bar=1).save()
+    baz = await TestVersionedThingy(_id="baz", bar=1).save()
+    foo.bar = 2
+    await foo.save()
+    await baz.delete()
+    await async_date_revisions(TestRevision)
+
+    history = TestVersionedThingy.history_as_of(["foo", "baz"], day(3, 12))
+    assert sorted([(t.id, t.bar) async for t in history]) == [("baz", 1), ("foo", 2)]
+    history = TestVersionedThingy.history_as_of({"bar": 2}, day(2), batch_size=1)
+    assert [(t.id, t.bar) async for t in history] == [("foo", 1)]
+    history = TestVersionedThingy.history_as_of({}, day(4))
+    assert [(t.id, t.bar) async for t in history] == [("foo", 2)]
+
+    count = await TestVersionedThingy.restore_as_of(["foo", "baz", "qux"], day(2))
+    assert count == 2
+    assert (await TestVersionedThingy.find_one("foo")).bar == 1
+    assert (await TestVersionedThingy.find_one("baz")).bar == 1
+    assert await TestVersionedThingy.restore_as_of(["baz"], day(4)) == 1
+    assert await TestVersionedThingy.find_one("baz") is None
+    assert await TestVersionedThingy.restore_as_of(["qux"], day(4)) == 0
+
+
+async def test_async_versioned_history_as_of_command_cursor(
+    TestVersionedThingy, TestRevision
+):
+    revision = {"document_id": "foo", "operation": "create", "document": {"bar": 1}}
+
+    class Cursor:
+        async def to_list(self, length):
+            return [{"_id": "foo", "revision": revision}]
+
+    class Collection:
+        async def aggregate(self, pipeline):
+            return Cursor()
+
+    class Foo(TestVersionedThingy):
+        class _revision_cls(TestRevision):
+            _collection = Collection()
+
+    assert [t.bar async for t in Foo.history_as_of(["foo"], day(1))] == [1]
+
+
+async def test_async_versioned_history_as_of_delta(TestDeltaThingy, TestRevision):
+    thingy = await TestDeltaThingy(bar=0, content="x" * 100).save()
+    documents = [get_document(thingy)]
+    for i in range(1, 5):
+        thingy.bar = i
+        await thingy.save()
+        documents.append(get_document(thingy))
+    await async_date_revisions(TestRevision)
+
+    for i, document in enumerate(documents):
+        history = TestDeltaThingy.history_as_of([thingy.id], day(i + 1))
+        assert [t.__dict__ async for t in history] == [document]
+
+
+def test_get_kept():
+    revisions = [{"creation_date": day(i)} for i in range(1, 9)]
+    assert get_kept(revisions) == set(range(8))
+    assert get_kept(revisions, keep=2) == {6, 7}
+    assert get_kept(revisions, keep=20) == set(range(8))
+    assert get_kept(revisions, max_age=timedelta(days=2), now=day(7)) == {5, 6, 7}
+    assert get_kept(revisions, thinning="weekly") == {4, 7}
+    assert get_kept(revisions, keep=1, thinning="daily") == set(range(8))
+
+    revisions = [{"creation_date": day(1, hour)} for hour in range(3)]
+    assert get_kept(revisions, thinning="daily") == {2}
+    assert get_kept([{"_id": ObjectId()}], max_age=timedelta(days=1)) == {0}
+    with pytest.raises(ValueError):
+        get_kept(revisions, thinning="hourly")
+
+
+def test_versioned_compact_revisions(TestVersionedThingy, TestRevision):
+    class Archive(TestRevision):
+        _collection_name = "archive"
+
+    class Foo(TestVersionedThingy):
+        _keep_revisions = 2
+        _archive_revision_cls = Archive
+
+    Archive.collection.delete_many({})
+    for id in ("foo", "bar"):
+        thingy = Foo(_id=id, bar=0).save()
+        for i in range(1, 4):
+            thingy.bar = i
+            thingy.save()
+    TestVersionedThingy(_id="baz").save()
+
+    collector = metrics.enable()
+    try:
+        with query_budget(max_round_trips=5):
+            stats = Foo.compact_revisions(batch_size=3, pause=0.001)
+        counters = collector.snapshot()["Foo"]["counters"]
+    finally:
+        metrics.disable()
+    assert stats == {"documents": 2, "revisions": 8, "deleted": 4, "squashed": 0}
+    assert counters == {
+        "revision_compaction_scanned": 8,
+        "revision_compaction_deleted": 4,
+        "revision_compaction_squashed": 0,
+    }
+
+    revisions = Foo(_id="foo").get_revisions()
+    assert [r.document["bar"] for r in revisions] == [2, 3]
+    assert Archive.count_documents({"document_id": "foo"}) == 2
+    assert TestVersionedThingy(_id="baz").count_revisions() == 1
+    assert Foo.compact_revisions()["deleted"] == 0
+    Foo._keep_revisions = None
+    assert Foo.compact_revisions()["revisions"] == 4
+
+
+def test_versioned_compact_delta_revisions(TestDeltaThingy, TestRevision):
+    TestDeltaThingy._thin_revisions = "weekly"
+    thingy = TestDeltaThingy(bar=0, content="x" * 100).save()
+    documents = [get_document(thingy)]
+    for i in range(1, 8):
+        thingy.bar = i
+        thingy.save()
+        documents.append(get_document(thingy))
+    date_revisions(TestRevision)
+
+    stats = TestDeltaThingy.compact_revisions()
+    assert stats == {"documents": 1, "revisions": 8, "deleted": 6, "squashed": 2}
+    revisions = list(thingy.get_revisions())
+    assert [r.document for r in revisions] == [documents[4], documents[7]]
+    assert [r.depth for r in revisions] == [None, None]
+
+    thingy.bar = 8
+    thingy.save()
+    assert thingy.get_revisions()[-1].document == get_document(thingy)
+    assert thingy.get_revisions()[-1].depth == 2  # Squashed revisions still count
+
+
+async def test_async_versioned_compact_revisions(TestDeltaThingy, TestRevision):
+    class Archive(TestRevision):
+        _collection_name = "archive"
+
+    class Foo(TestDeltaThingy):
+        _keep_revisions_for = timedelta(days=2)
+        _archive_revision_cls = Archive
+
+    await Archive.collection.delete_many({})
+    for id in ("foo", "bar"):
+        thingy = await Foo(_id=id, bar=0).save()
+        for i in range(1, 4):
+            thingy.bar = i
+            await thingy.save()
+    await async_date_revisions(TestRevision)
+
+    stats = await Foo.compact_revisions(batch_size=2, pause=0.001, now=day(8))
+    assert stats == {"documents": 2, "revisions": 8, "deleted": 5, "squashed": 1}
+    assert await Archive.count_documents({}) == 5
+
+    revisions = await Foo(_id="foo").get_revisions().to_list(None)
+    assert [r.document["bar"] for r in revisions] == [3]
+    revisions = await Foo(_id="bar").get_revisions().to_list(None)
+    assert [(r.document["bar"], r.depth) for r in revisions] == [(2, None), (3, None)]
+    assert (await Foo.compact_revisions(now=day(8)))["deleted"] == 0
+    assert (await Foo.compact_revisions())["deleted"] == 1
+
+
+def test_versioned_durable(TestVersionedThingy, TestRevision):
+    thingy = TestVersionedThingy(bar="baz").save(durable=True)
+    thingy.delete(durable=True)
+    assert TestRevision.count_documents({}) == 2
+
+
+async def test_async_versioned_durable(TestVersionedThingy, TestRevision):
+    thingy = await TestVersionedThingy(bar="baz").save(durable=True)
+    await thingy.delete(durable=True)
+    assert await TestRevision.count_documents({}) == 2
+
+
+def test_versioned_deferred_revisions(TestDeferredThingy, TestRevision):
+    with query_budget(max_round_trips=1):
+        thingy = TestDeferredThingy(bar="baz").save()
+    thingy.bar = "qux"
+    thingy.save(author="me")
+    assert TestRevision.count_documents({}) == 0
+    assert thingy.count_revisions() == 2
+    revisions = list(thingy.get_revisions())
+    assert [r.operation for r in revisions] == ["create", "update"]
+    assert revisions[1].author == "me"
+
+    thingy.bar = "quux"
+    thingy.save()
+    with query_budget() as budget:
+        thingy.save(durable=True)
+    assert [e.operation for e in budget.events] == [
+        "save",
+        "write_behind.flush",
+        "save",
+    ]
+    assert TestRevision.count_documents({}) == 4
+    assert thingy.get_revisions()[-1].creation_date is not None
+
+    thingy.save()
+    thingy.revert()
+    assert thingy.bar == "quux"
+    thingy.delete(durable=True)
+    assert thingy.get_revisions()[-1].operation == "delete"
+    assert thingy.is_versioned() is True
+
+
+async def test_async_versioned_deferred_revisions(TestDeferredThingy, TestRevision):
+    thingy = await TestDeferredThingy(bar="baz").save()
+    thingy.bar = "qux"
+    await thingy.save(author="me")
+    assert await TestRevision.count_documents({}) == 0
+    assert await thingy.count_revisions() == 2
+    revisions = await thingy.get_revisions().to_list(None)
+    assert [r.operation for r in revisions] == ["create", "update"]
+
+    thingy.bar = "quux"
+    await thingy.save()
+    await thingy.save(durable=True)
+    assert await TestRevision.count_documents({}) == 4
+
+    await thingy.save()
+    await thingy.revert()
+    assert thingy.bar == "quux"
+    await thingy.delete(durable=True)
+    revisions = await thingy.get_revisions().to_list(None)
+    assert revisions[-1].operation == "delete"
+    await thingy.delete()
+    assert await thingy.is_versioned() is True
+
+
+def test_versioned_deferred_revisions_copy(TestDeferredThingy):
+    thingy = TestDeferredThingy(bar=0, baz={"qux": 0}).save()
+    thingy.bar = 1
+    thingy.save()
+    thingy.bar = 2
+    thingy.baz["qux"] = 2
+    TestDeferredThingy.get_revision_cls().flush()
+
+    revisions = list(thingy.get_revisions())
+    assert [r.document["bar"] for r in revisions] == [0, 1]
+    assert [r.document["baz"] for r in revisions] == [{"qux": 0}, {"qux": 0}]
+
+
+async def test_async_versioned_deferred_revisions_copy(TestDeferredThingy):
+    thingy = await TestDeferredThingy(bar=0).save()
+    thingy.bar = 1
+    await TestDeferredThingy.get_revision_cls().flush()
+    revisions = await thingy.get_revisions().to_list(None)
+    assert [r.document["bar"] for r in revisions] == [0]
+
+
+def test_versioned_deferred_delta_revisions(TestDeferredThingy, TestRevision):
+    class Foo(TestDeferredThingy):
+        _delta_revisions = True
+        _snapshot_interval = 3
+        _revision_counter = "revision_count"
+
+    thingy = Foo(bar=0).save()
+    documents = [get_document(thingy)]
+    for i in range(1, 4):
+        thingy.bar = i
+        thingy.save()
+        documents.append(get_document(thingy))
+    del thingy.revision_count
+    thingy.save()
+    documents.append(get_document(thingy))
+    Foo.get_revision_cls().flush()
+
+    stored = list(TestRevision.collection.find().sort("_id", 1))
+    assert ["delta" in r for r in stored] == [False, True, True, False, True]
+    revisions = list(thingy.get_revisions())
+    assert [r.number for r in revisions] == [1, 2, 3, 4, 5]
+    assert [r.document for r in revisions] == documents
+
+
+async def test_async_versioned_deferred_delta_revisions(
+    TestDeferredThingy, TestRevision
+):
+    class Foo(TestDeferredThingy):
+        _delta_revisions = True
+        _revision_counter = "revision_count"
+
+    thingy = await Foo(bar=0).save()
+    thingy.bar = 1
+    del thingy.revision_count
+    await thingy.save()
+    await Foo.get_revision_cls().flush()
+
+    stored = await TestRevision.collection.find().sort("_id", 1).to_list(None)
+    assert ["delta" in r for r in stored] == [False, True]
+    assert [r["number"] for r in stored] == [1, 2]
+
+
+def test_versioned_revision_partition(TestVersionedThingy, TestRevision):
+    class Foo(TestVersionedThingy):
+        _revision_partition = True
+
+    class Bar(TestVersionedThingy):
+        _revision_partition = "group"
+
+    FooRevision = Foo.get_revision_cls()
+    assert FooRevision is Foo.get_revision_cls()
+    assert issubclass(FooRevision, TestRevision)
+    assert FooRevision.collection.name == "revision_foo"
+    assert Bar.get_revision_cls().collection.name == "revision_group"
+    FooRevision.collection.delete_many({})
+    Bar.get_revision_cls().collection.delete_many({})
+
+    foo = Foo(bar="baz").save()
+    foo.bar = "qux"
+    foo.save()
+    Bar(bar="baz").save()
+    assert TestRevision.count_documents({}) == 0
+    assert foo.count_revisions() == 2
+    assert [r.document["bar"] for r in foo.get_revisions()] == ["baz", "qux"]
+    assert FooRevision.get_filter(foo) == {"document_id": foo.id}
+    assert Bar.get_revision_cls().count_documents({"document_type": "Bar"}) == 1
+
+    FooRevision.create_indexes()
+    assert "document_id_1__id_1" in FooRevision.collection.index_information()
+    Bar.get_revision_cls().create_indexes()
+    indexes = Bar.get_revision_cls().collection.index_information()
+    assert "document_id_1_document_type_1__id_1" in indexes
+
+
+def test_versioned_revision_partition_names(TestVersionedThingy, TestThingy):
+    class Foo(Versioned, TestThingy):
+        _revision_partition = True
+
+    assert Foo.get_revision_cls() is None
+
+    class Bar(TestVersionedThingy):
+        _revision_partition = True
+
+    with pytest.raises(ValueError):
+
+        class Baz(TestVersionedThingy):
+            _revision_partition = "bar"
+
+    class Qux(TestVersionedThingy):
+        _revision_partition = "qux"
+
+    with pytest.raises(ValueError):
+
+        class Qux(TestVersionedThingy):  # noqa: F811
+            _revision_partition = True
+
+
+def test_versioned_revision_partition_delta(TestDeltaThingy):
+    class Foo(TestDeltaThingy):
+        _revision_partition = True
+
+    Foo.get_revision_cls().collection.delete_many({})
+    thingy = Foo(bar=0).save()
+    documents = [get_document(thingy)]
+    for i in range(1, 5):
+        thingy.bar = i
+        thingy.save()
+        documents.append(get_document(thingy))
+    assert [r.document for r in thingy.get_revisions()] == documents
+    assert thingy.get_revisions()[2].document == documents[2]
+
+    history = Foo.history_as_of([thingy.id], datetime.utcnow())
+    assert [t.__dict__ for t in history] == [documents[-1]]
+
+
+def test_versioned_migrate_revisions(TestVersionedThingy, TestRevision):
+    class Foo(TestVersionedThingy):
+        pass
+
+    thingy = Foo(bar="baz").save()
+    thingy.save()
+    TestVersionedThingy(bar="baz").save()
+    assert Foo.migrate_revisions() == 0
+
+    Foo._revision_partition = "foo"
+    Foo.get_revision_cls().collection.delete_many({})
+    assert Foo.migrate_revisions(batch_size=1) == 2
+    assert Foo.migrate_revisions() == 0
+    assert TestRevision.count_documents({}) == 1
+    assert thingy.count_revisions() == 2
+
+
+async def test_async_versioned_revision_partition(TestVersionedThingy, TestRevision):
+    class Foo(TestVersionedThingy):
+        pass
+
+    thingy = await Foo(bar="baz").save()
+    await thingy.save()
+    await TestVersionedThingy(bar="baz").save()
+    assert await Foo.migrate_revisions() == 0
+
+    Foo._revision_partition = True
+    await Foo.get_revision_cls().collection.delete_many({})
+    assert await Foo.migrate_revisions(batch_size=1) == 2
+    assert await TestRevision.count_documents({}) == 1
+    assert await thingy.count_revisions() == 2
+    thingy.bar = "qux"
+    await thingy.save()
+    revisions = await thingy.get_revisions().to_list(None)
+    assert [r.document["bar"] for r in revisions] == ["baz", "baz", "qux"]
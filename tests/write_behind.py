@@ -0,0 +1,322 @@
+import asyncio
+import time
+
+import pytest
+from pymongo import WriteConcern
+
+from mongo_thingy import metrics, write_behind
+from mongo_thingy.write_behind import (
+    AsyncWriteBehind,
+    AsyncWriteQueue,
+    BaseWriteQueue,
+    WriteBehind,
+    WriteQueue,
+)
+
+
+@pytest.fixture
+def collector():
+    collector = metrics.enable()
+    yield collector
+    metrics.disable()
+
+
+@pytest.fixture(autouse=True)
+async def close():
+    yield
+    closing = write_behind.close()
+    if closing is not None:
+        await closing
+
+
+@pytest.fixture
+def write_behind_cls(is_async):
+    if is_async:
+        return AsyncWriteBehind
+    return WriteBehind
+
+
+@pytest.fixture
+def TestWriteBehind(write_behind_cls, TestThingy):
+    class TestWriteBehind(write_behind_cls, TestThingy):
+        _flush_interval = 60
+
+    return TestWriteBehind
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+async def async_wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not await predicate():
+        assert time.monotonic() < deadline
+        await asyncio.sleep(0.01)
+
+
+def get_counters(collector):
+    return collector.snapshot()["TestWriteBehind"].get("counters", {})
+
+
+def fail(*args, **kwargs):
+    raise RuntimeError("nope")
+
+
+def test_write_behind(TestWriteBehind, collection, collector):
+    thingy = TestWriteBehind(bar="baz").save()
+    assert thingy.id is not None
+    thingy.bar = "qux"
+    thingy.save()
+    TestWriteBehind(bar="quux").save()
+
+    queue = TestWriteBehind.get_write_queue()
+    assert isinstance(queue, WriteQueue)
+    assert queue.size == 2
+    assert collection.count_documents({}) == 0
+    snapshot = collector.snapshot()["TestWriteBehind"]
+    assert snapshot["gauges"]["write_behind_queue_depth"] == 2
+
+    TestWriteBehind.flush()
+    assert queue.size == 0
+    assert collection.count_documents({}) == 2
+    assert collection.find_one(thingy.id)["bar"] == "qux"
+
+    snapshot = collector.snapshot()["TestWriteBehind"]
+    assert snapshot["gauges"]["write_behind_queue_depth"] == 0
+    assert snapshot["counters"] == {"write_behind_writes": 2}
+    assert snapshot["operations"]["write_behind.flush"]["calls"] == 1
+
+
+def test_write_behind_batches(TestWriteBehind, collection):
+    TestWriteBehind._batch_size = 2
+    TestWriteBehind(bar="baz").save()
+    TestWriteBehind(bar="qux").save()
+    TestWriteBehind(bar="quux").save()
+    wait_for(lambda: collection.count_documents({}) == 2)
+
+    class Eager(TestWriteBehind):
+        _flush_interval = 0.01
+
+    Eager(bar="baz").save()
+    wait_for(lambda: collection.count_documents({}) == 3)
+
+
+def test_write_behind_collections(TestWriteBehind, database, collection):
+    class Other(TestWriteBehind):
+        pass
+
+    Other._collection = database.other
+    database.other.delete_many({})
+    Other(bar="baz").save()
+    Other._collection = collection
+    Other(bar="qux").save()
+
+    queue = Other.get_write_queue()
+    assert len(queue.take(1)) == 1
+    assert queue.size == 1
+    Other.flush()
+    assert database.other.count_documents({}) == 0
+    assert collection.count_documents({}) == 1
+
+
+def test_write_behind_backpressure(TestWriteBehind, collection, collector):
+    TestWriteBehind._queue_size = 1
+    TestWriteBehind._queue_timeout = 0
+    thingy = TestWriteBehind(bar="baz").save()
+    thingy.save()
+    TestWriteBehind(bar="qux").save()
+
+    assert get_counters(collector) == {"write_behind_dropped_writes": 1}
+    TestWriteBehind.flush()
+    assert collection.count_documents({}) == 1
+
+    class Eager(TestWriteBehind):
+        _queue_timeout = 5
+        _flush_interval = 0.01
+
+    Eager(bar="baz").save()
+    Eager(bar="qux").save()
+    wait_for(lambda: collection.count_documents({}) == 3)
+
+
+def test_write_behind_write_concern(TestWriteBehind, collection):
+    TestWriteBehind._write_concern = WriteConcern(w=0)
+    TestWriteBehind(bar="baz").save()
+
+    queue = TestWriteBehind.get_write_queue()
+    documents = queue.pending[collection.full_name][1].values()
+    _collection, requests = queue.get_requests(collection, list(documents))
+    assert _collection.write_concern.document == {"w": 0}
+    assert len(requests) == 1
+
+
+def test_write_behind_errors(TestWriteBehind, collection, collector, monkeypatch):
+    monkeypatch.setattr(BaseWriteQueue, "get_requests", fail)
+    TestWriteBehind(bar="baz").save()
+    with pytest.raises(RuntimeError):
+        TestWriteBehind.flush()
+
+    assert get_counters(collector) == {
+        "write_behind_errors": 1,
+        "write_behind_dropped_writes": 1,
+    }
+
+    TestWriteBehind._batch_size = 1
+    TestWriteBehind(bar="qux").save()
+    wait_for(lambda: get_counters(collector)["write_behind_errors"] == 2)
+
+    monkeypatch.undo()
+    TestWriteBehind(bar="quux").save()
+    wait_for(lambda: collection.count_documents({}) == 1)
+
+
+def test_write_behind_flush_close(TestWriteBehind, collection):
+    TestWriteBehind(bar="baz").save()
+    queue = TestWriteBehind.get_write_queue()
+    assert write_behind.flush() is None
+    assert collection.count_documents({}) == 1
+
+    TestWriteBehind(bar="qux").save()
+    assert write_behind.close() is None
+    assert collection.count_documents({}) == 2
+    assert not queue.thread.is_alive()
+    assert TestWriteBehind.get_write_queue() is not queue
+
+    queue.put(collection, {"_id": 1})
+    assert queue.size == 0
+    assert collection.count_documents({}) == 3
+
+
+def test_write_behind_write_through(TestWriteBehind, collection):
+    TestWriteBehind(bar="baz").save()
+    thingy = TestWriteBehind(bar="qux").save(force_insert=True)
+    assert TestWriteBehind.get_write_queue().size == 0
+    assert collection.find_one({"_id": thingy.id})["bar"] == "qux"
+    assert collection.count_documents({}) == 2
+
+
+def test_write_behind_at_exit(TestWriteBehind, collection, monkeypatch):
+    TestWriteBehind(bar="baz").save()
+    write_behind._close_at_exit()
+    assert collection.count_documents({}) == 1
+
+    monkeypatch.setattr(BaseWriteQueue, "get_requests", fail)
+    with pytest.raises(RuntimeError):
+        TestWriteBehind(bar="qux").save()  # Closed queues write through
+
+    write_behind._queues.clear()
+    TestWriteBehind(bar="qux").save()
+    write_behind._close_at_exit()
+
+
+def test_write_behind_after_fork(TestWriteBehind, collection):
+    TestWriteBehind(bar="baz").save()
+    queue = TestWriteBehind.get_write_queue()
+    write_behind._forget_queues()
+    assert write_behind._queues == {}
+    assert TestWriteBehind.get_write_queue() is not queue
+    queue.close()
+
+
+async def test_async_write_behind(TestWriteBehind, collection, collector):
+    thingy = await TestWriteBehind(bar="baz").save()
+    assert thingy.id is not None
+    thingy.bar = "qux"
+    await thingy.save()
+    await TestWriteBehind(bar="quux").save()
+
+    queue = TestWriteBehind.get_write_queue()
+    assert isinstance(queue, AsyncWriteQueue)
+    assert queue.size == 2
+    assert await collection.count_documents({}) == 0
+
+    await TestWriteBehind.flush()
+    assert await collection.count_documents({}) == 2
+    assert (await collection.find_one(thingy.id))["bar"] == "qux"
+    snapshot = collector.snapshot()["TestWriteBehind"]
+    assert snapshot["counters"] == {"write_behind_writes": 2}
+
+
+async def test_async_write_behind_batches(TestWriteBehind, collection):
+    async def count(expected):
+        return await collection.count_documents({}) == expected
+
+    TestWriteBehind._batch_size = 2
+    await TestWriteBehind(bar="baz").save()
+    await TestWriteBehind(bar="qux").save()
+    await TestWriteBehind(bar="quux").save()
+    await async_wait_for(lambda: count(2))
+
+    class Eager(TestWriteBehind):
+        _flush_interval = 0.01
+
+    await Eager(bar="baz").save()
+    await async_wait_for(lambda: count(3))
+
+
+async def test_async_write_behind_backpressure(TestWriteBehind, collection, collector):
+    async def count(expected):
+        return await collection.count_documents({}) == expected
+
+    TestWriteBehind._queue_size = 1
+    TestWriteBehind._queue_timeout = 0.01
+    thingy = await TestWriteBehind(bar="baz").save()
+    await thingy.save()
+    await TestWriteBehind(bar="qux").save()
+
+    assert get_counters(collector) == {"write_behind_dropped_writes": 1}
+    await TestWriteBehind.flush()
+    assert await count(1)
+
+    class Eager(TestWriteBehind):
+        _queue_timeout = 5
+        _flush_interval = 0.01
+
+    await Eager(bar="baz").save()
+    await Eager(bar="qux").save()
+    await async_wait_for(lambda: count(3))
+
+
+async def test_async_write_behind_errors(
+    TestWriteBehind, collection, collector, monkeypatch
+):
+    async def errors(expected):
+        return get_counters(collector)["write_behind_errors"] == expected
+
+    monkeypatch.setattr(BaseWriteQueue, "get_requests", fail)
+    await TestWriteBehind(bar="baz").save()
+    with pytest.raises(RuntimeError):
+        await TestWriteBehind.flush()
+    assert await errors(1)
+
+    TestWriteBehind._batch_size = 1
+    await TestWriteBehind(bar="qux").save()
+    await async_wait_for(lambda: errors(2))
+
+
+async def test_async_write_behind_flush_close(TestWriteBehind, collection):
+    await TestWriteBehind(bar="baz").save()
+    queue = TestWriteBehind.get_write_queue()
+    await write_behind.flush()
+    assert await collection.count_documents({}) == 1
+
+    await TestWriteBehind(bar="qux").save()
+    await write_behind.close()
+    assert await collection.count_documents({}) == 2
+    assert queue.task.done()
+
+    await queue.put(collection, {"_id": 1})
+    assert queue.size == 0
+    assert await collection.count_documents({}) == 3
+
+
+async def test_async_write_behind_write_through(TestWriteBehind, collection):
+    await TestWriteBehind(bar="baz").save()
+    thingy = await TestWriteBehind(bar="qux").save(force_insert=True)
+    assert TestWriteBehind.get_write_queue().size == 0
+    assert (await collection.find_one({"_id": thingy.id}))["bar"] == "qux"
+    assert await collection.count_documents({}) == 2